@@ -13,8 +13,9 @@ from typing import Dict, List, Any
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from config.settings import VOXEN_CONFIG
+from config.settings import VOXEN_CONFIG, WARMUP_CONFIG
 from models.voxen_model import VoxenModel
+from models.warmup import start_warmup
 from models.chat_model import ChatModel
 from utils.math_utils import VoxenMathProcessor
 from utils.visualization import VoxenVisualizer
@@ -50,12 +51,16 @@ def initialize_session_state():
     
     if 'current_topic' not in st.session_state:
         st.session_state.current_topic = "general"
+    
+    if 'warmup' not in st.session_state:
+        st.session_state.warmup = None
 
 def load_models():
     """Load and initialize AI models"""
     try:
         with st.spinner("Loading Voxen2.0 AI models..."):
-            # Initialize Voxen model
+            # Initialize Voxen model (a per-session handle; weights are
+            # loaded once per process through the shared model registry)
             if st.session_state.voxen_model is None:
                 st.session_state.voxen_model = VoxenModel()
             
@@ -72,8 +77,13 @@ def load_models():
             
             if st.session_state.text_processor is None:
                 st.session_state.text_processor = VoxenTextProcessor()
+            
+            # Load and warm up the shared weights in the background; the chat
+            # interface reports "warming up" until this is ready
+            if WARMUP_CONFIG["enabled"] and st.session_state.warmup is None:
+                voxen_model = st.session_state.voxen_model
+                st.session_state.warmup = start_warmup(voxen_model.model_name, voxen_model.dtype)
         
-        st.success("Models loaded successfully!")
         return True
         
     except Exception as e:
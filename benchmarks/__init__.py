@@ -0,0 +1,5 @@
+"""
+Benchmarks for the Voxen2.0 generation hot path
+
+Run from the project root, e.g. ``python -m benchmarks.quantization``.
+"""
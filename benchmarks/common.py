@@ -0,0 +1,150 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+
+import json
+import os
+import resource
+import sys
+import time
+from typing import Any, Dict, List
+
+import torch
+
+from config.settings import PATHS
+from models.generation import SessionCache, decode
+
+
+def load_sample_prompts(limit: int = None) -> List[str]:
+    """Load the benchmark prompts from data/sample_questions.json"""
+    with open(os.path.join(PATHS["data_dir"], "sample_questions.json")) as f:
+        categories = json.load(f)
+    prompts = [question for questions in categories.values() for question in questions]
+    return prompts[:limit] if limit else prompts
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def greedy_generate(shared_model, prompt: str, max_new_tokens: int) -> Dict[str, Any]:
+    """
+    Greedily generate a fixed number of tokens and time the run
+
+    Args:
+        shared_model: Shared model to generate with
+        prompt: Prompt text
+        max_new_tokens: Number of tokens to generate (fewer if EOS comes first)
+
+    Returns:
+        Dictionary with the generated ids, time to first token and total time
+    """
+    tokenizer = shared_model.tokenizer
+    input_ids = tokenizer.encode(f"User: {prompt}\nAssistant:")
+    cache = SessionCache(max_tokens=len(input_ids) + max_new_tokens)
+    params = {"do_sample": False, "temperature": 1.0, "top_p": 1.0, "repetition_penalty": 1.0}
+
+    token_ids = []
+    started = time.perf_counter()
+    first_token_at = None
+    for token_id in decode(shared_model.model, input_ids, cache, max_new_tokens,
+                           eos_token_id=tokenizer.eos_token_id, device=shared_model.device,
+                           params=params):
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        token_ids.append(token_id)
+    finished = time.perf_counter()
+
+    return {
+        "token_ids": token_ids,
+        "ttft_seconds": (first_token_at or finished) - started,
+        "total_seconds": finished - started,
+    }
+
+
+class ByteTokenizer:
+    """
+    Minimal byte-level tokenizer for offline runs without a cached GPT-2 tokenizer
+
+    Token ids 0-255 are UTF-8 bytes; 256 is the end-of-text token.
+    """
+
+    eos_token = "<|endoftext|>"
+    eos_token_id = 256
+    vocab_size = 257
+
+    def __init__(self):
+        self.pad_token = self.eos_token
+        self.pad_token_id = self.eos_token_id
+
+    def encode(self, text: str) -> List[int]:
+        return list(text.encode("utf-8"))
+
+    def decode(self, token_ids: List[int], skip_special_tokens: bool = False) -> str:
+        data = bytes(token_id for token_id in token_ids if token_id < 256)
+        text = data.decode("utf-8", errors="replace")
+        if not skip_special_tokens:
+            text += self.eos_token * sum(token_id == self.eos_token_id for token_id in token_ids)
+        return text
+
+
+def load_tokenizer(model_name: str = "gpt2"):
+    """Cached Hugging Face tokenizer, or ByteTokenizer when none is available offline"""
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        return tokenizer
+    except Exception:
+        return ByteTokenizer()
+
+
+def build_tiny_gpt2(tokenizer, seed: int = 0, layers: int = 2, hidden_size: int = 64, heads: int = 2):
+    """
+    Randomly initialized GPT-2 small enough to benchmark the code path offline
+
+    Args:
+        tokenizer: Tokenizer whose vocabulary the model covers
+        seed: Seed for the random weights
+        layers: Number of transformer blocks
+        hidden_size: Embedding size
+        heads: Attention heads per block
+
+    Returns:
+        The model in eval mode
+    """
+    from transformers import GPT2Config, GPT2LMHeadModel
+
+    set_seed(seed)
+    vocab_size = getattr(tokenizer, "vocab_size", None) or len(tokenizer)
+    config = GPT2Config(
+        vocab_size=max(vocab_size, tokenizer.eos_token_id + 1),
+        n_positions=1024,
+        n_embd=hidden_size,
+        n_layer=layers,
+        n_head=heads,
+        bos_token_id=tokenizer.eos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+    )
+    return GPT2LMHeadModel(config).eval()
+
+
+def set_seed(seed: int):
+    """Seed torch for reproducible runs"""
+    torch.manual_seed(seed)
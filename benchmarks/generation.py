@@ -0,0 +1,285 @@
+"""
+Benchmark the VoxenModel generation hot path
+
+Sessions answer the prompts from data/sample_questions.json through
+``VoxenModel.stream_response`` (the path behind ``generate_response``) or
+``process_query``. Every combination of batch size (concurrent sessions
+sharing the model through continuous batching), history length, dtype and
+torch thread count is measured, and the report gives time to first token,
+tokens/sec, p50/p95/p99 request latency and memory as JSON that can be
+diffed between releases. Each dtype runs in its own subprocess so its peak
+RSS is not inflated by the dtypes measured before it; within a dtype every
+case also reports how much resident memory it added.
+
+By default the model is a tiny randomly initialized GPT-2 and the tokenizer
+is the locally cached GPT-2 one (or a byte-level fallback), so the suite runs
+offline. Pass ``--model gpt2`` to benchmark a locally cached checkpoint.
+
+Usage:
+    python -m benchmarks.generation [--batch-sizes 1 4] [--history 0 8] [--dtypes float32 int8]
+                                    [--threads 1 4] [--output benchmark_generation.json]
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+import torch
+
+from benchmarks.common import (
+    build_tiny_gpt2, current_rss_mb, load_sample_prompts, load_tokenizer, peak_rss_mb, set_seed
+)
+from config.settings import ADMISSION_CONFIG, BATCHING_CONFIG, CACHE_CONFIG, MODEL_CONFIG
+from models.history import TokenBudgetHistory
+from models.model_registry import get_model_registry
+from models.precision import resolve_dtype
+from models.quantization import quantize_dynamic_int8
+from models.stopping import StoppingCriteria
+from models.voxen_model import VoxenModel
+
+TINY_MODEL = "tiny-random-gpt2"
+
+# Filler exchange used to pre-fill conversation history
+HISTORY_TURN = ("Can you tell me more about that?", "Sure, here is some more detail on the topic.")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def prepare_model(model_name: str, dtype: str, seed: int) -> str:
+    """
+    Make a model available in the registry for a dtype
+
+    The tiny random model is built in memory and registered; other names are
+    loaded from the local Hugging Face cache only.
+
+    Returns:
+        Registry name to create sessions with
+    """
+    registry = get_model_registry()
+    if registry.is_loaded(model_name, dtype):
+        return model_name
+
+    if model_name != TINY_MODEL:
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        registry.get(model_name, dtype)
+        return model_name
+
+    tokenizer = load_tokenizer()
+    model = build_tiny_gpt2(tokenizer, seed=seed)
+    if dtype == "int8":
+        model = quantize_dynamic_int8(model)
+    elif dtype != "float32":
+        model = model.to(getattr(torch, dtype))
+    registry.register(model_name, dtype, model, tokenizer)
+    return model_name
+
+
+def reset_history(session: VoxenModel, history_turns: int):
+    """Give a session a fresh history of ``history_turns`` filler exchanges"""
+    session.history = TokenBudgetHistory()
+    for user_text, reply in itertools.repeat(HISTORY_TURN, history_turns):
+        session.history.add_user(user_text)
+        session.history.add_assistant(reply)
+
+
+def run_request(session: VoxenModel, prompt: str, max_new_tokens: int, entry: str) -> Dict[str, float]:
+    """Answer one prompt and time it"""
+    started = time.perf_counter()
+    if entry == "process_query":
+        text = session.process_query(prompt).get("response", "")
+        first_token_at = None
+    else:
+        # No stop sequences: every request generates its full token budget
+        pieces, first_token_at = [], None
+        for piece in session.stream_response(prompt, max_new_tokens, stopping=StoppingCriteria()):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            pieces.append(piece)
+        text = "".join(pieces)
+    finished = time.perf_counter()
+
+    return {
+        "latency": finished - started,
+        "ttft": (first_token_at - started) if first_token_at is not None else None,
+        "tokens": len(session.tokenizer.encode(text)) if text else 0,
+    }
+
+
+def run_case(model_name: str, dtype: str, batch_size: int, history_turns: int, threads: int,
+             prompts: List[str], max_new_tokens: int, entry: str) -> Dict[str, Any]:
+    """Measure one combination of settings"""
+    torch.set_num_threads(threads)
+    BATCHING_CONFIG["enabled"] = batch_size > 1
+    BATCHING_CONFIG["mode"] = "continuous"
+    BATCHING_CONFIG["max_batch_size"] = batch_size
+    MODEL_CONFIG["max_new_tokens"] = max_new_tokens
+    rss_before = current_rss_mb()
+
+    sessions = [VoxenModel(model_name, dtype=dtype) for _ in range(batch_size)]
+    for session in sessions:
+        session.load_model()
+
+    # The engine is cached on the shared model; rebuild it so it gets this case's slot count
+    shared = sessions[0].shared_model
+    if shared.generation_engine is not None:
+        shared.generation_engine.stop()
+        shared.generation_engine = None
+
+    # Warm up kernels for this thread count and shapes on a session that is not measured
+    warmup = VoxenModel(model_name, dtype=dtype)
+    warmup.load_model()
+    reset_history(warmup, history_turns)
+    run_request(warmup, prompts[0], 4, entry)
+
+    results: List[Dict[str, float]] = []
+    results_lock = threading.Lock()
+
+    def worker(index: int):
+        session = sessions[index]
+        for prompt in prompts[index::batch_size]:
+            # Each request would otherwise add an exchange; measure at the configured history length
+            reset_history(session, history_turns)
+            result = run_request(session, prompt, max_new_tokens, entry)
+            with results_lock:
+                results.append(result)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(batch_size)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    wall_seconds = time.perf_counter() - started
+
+    latencies = [result["latency"] for result in results]
+    ttfts = [result["ttft"] for result in results if result["ttft"] is not None]
+    tokens = sum(result["tokens"] for result in results)
+    return {
+        "dtype": dtype,
+        "batch_size": batch_size,
+        "history_turns": history_turns,
+        "threads": threads,
+        "requests": len(results),
+        "tokens": tokens,
+        "tokens_per_second": tokens / wall_seconds if wall_seconds else 0.0,
+        "ttft_ms": {
+            "mean": sum(ttfts) / len(ttfts) * 1000 if ttfts else None,
+            "p50": percentile(ttfts, 50) * 1000 if ttfts else None,
+        },
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+        },
+        "rss_mb": current_rss_mb(),
+        "rss_delta_mb": current_rss_mb() - rss_before,
+        # High-water mark of this dtype's subprocess, so far
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_worker(args: argparse.Namespace, dtype: str) -> List[Dict[str, Any]]:
+    """Run every case for one dtype in this process"""
+    # Measure generation itself: no cached replies and no load shedding
+    CACHE_CONFIG["enabled"] = False
+    ADMISSION_CONFIG["enabled"] = False
+    MODEL_CONFIG["do_sample"] = False
+
+    set_seed(args.seed)
+    prompts = load_sample_prompts(args.prompts)
+    model_name = prepare_model(args.model, dtype, args.seed)
+
+    results = []
+    for threads, batch_size, history_turns in itertools.product(
+            sorted(set(args.threads)), args.batch_sizes, args.history):
+        result = run_case(model_name, dtype, batch_size, history_turns, threads,
+                          prompts, args.tokens, args.entry)
+        results.append(result)
+        # stdout carries the JSON results; progress goes to stderr
+        print(
+            f"{dtype:>8} threads={threads:<3} batch={batch_size:<3} history={history_turns:<3} "
+            f"{result['tokens_per_second']:8.1f} tok/s  p50 {result['latency_ms']['p50']:8.1f} ms  "
+            f"p99 {result['latency_ms']['p99']:8.1f} ms",
+            file=sys.stderr,
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VoxenModel generation")
+    parser.add_argument("--model", default=TINY_MODEL,
+                        help=f"Registry model name; {TINY_MODEL} (default) needs no download")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4],
+                        help="Concurrent sessions sharing the model")
+    parser.add_argument("--history", type=int, nargs="+", default=[0, 8],
+                        help="Conversation turns already in each session's history")
+    parser.add_argument("--dtypes", nargs="+", default=["float32", "int8"])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, torch.get_num_threads()])
+    parser.add_argument("--prompts", type=int, default=16, help="Number of sample prompts per case")
+    parser.add_argument("--tokens", type=int, default=32, help="Tokens to generate per request")
+    parser.add_argument("--entry", choices=["generate_response", "process_query"], default="generate_response",
+                        help="Entry point to drive (process_query stops at stop sequences and reports no TTFT)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_generation.json", help="Path of the JSON report")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args, args.worker)))
+        return
+
+    results, skipped = [], []
+    for dtype in args.dtypes:
+        resolved = resolve_dtype(dtype)
+        if resolved != dtype and dtype != "auto":
+            # The registry would load the fallback dtype; do not report it under this label
+            print(f"Skipping {dtype}: not supported on this host (would run as {resolved})", file=sys.stderr)
+            skipped.append(dtype)
+            continue
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.generation", "--worker", resolved,
+             "--model", args.model, "--batch-sizes", *map(str, args.batch_sizes),
+             "--history", *map(str, args.history), "--threads", *map(str, args.threads),
+             "--prompts", str(args.prompts), "--tokens", str(args.tokens),
+             "--entry", args.entry, "--seed", str(args.seed)],
+            check=True, stdout=subprocess.PIPE, text=True,
+        )
+        results.extend(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "model": args.model,
+        "entry": args.entry,
+        "prompts": len(load_sample_prompts(args.prompts)),
+        "max_new_tokens": args.tokens,
+        "seed": args.seed,
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+        "skipped_dtypes": skipped,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Compare float32 and dynamic int8 inference
+
+Each dtype runs in its own subprocess so resident memory is measured in
+isolation. The script reports memory and tokens/sec for both modes and a
+quality smoke check: greedy outputs of the int8 model are compared with
+float32 for a fixed seed, and the exit code is non-zero when agreement
+falls below ``--min-agreement``.
+
+Usage:
+    python -m benchmarks.quantization [--model gpt2] [--prompts 8] [--tokens 32]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.common import current_rss_mb, greedy_generate, load_sample_prompts, peak_rss_mb, set_seed
+
+
+def run_worker(model_name: str, dtype: str, prompts: List[str], max_new_tokens: int, seed: int) -> Dict[str, Any]:
+    """Load one dtype and generate greedily for every prompt"""
+    from models.model_registry import get_model_registry
+
+    set_seed(seed)
+    rss_before = current_rss_mb()
+    load_started = time.perf_counter()
+    shared = get_model_registry().get(model_name, dtype)
+    load_seconds = time.perf_counter() - load_started
+    rss_loaded = current_rss_mb()
+
+    # Warm up kernels so the first prompt is not penalized
+    greedy_generate(shared, prompts[0], 4)
+
+    outputs, tokens, seconds = [], 0, 0.0
+    for prompt in prompts:
+        result = greedy_generate(shared, prompt, max_new_tokens)
+        outputs.append(result["token_ids"])
+        tokens += len(result["token_ids"])
+        seconds += result["total_seconds"]
+
+    return {
+        "dtype": dtype,
+        "load_seconds": load_seconds,
+        "model_rss_mb": rss_loaded - rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+        "tokens": tokens,
+        "tokens_per_second": tokens / seconds if seconds else 0.0,
+        "outputs": outputs,
+    }
+
+
+def compare_outputs(reference: List[List[int]], candidate: List[List[int]]) -> Dict[str, float]:
+    """Exact-match rate and mean shared-prefix ratio of two sets of generations"""
+    exact, prefix_ratios, first_token = 0, [], 0
+    for ref, cand in zip(reference, candidate):
+        exact += ref == cand
+        first_token += bool(ref and cand and ref[0] == cand[0])
+        shared = 0
+        for a, b in zip(ref, cand):
+            if a != b:
+                break
+            shared += 1
+        prefix_ratios.append(shared / max(len(ref), 1))
+    count = max(len(reference), 1)
+    return {
+        "exact_match_rate": exact / count,
+        "first_token_agreement": first_token / count,
+        "mean_prefix_agreement": sum(prefix_ratios) / count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark float32 vs dynamic int8 inference")
+    parser.add_argument("--model", default="gpt2")
+    parser.add_argument("--prompts", type=int, default=8, help="Number of sample prompts to use")
+    parser.add_argument("--tokens", type=int, default=32, help="Tokens to generate per prompt")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-agreement", type=float, default=0.5,
+                        help="Minimum first-token agreement with float32 for the smoke check to pass")
+    parser.add_argument("--output", help="Optional path for the JSON report")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    prompts = load_sample_prompts(args.prompts)
+
+    if args.worker:
+        print(json.dumps(run_worker(args.model, args.worker, prompts, args.tokens, args.seed)))
+        return
+
+    results = {}
+    for dtype in ("float32", "int8"):
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.quantization", "--worker", dtype,
+             "--model", args.model, "--prompts", str(args.prompts),
+             "--tokens", str(args.tokens), "--seed", str(args.seed)],
+            check=True, capture_output=True, text=True,
+        )
+        results[dtype] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    quality = compare_outputs(results["float32"]["outputs"], results["int8"]["outputs"])
+    report = {
+        "model": args.model,
+        "prompts": len(prompts),
+        "max_new_tokens": args.tokens,
+        "seed": args.seed,
+        "modes": {dtype: {k: v for k, v in result.items() if k != "outputs"} for dtype, result in results.items()},
+        "quality": quality,
+        "speedup": (
+            results["int8"]["tokens_per_second"] / results["float32"]["tokens_per_second"]
+            if results["float32"]["tokens_per_second"] else 0.0
+        ),
+        "smoke_check_passed": quality["first_token_agreement"] >= args.min_agreement,
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if not report["smoke_check_passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Measure speculative decoding against plain greedy decoding
+
+Both paths generate greedily from the same prompts. The report gives the
+draft acceptance rate, tokens/sec and speedup for each number of draft
+tokens, plus how often the outputs match plain decoding exactly (they
+should always match; the exit code is non-zero when the match rate falls
+below ``--min-match``).
+
+Usage:
+    python -m benchmarks.speculative [--model gpt2] [--draft distilgpt2] [--draft-tokens 2 4 6]
+"""
+
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.common import greedy_generate, load_sample_prompts, set_seed
+from models.generation import SessionCache, speculative_decode
+
+
+def speculative_generate(shared_model, draft_model, prompt: str, max_new_tokens: int,
+                         num_draft_tokens: int) -> Dict[str, Any]:
+    """
+    Generate with speculative decoding and time the run
+
+    Args:
+        shared_model: Shared main model
+        draft_model: Shared draft model
+        prompt: Prompt text
+        max_new_tokens: Number of tokens to generate (fewer if EOS comes first)
+        num_draft_tokens: Tokens proposed per verification pass
+
+    Returns:
+        Dictionary with the generated ids, total time and draft counters
+    """
+    tokenizer = shared_model.tokenizer
+    input_ids = tokenizer.encode(f"User: {prompt}\nAssistant:")
+    max_tokens = len(input_ids) + max_new_tokens + num_draft_tokens
+    params = {"do_sample": False, "temperature": 1.0, "top_p": 1.0, "repetition_penalty": 1.0}
+    stats: Dict[str, int] = {}
+
+    started = time.perf_counter()
+    token_ids = list(speculative_decode(
+        shared_model.model, draft_model.model, input_ids,
+        SessionCache(max_tokens), SessionCache(max_tokens), max_new_tokens,
+        eos_token_id=tokenizer.eos_token_id, device=shared_model.device,
+        params=params, num_draft_tokens=num_draft_tokens, stats=stats,
+    ))
+    return {"token_ids": token_ids, "total_seconds": time.perf_counter() - started, **stats}
+
+
+def run(model_name: str, draft_name: str, prompts: List[str], max_new_tokens: int,
+        draft_tokens: List[int]) -> Dict[str, Any]:
+    """Benchmark plain greedy decoding and every draft length on the same prompts"""
+    from models.model_registry import get_model_registry
+
+    registry = get_model_registry()
+    shared = registry.get(model_name, "float32")
+    draft = registry.get(draft_name, "float32")
+
+    # Warm up kernels so the first prompt is not penalized
+    greedy_generate(shared, prompts[0], 4)
+    speculative_generate(shared, draft, prompts[0], 4, max(draft_tokens))
+
+    baseline, tokens, seconds = [], 0, 0.0
+    for prompt in prompts:
+        result = greedy_generate(shared, prompt, max_new_tokens)
+        baseline.append(result["token_ids"])
+        tokens += len(result["token_ids"])
+        seconds += result["total_seconds"]
+    baseline_tps = tokens / seconds if seconds else 0.0
+
+    modes = {}
+    for num_draft_tokens in draft_tokens:
+        matches, tokens, seconds, proposed, accepted, steps = 0, 0, 0.0, 0, 0, 0
+        for prompt, reference in zip(prompts, baseline):
+            result = speculative_generate(shared, draft, prompt, max_new_tokens, num_draft_tokens)
+            matches += result["token_ids"] == reference
+            tokens += len(result["token_ids"])
+            seconds += result["total_seconds"]
+            proposed += result["proposed"]
+            accepted += result["accepted"]
+            steps += result["steps"]
+        tokens_per_second = tokens / seconds if seconds else 0.0
+        modes[str(num_draft_tokens)] = {
+            "tokens_per_second": tokens_per_second,
+            "speedup": tokens_per_second / baseline_tps if baseline_tps else 0.0,
+            "acceptance_rate": accepted / proposed if proposed else 0.0,
+            "tokens_per_verification": tokens / steps if steps else 0.0,
+            "match_rate": matches / len(prompts),
+        }
+
+    return {"baseline_tokens_per_second": baseline_tps, "speculative": modes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark speculative decoding with a draft model")
+    parser.add_argument("--model", default="gpt2")
+    parser.add_argument("--draft", default="distilgpt2")
+    parser.add_argument("--draft-tokens", type=int, nargs="+", default=[2, 4, 6],
+                        help="Numbers of draft tokens per verification pass to try")
+    parser.add_argument("--prompts", type=int, default=8, help="Number of sample prompts to use")
+    parser.add_argument("--tokens", type=int, default=32, help="Tokens to generate per prompt")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-match", type=float, default=1.0,
+                        help="Minimum rate of outputs identical to plain greedy decoding")
+    parser.add_argument("--output", help="Optional path for the JSON report")
+    args = parser.parse_args()
+
+    set_seed(args.seed)
+    prompts = load_sample_prompts(args.prompts)
+    report = {
+        "model": args.model,
+        "draft_model": args.draft,
+        "prompts": len(prompts),
+        "max_new_tokens": args.tokens,
+        **run(args.model, args.draft, prompts, args.tokens, args.draft_tokens),
+    }
+    report["outputs_match"] = all(
+        mode["match_rate"] >= args.min_match for mode in report["speculative"].values()
+    )
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if not report["outputs_match"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
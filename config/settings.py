@@ -9,9 +9,54 @@ from typing import Dict, Any
 MODEL_CONFIG = {
     "default_model": "gpt2",  # Classic GPT-2 - good quality and reasonable size
     "voxen_model": "gpt2",
-    "max_length": 1000,
+    "system_prompt": "You are Voxen2.0, a helpful and intelligent AI assistant. Provide clear, informative, and helpful responses.",
+    "max_new_tokens": 128,  # Generation budget per reply, independent of prompt length
+    "stop_sequences": ["\n", "User:"],  # Replies end at the first line break or a new user turn
     "temperature": 0.7,
     "do_sample": True,
+    "top_p": 0.9,
+    "repetition_penalty": 1.1,
+    "dtype": "float32",  # "float32", "bfloat16", "auto" (bf16 when the CPU handles it efficiently) or "int8"; one shared copy per (model, dtype) per process
+    "kv_cache_max_tokens": 1024,  # Per-session KV cache is dropped beyond this many tokens
+    "engine": "eager",  # "eager" or "torchscript" (CPU float32/int8: traced decoder cached under PATHS["models_dir"])
+    "weights_format": "pretrained",  # "pretrained" or "mmap" (read-only safetensors under PATHS["models_dir"], shared by every process on the host)
+    "speculative_decoding": False,  # Greedy replies only (do_sample False); output is unchanged
+    "draft_model": "distilgpt2",  # Must share the main model's tokenizer
+    "num_draft_tokens": 4,  # Tokens proposed by the draft model per verification pass
+}
+
+# Micro-batching of concurrent generate requests
+BATCHING_CONFIG = {
+    "enabled": False,
+    "mode": "continuous",  # "continuous" (per-token admission/retirement) or "static" (fixed batches)
+    "max_batch_size": 8,
+    "max_wait_ms": 10,  # Static mode: how long the first request waits for others to join its batch
+}
+
+# Multi-process inference workers (sessions become clients that submit prompts over a local queue)
+WORKER_POOL_CONFIG = {
+    "enabled": False,
+    "num_workers": 0,  # 0 starts one worker per threads_per_worker cores
+    "threads_per_worker": 1,  # torch.set_num_threads inside each worker
+    "start_method": "spawn",  # Fresh interpreters; forking a process that already runs torch threads is unsafe
+    "token_timeout_seconds": 120,  # Longest wait for the next token before a request is failed
+    "restart_backoff_seconds": 30,  # Wait before replacing a pool whose workers failed
+}
+
+# Background model warm-up at process start
+WARMUP_CONFIG = {
+    "enabled": True,
+    "generations": 3,  # Dummy generations run after loading
+    "max_new_tokens": 8,
+}
+
+# Response cache for repeated prompts (deterministic settings or first turns)
+CACHE_CONFIG = {
+    "enabled": True,
+    "max_entries": 1024,
+    "ttl_seconds": 3600,  # 0 keeps entries until evicted
+    "disk": False,  # Also persist responses under PATHS["cache_dir"] across restarts
+    "disk_max_entries": 10000,
 }
 
 # UI Configuration
@@ -41,6 +86,19 @@ CHAT_CONFIG = {
     "max_history": 50,
     "welcome_message": "Hello! I'm Voxen2.0, your AI assistant powered by DialoGPT. I can help you with:\n• Answering questions\n• Having conversations\n• Providing information\n• And much more!\n\nJust ask me anything!",
     "system_prompt": "You are Voxen2.0, a helpful AI assistant powered by DialoGPT. Provide clear, informative, and helpful responses to user questions. Be friendly and engaging in your conversations.",
+    "search_ngram_size": 3,  # Longest character n-gram indexed for substring search
+}
+
+# Persistent conversation storage (SQLite in WAL mode under PATHS["data_dir"])
+STORAGE_CONFIG = {
+    "enabled": False,  # ChatModel persists and reopens conversations by session id
+    "filename": "conversations.db",
+    "batch_size": 64,  # Buffered messages written per transaction
+    "flush_interval_ms": 200,  # Longest time a message stays buffered (lost on a crash)
+    "synchronous": "FULL",  # "FULL" fsyncs every batch; "NORMAL" only at WAL checkpoints
+    "page_size": 200,  # Messages read per query when paging through a conversation
+    "compaction_interval_seconds": 3600,  # Background compaction of cleared/expired messages (0 disables)
+    "retention_days": 0,  # Idle conversations are deleted on compaction after this long (0 keeps them)
 }
 
 # File Paths
@@ -56,6 +114,27 @@ API_CONFIG = {
     "timeout": 30,
     "retry_attempts": 3,
     "rate_limit": 100,  # requests per minute
+    "inference_workers": 4,  # Threads running inference for the async API; further requests wait their turn
+}
+
+# Rate limiting and admission control in front of inference
+ADMISSION_CONFIG = {
+    "enabled": True,
+    "max_concurrent": 0,  # Requests generating at once (0 uses API_CONFIG["inference_workers"])
+    "max_queue": 32,  # Requests waiting for a slot; beyond this new requests get a "busy" reply
+    "queue_timeout_seconds": 10,
+    "session_rate_limit": 20,  # Requests per minute per session (the global limit is API_CONFIG["rate_limit"])
+    "session_burst": 5,
+    "short_prompt_chars": 200,  # Prompts up to this length are served ahead of longer ones
+    "max_tracked_sessions": 10000,
+}
+
+# Headless HTTP server (server.py)
+SERVER_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 8000,
+    "max_sessions": 1000,  # Least recently used chat sessions are dropped beyond this
+    "session_ttl_seconds": 1800,  # Idle chat sessions are dropped after this long
 }
 
 # Logging Configuration
@@ -120,10 +199,17 @@ VISUALIZATION_CONFIG = {
 
 VOXEN_CONFIG = {
     "model": MODEL_CONFIG,
+    "batching": BATCHING_CONFIG,
+    "worker_pool": WORKER_POOL_CONFIG,
+    "warmup": WARMUP_CONFIG,
+    "cache": CACHE_CONFIG,
     "ui": UI_CONFIG,
     "chat": CHAT_CONFIG,
+    "storage": STORAGE_CONFIG,
     "paths": PATHS,
     "api": API_CONFIG,
+    "server": SERVER_CONFIG,
+    "admission": ADMISSION_CONFIG,
     "logging": LOGGING_CONFIG,
     "env": ENV_VARS,
     "features": FEATURES,
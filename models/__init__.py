@@ -4,5 +4,9 @@ Models package for AI Chat System
 
 from .voxen_model import VoxenModel
 from .chat_model import ChatModel
+from .model_registry import ModelRegistry, SharedModel, get_model_registry
+from .warmup import ModelWarmup, start_warmup
+from .worker_pool import InferenceWorkerPool, get_worker_pool
 
-__all__ = ['VoxenModel', 'ChatModel'] 
\ No newline at end of file
+__all__ = ['VoxenModel', 'ChatModel', 'ModelRegistry', 'SharedModel', 'get_model_registry', 'ModelWarmup', 'start_warmup',
+           'InferenceWorkerPool', 'get_worker_pool'] 
\ No newline at end of file
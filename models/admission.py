@@ -0,0 +1,265 @@
+"""
+Rate limiting and admission control for inference requests
+
+Token buckets cap the request rate globally and per session. Admitted
+requests then wait for one of a fixed number of inference slots in a
+bounded priority queue in which short prompts go first; cached replies
+skip the queue since they never touch the model. When the queue is full
+new requests are turned away with a "busy" error instead of piling up in
+front of the model.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import logging
+from config.settings import ADMISSION_CONFIG, API_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Queue priorities (lower is served first)
+PRIORITY_SHORT = 0
+PRIORITY_NORMAL = 1
+
+# Longest retry hint given to clients (a bucket that never refills would suggest forever)
+MAX_RETRY_AFTER_SECONDS = 3600.0
+
+
+class AdmissionError(Exception):
+    """Raised when a request is not admitted"""
+
+    def __init__(self, message: str, retry_after: float):
+        """
+        Args:
+            message: Explanation for the client
+            retry_after: Suggested number of seconds before retrying
+        """
+        super().__init__(message)
+        self.retry_after = min(retry_after, MAX_RETRY_AFTER_SECONDS)
+
+
+class RateLimitExceeded(AdmissionError):
+    """Raised when a rate limit is exhausted"""
+
+
+class ServerBusy(AdmissionError):
+    """Raised when the wait queue is full or the wait takes too long"""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+    """
+
+    def __init__(self, rate_per_minute: float, burst: Optional[float] = None):
+        """
+        Args:
+            rate_per_minute: Sustained number of requests per minute
+            burst: Bucket capacity (defaults to one minute of requests)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst if burst is not None else float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> Tuple[bool, float]:
+        """
+        Take tokens if available
+
+        Returns:
+            Whether the tokens were taken and, if not, seconds until they would be
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True, 0.0
+            return False, (tokens - self.tokens) / self.rate if self.rate else float("inf")
+
+    def is_full(self, now: float) -> bool:
+        """Whether the bucket would be back at capacity by ``now``"""
+        with self._lock:
+            return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+    def refund(self, tokens: float = 1.0):
+        """Return tokens taken for a request that was not admitted after all"""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + tokens)
+
+
+class AdmissionController:
+    """
+    Token-bucket rate limiting plus a bounded priority queue for inference slots
+    """
+
+    def __init__(self, max_concurrent: int = None, max_queue: int = None,
+                 queue_timeout: float = None, rate_limit: float = None,
+                 session_rate_limit: float = None, session_burst: float = None):
+        """
+        Args:
+            max_concurrent: Requests generating at the same time
+            max_queue: Requests allowed to wait for a slot before load is shed
+            queue_timeout: Seconds a request may wait for a slot
+            rate_limit: Global requests per minute (defaults to API_CONFIG["rate_limit"])
+            session_rate_limit: Requests per minute for each session
+            session_burst: Requests a session may make back to back
+        """
+        self.max_concurrent = (
+            max_concurrent or ADMISSION_CONFIG["max_concurrent"] or API_CONFIG["inference_workers"]
+        )
+        self.max_queue = max_queue if max_queue is not None else ADMISSION_CONFIG["max_queue"]
+        self.queue_timeout = queue_timeout or ADMISSION_CONFIG["queue_timeout_seconds"]
+        self.global_bucket = TokenBucket(rate_limit or API_CONFIG["rate_limit"])
+        self.session_rate_limit = session_rate_limit or ADMISSION_CONFIG["session_rate_limit"]
+        self.session_burst = session_burst or ADMISSION_CONFIG["session_burst"]
+        # Least recently used first; capped at ADMISSION_CONFIG["max_tracked_sessions"]
+        self._session_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._active = 0
+        self._waiting: List[Tuple[int, int]] = []  # Heap of (priority, ticket)
+        self._tickets = itertools.count()
+        self._condition = threading.Condition()
+        self._stats = {"admitted": 0, "rate_limited": 0, "shed": 0, "timed_out": 0}
+
+    def _session_bucket(self, session_id: str) -> TokenBucket:
+        with self._condition:
+            bucket = self._session_buckets.get(session_id)
+            if bucket is not None:
+                self._session_buckets.move_to_end(session_id)
+                return bucket
+
+            buckets = self._session_buckets
+            now = time.monotonic()
+            # Buckets idle long enough to have refilled carry no state worth keeping
+            while buckets and next(iter(buckets.values())).is_full(now):
+                buckets.popitem(last=False)
+            # Hard cap: evict the least recently used session even if it is still limited
+            while len(buckets) >= ADMISSION_CONFIG["max_tracked_sessions"]:
+                buckets.popitem(last=False)
+            bucket = buckets[session_id] = TokenBucket(self.session_rate_limit, self.session_burst)
+            return bucket
+
+    def check_rate(self, session_id: str) -> TokenBucket:
+        """
+        Take one request from the session and global buckets
+
+        Returns:
+            The session's bucket, for refunding the request if it is not admitted
+
+        Raises:
+            RateLimitExceeded: If either bucket is empty
+        """
+        session_bucket = self._session_bucket(session_id)
+        allowed, retry_after = session_bucket.try_acquire()
+        if allowed:
+            allowed, retry_after = self.global_bucket.try_acquire()
+            if not allowed:
+                session_bucket.refund()
+        if not allowed:
+            with self._condition:
+                self._stats["rate_limited"] += 1
+            raise RateLimitExceeded("Too many requests. Please slow down.", retry_after)
+        return session_bucket
+
+    @contextmanager
+    def admit(self, session_id: str, priority: int = PRIORITY_NORMAL,
+              needs_slot: bool = True) -> Iterator[None]:
+        """
+        Admit a request for the duration of the ``with`` block
+
+        Args:
+            session_id: Rate-limiting key of the caller
+            priority: Queue priority (PRIORITY_SHORT or PRIORITY_NORMAL)
+            needs_slot: Whether the request occupies an inference slot
+                (False for replies served from the response cache)
+
+        Raises:
+            RateLimitExceeded: If the caller or the server is over its rate limit
+            ServerBusy: If the wait queue is full or no slot frees up in time
+        """
+        session_bucket = self.check_rate(session_id)
+        if not needs_slot:
+            with self._condition:
+                self._stats["admitted"] += 1
+            yield
+            return
+
+        try:
+            self._acquire_slot(priority)
+        except ServerBusy:
+            # Shed requests never ran, so they do not count against the rate limits
+            session_bucket.refund()
+            self.global_bucket.refund()
+            raise
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+
+    def _acquire_slot(self, priority: int):
+        """Wait in the priority queue until an inference slot is free"""
+        with self._condition:
+            if self._active < self.max_concurrent and not self._waiting:
+                self._active += 1
+                self._stats["admitted"] += 1
+                return
+
+            if len(self._waiting) >= self.max_queue:
+                self._stats["shed"] += 1
+                raise ServerBusy("The assistant is busy. Please try again shortly.", self.queue_timeout)
+
+            entry = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, entry)
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self._waiting[0] != entry or self._active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timed_out"] += 1
+                        raise ServerBusy("The assistant is busy. Please try again shortly.", self.queue_timeout)
+                    self._condition.wait(remaining)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+                raise
+
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self._stats["admitted"] += 1
+            # The next waiter may be able to take another free slot
+            self._condition.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get admission counters and current load"""
+        with self._condition:
+            return {
+                "active": self._active,
+                "waiting": len(self._waiting),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                **self._stats,
+            }
+
+
+_admission_controller: Optional[AdmissionController] = None
+_admission_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get the process-wide admission controller configured by ADMISSION_CONFIG"""
+    global _admission_controller
+    with _admission_controller_lock:
+        if _admission_controller is None:
+            _admission_controller = AdmissionController()
+        return _admission_controller
@@ -0,0 +1,70 @@
+"""
+Bounded executor for the asyncio inference API
+
+Inference is blocking, so coroutines hand it to a small thread pool and
+await the result. Waiting clients cost a pending future rather than a
+thread, and a timeout or client disconnect sets a cancellation event that
+the generation loop checks after every token.
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+import logging
+from config.settings import ADMISSION_CONFIG, API_CONFIG
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_inference_executor() -> ThreadPoolExecutor:
+    """Get the process-wide inference executor sized by API_CONFIG["inference_workers"]"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            max_workers = API_CONFIG["inference_workers"]
+            if ADMISSION_CONFIG["enabled"]:
+                # Requests queued by admission control wait on a thread, so
+                # the executor's own unbounded queue never holds shed work
+                max_workers += ADMISSION_CONFIG["max_queue"]
+            _executor = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix="voxen-inference",
+            )
+        return _executor
+
+
+async def run_inference(func: Callable[..., Any], *args, timeout: Optional[float] = None,
+                        cancel: Optional[threading.Event] = None, **kwargs) -> Any:
+    """
+    Run a blocking inference call on the bounded executor
+
+    Args:
+        func: Blocking callable
+        *args: Positional arguments for ``func``
+        timeout: Seconds to wait (defaults to API_CONFIG["timeout"]; 0 waits forever)
+        cancel: Event set when the call times out or the awaiting task is cancelled
+        **kwargs: Keyword arguments for ``func``
+
+    Returns:
+        The result of ``func``
+
+    Raises:
+        asyncio.TimeoutError: If the call does not finish in time
+        asyncio.CancelledError: If the awaiting task is cancelled
+    """
+    timeout = API_CONFIG["timeout"] if timeout is None else timeout
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(get_inference_executor(), functools.partial(func, *args, **kwargs))
+    try:
+        # A call still queued in the executor is dropped outright; one that is
+        # already running stops at its next token once the event is set
+        return await asyncio.wait_for(future, timeout or None)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        if cancel is not None:
+            cancel.set()
+        raise
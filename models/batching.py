@@ -0,0 +1,233 @@
+"""
+Dynamic micro-batching of generation requests
+
+Sessions submit prompts to a background scheduler that groups requests
+arriving within a short window into one padded batch for the shared model.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+import logging
+from config.settings import BATCHING_CONFIG
+from models.generation import decode_batch, sampling_params
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationRequest:
+    """
+    A single prompt waiting to be batched
+    """
+
+    def __init__(self, input_ids: List[int], max_new_tokens: int, params: Dict[str, Any],
+                 should_stop: Optional[Callable[[List[int]], bool]] = None):
+        """
+        Args:
+            input_ids: Token ids of the full prompt
+            max_new_tokens: Maximum number of tokens to generate
+            params: Sampling parameters
+            should_stop: Optional callback deciding from the generated ids whether to stop
+        """
+        self.input_ids = input_ids
+        self.max_new_tokens = max_new_tokens
+        self.params = params
+        self.should_stop = should_stop
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+    @property
+    def batch_key(self) -> tuple:
+        """Requests can only share a batch when their sampling parameters match"""
+        return tuple(sorted(self.params.items()))
+
+
+class BatchScheduler:
+    """
+    Background scheduler that runs concurrent requests as batched generations
+    """
+
+    def __init__(self, shared_model, max_batch_size: int = None, max_wait_ms: float = None):
+        """
+        Args:
+            shared_model: Shared model to run batches on
+            max_batch_size: Largest number of requests per batch
+            max_wait_ms: How long to wait for more requests after the first one arrives
+        """
+        self.shared_model = shared_model
+        self.max_batch_size = max_batch_size or BATCHING_CONFIG["max_batch_size"]
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else BATCHING_CONFIG["max_wait_ms"]) / 1000
+
+        self._queue: "queue.Queue[GenerationRequest]" = queue.Queue()
+        self._deferred: List[GenerationRequest] = []
+        self._running = True
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "requests": 0,
+            "batches": 0,
+            "batched_requests": 0,
+            "max_queue_depth": 0,
+            "tokens_generated": 0,
+            "queue_wait_seconds": 0.0,
+            "generation_seconds": 0.0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name="voxen-batch-scheduler", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"BatchScheduler started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:g})"
+        )
+
+    def submit(self, input_ids: List[int], max_new_tokens: int,
+               params: Optional[Dict[str, Any]] = None,
+               should_stop: Optional[Callable[[List[int]], bool]] = None) -> Future:
+        """
+        Queue a prompt for batched generation
+
+        Args:
+            input_ids: Token ids of the full prompt
+            max_new_tokens: Maximum number of tokens to generate
+            params: Sampling parameters (defaults to MODEL_CONFIG)
+            should_stop: Optional callback deciding from the generated ids whether to stop
+
+        Returns:
+            Future resolving to the generated token ids
+        """
+        if not self._running:
+            raise RuntimeError("BatchScheduler has been stopped")
+
+        request = GenerationRequest(input_ids, max_new_tokens, params or sampling_params(), should_stop)
+        self._queue.put(request)
+        with self._metrics_lock:
+            self._metrics["requests"] += 1
+            self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], self.queue_depth)
+        return request.future
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting to be batched"""
+        return self._queue.qsize() + len(self._deferred)
+
+    def _collect_batch(self) -> List[GenerationRequest]:
+        """Wait for a request, then gather compatible requests until the window closes"""
+        if self._deferred:
+            first = self._deferred.pop(0)
+        else:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                return []
+
+        batch = [first]
+        # Requests deferred from an earlier window have already waited
+        for request in list(self._deferred):
+            if len(batch) >= self.max_batch_size:
+                break
+            if request.batch_key == first.batch_key:
+                self._deferred.remove(request)
+                batch.append(request)
+
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request.batch_key == first.batch_key:
+                batch.append(request)
+            else:
+                self._deferred.append(request)
+
+        return batch
+
+    def _run(self):
+        """Scheduler loop"""
+        while self._running:
+            batch = self._collect_batch()
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch: List[GenerationRequest]):
+        """Run one batched generation and resolve the request futures"""
+        started = time.perf_counter()
+        shared = self.shared_model
+
+        def should_stop(row: int, generated: List[int]) -> bool:
+            callback = batch[row].should_stop
+            return callback is not None and callback(generated)
+
+        try:
+            results = decode_batch(
+                shared.model,
+                [request.input_ids for request in batch],
+                [request.max_new_tokens for request in batch],
+                eos_token_id=shared.tokenizer.eos_token_id,
+                pad_token_id=shared.tokenizer.pad_token_id,
+                device=shared.device,
+                params=batch[0].params,
+                should_stop=should_stop,
+            )
+        except Exception as e:
+            logger.error(f"Error running batch of {len(batch)} requests: {e}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        finished = time.perf_counter()
+        for request, token_ids in zip(batch, results):
+            request.future.set_result(token_ids)
+
+        with self._metrics_lock:
+            self._metrics["batches"] += 1
+            self._metrics["batched_requests"] += len(batch)
+            self._metrics["tokens_generated"] += sum(len(ids) for ids in results)
+            self._metrics["queue_wait_seconds"] += sum(started - request.enqueued_at for request in batch)
+            self._metrics["generation_seconds"] += finished - started
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get queue depth, batch fill and throughput metrics"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+
+        batches = metrics["batches"]
+        batched = metrics["batched_requests"]
+        metrics.update({
+            "queue_depth": self.queue_depth,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "avg_batch_size": batched / batches if batches else 0.0,
+            "avg_batch_fill": batched / (batches * self.max_batch_size) if batches else 0.0,
+            "avg_queue_wait_ms": metrics["queue_wait_seconds"] * 1000 / batched if batched else 0.0,
+            "tokens_per_second": (
+                metrics["tokens_generated"] / metrics["generation_seconds"]
+                if metrics["generation_seconds"] else 0.0
+            ),
+        })
+        return metrics
+
+    def stop(self):
+        """Stop the scheduler thread; requests still queued are failed"""
+        self._running = False
+        self._thread.join(timeout=5)
+        pending = self._deferred + [self._queue.get_nowait() for _ in range(self._queue.qsize())]
+        for request in pending:
+            request.future.set_exception(RuntimeError("BatchScheduler has been stopped"))
+        self._deferred = []
+        logger.info("BatchScheduler stopped")
+
+
+_scheduler_lock = threading.Lock()
+
+
+def get_batch_scheduler(shared_model) -> BatchScheduler:
+    """Get the batch scheduler of a shared model, starting it on first use"""
+    with _scheduler_lock:
+        if shared_model.batch_scheduler is None:
+            shared_model.batch_scheduler = BatchScheduler(shared_model)
+        return shared_model.batch_scheduler
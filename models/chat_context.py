@@ -0,0 +1,133 @@
+"""
+Incrementally maintained conversation context for ChatModel
+
+Each message is rendered into its prompt line once, when it is added, and
+dropped when the message leaves the history. Building the context string (or
+its token ids) for a window of recent messages joins pre-rendered segments,
+and the result is memoized until the next message arrives.
+"""
+
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ContextSegment:
+    """
+    One rendered message line and its cached token ids
+    """
+
+    __slots__ = ("text", "token_ids")
+
+    def __init__(self, text: str):
+        """
+        Args:
+            text: Message as it appears in the context, with its line break
+        """
+        self.text = text
+        self.token_ids: Optional[List[int]] = None
+
+
+class ConversationContext:
+    """
+    Pre-rendered context segments that mirror the chat history
+    """
+
+    def __init__(self, system_prompt: str, capacity: int):
+        """
+        Args:
+            system_prompt: Prompt that opens every context
+            capacity: Number of messages the chat history keeps
+        """
+        self.system_prompt = system_prompt
+        self.header = f"{system_prompt}\n\n"
+        self.segments: Deque[ContextSegment] = deque(maxlen=capacity)
+        self._texts: Dict[int, str] = {}
+        self._token_ids: Dict[int, List[int]] = {}
+        self._tokenizer = None
+        self._header_ids: Optional[List[int]] = None
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    @staticmethod
+    def render(role: str, content: str) -> str:
+        """Message as it appears in the context"""
+        speaker = "User" if role == "user" else "Assistant"
+        return f"{speaker}: {content}\n"
+
+    def append(self, role: str, content: str):
+        """
+        Add the segment of a new message
+
+        Once the history is full the oldest segment falls out together with
+        the oldest message.
+        """
+        self.segments.append(ContextSegment(self.render(role, content)))
+        self._texts.clear()
+        self._token_ids.clear()
+
+    def clear(self):
+        """Remove every segment"""
+        self.segments.clear()
+        self._texts.clear()
+        self._token_ids.clear()
+
+    def _window(self, max_messages: int) -> List[ContextSegment]:
+        """Segments of the last ``max_messages`` messages, oldest first"""
+        count = max(0, min(max_messages, len(self.segments)))
+        window = list(islice(reversed(self.segments), count))
+        window.reverse()
+        return window
+
+    def text(self, max_messages: int) -> str:
+        """
+        Context string for the last ``max_messages`` messages
+
+        Returns:
+            System prompt followed by one "Role: content" line per message
+        """
+        text = self._texts.get(max_messages)
+        if text is None:
+            window = self._window(max_messages)
+            text = "".join([self.header] + [segment.text for segment in window]).strip()
+            self._texts[max_messages] = text
+        return text
+
+    def token_ids(self, tokenizer, max_messages: int) -> List[int]:
+        """
+        Token ids of the context for the last ``max_messages`` messages
+
+        Every segment is tokenized once and on its own (as in
+        ``TokenBudgetHistory``), and the last line keeps its line break so
+        the next turn can be appended directly.
+
+        Args:
+            tokenizer: Tokenizer of the model
+            max_messages: Number of recent messages to include
+
+        Returns:
+            Token ids of the system prompt and the message lines (memoized; do
+            not modify)
+        """
+        if tokenizer is not self._tokenizer:
+            self._tokenizer = tokenizer
+            self._header_ids = None
+            self._token_ids.clear()
+            for segment in self.segments:
+                segment.token_ids = None
+
+        ids = self._token_ids.get(max_messages)
+        if ids is None:
+            if self._header_ids is None:
+                self._header_ids = tokenizer.encode(self.header)
+            ids = list(self._header_ids)
+            for segment in self._window(max_messages):
+                if segment.token_ids is None:
+                    segment.token_ids = tokenizer.encode(segment.text)
+                ids.extend(segment.token_ids)
+            self._token_ids[max_messages] = ids
+        return ids
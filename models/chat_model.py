@@ -2,11 +2,19 @@
 Chat model for handling conversation flow and message processing
 """
 
-import json
+import asyncio
 import logging
-from typing import Dict, List, Any, Optional
+import threading
+import time
+import uuid
+from typing import IO, Dict, Iterator, List, Any, Optional
 from datetime import datetime
-from config.settings import CHAT_CONFIG, SAMPLE_QUESTIONS
+from config.settings import CHAT_CONFIG, SAMPLE_QUESTIONS, STORAGE_CONFIG
+from models.chat_context import ConversationContext
+from models.conversation_export import iter_export, write_export
+from models.conversation_store import ConversationStore, get_conversation_store
+from models.message_index import MessageIndex
+from models.message_store import ChatMessage, MessageRing
 
 logger = logging.getLogger(__name__)
 
@@ -15,15 +23,47 @@ class ChatModel:
     Handles chat conversation flow and message processing
     """
     
-    def __init__(self):
-        """Initialize the chat model"""
-        self.conversation_history = []
+    def __init__(self, session_id: Optional[str] = None, store: Optional[ConversationStore] = None):
+        """
+        Initialize the chat model
+        
+        Args:
+            session_id: Conversation to reopen from the store (a new one when None)
+            store: Persistent message store (the shared one when STORAGE_CONFIG is enabled)
+        """
         self.max_history = CHAT_CONFIG["max_history"]
+        self.conversation_history = MessageRing(self.max_history)
+        # Every message of the conversation, searchable through the index;
+        # with a store the messages live there and only the index is in memory
+        self.archive: List[ChatMessage] = []
+        self.index = MessageIndex(CHAT_CONFIG["search_ngram_size"])
+        self._index_complete = True
         self.system_prompt = CHAT_CONFIG["system_prompt"]
         self.welcome_message = CHAT_CONFIG["welcome_message"]
+        self.context = ConversationContext(self.system_prompt, self.max_history)
+        # Guards the ring, context, index and sequence numbers against concurrent callers
+        self.session_lock = threading.RLock()
+        
+        self.session_id = session_id or uuid.uuid4().hex
+        if store is None and STORAGE_CONFIG["enabled"]:
+            store = get_conversation_store()
+        self.store = store
+        if self.store is not None:
+            self._reopen()
         
         logger.info("ChatModel initialized")
     
+    def _reopen(self):
+        """Load the most recent messages of a stored conversation"""
+        recent = self.store.recent(self.session_id, self.max_history)
+        for _, message in recent:
+            self.conversation_history.append(message)
+            self.context.append(message.role, message.content)
+        # Older messages are indexed on the first search
+        self._index_complete = not recent
+        if recent:
+            logger.info(f"Reopened conversation {self.session_id} ({len(recent)} recent messages loaded)")
+    
     def add_message(self, role: str, content: str, metadata: Dict[str, Any] = None):
         """
         Add a message to the conversation history
@@ -33,18 +73,19 @@ class ChatModel:
             content: Message content
             metadata: Additional metadata about the message
         """
-        message = {
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat(),
-            "metadata": metadata or {}
-        }
-        
-        self.conversation_history.append(message)
-        
-        # Keep only the last max_history messages
-        if len(self.conversation_history) > self.max_history:
-            self.conversation_history = self.conversation_history[-self.max_history:]
+        # Once max_history messages are held, the oldest one is overwritten
+        message = ChatMessage(role, content, time.time(), metadata)
+        with self.session_lock:
+            self.conversation_history.append(message)
+            self.context.append(role, content)
+            if self.store is not None:
+                # Index the sequence number the store actually assigned
+                seq = self.store.append(self.session_id, message)
+            else:
+                seq = len(self.archive)
+                self.archive.append(message)
+            if self._index_complete:
+                self.index.add(seq, content)
         
         logger.debug(f"Added {role} message: {content[:50]}...")
     
@@ -58,15 +99,20 @@ class ChatModel:
         Returns:
             Formatted conversation context
         """
-        recent_messages = self.conversation_history[-max_messages:] if self.conversation_history else []
-        
-        context = f"{self.system_prompt}\n\n"
-        
-        for message in recent_messages:
-            role = "User" if message["role"] == "user" else "Assistant"
-            context += f"{role}: {message['content']}\n"
+        return self.context.text(max_messages)
+    
+    def get_conversation_context_ids(self, tokenizer, max_messages: int = 10) -> List[int]:
+        """
+        Get token ids of the conversation context for AI model
         
-        return context.strip()
+        Args:
+            tokenizer: Tokenizer of the model
+            max_messages: Maximum number of recent messages to include
+            
+        Returns:
+            Token ids of the system prompt and recent messages
+        """
+        return self.context.token_ids(tokenizer, max_messages)
     
     def process_user_input(self, user_input: str) -> Dict[str, Any]:
         """
@@ -79,14 +125,29 @@ class ChatModel:
             Dictionary containing processed input and metadata
         """
         # Add user message to history
-        self.add_message("user", user_input)
+        with self.session_lock:
+            self.add_message("user", user_input)
+            context = self.get_conversation_context()
         
         return {
             "input": user_input,
-            "context": self.get_conversation_context(),
+            "context": context,
             "timestamp": datetime.now().isoformat()
         }
     
+    async def aprocess_user_input(self, user_input: str) -> Dict[str, Any]:
+        """
+        Process user input without blocking the event loop
+        
+        Args:
+            user_input: User's message
+            
+        Returns:
+            Dictionary containing processed input and metadata
+        """
+        # Bookkeeping, not inference: keep it off the bounded inference executor
+        return await asyncio.to_thread(self.process_user_input, user_input)
+    
     def add_ai_response(self, response: str):
         """
         Add AI response to conversation history
@@ -115,15 +176,13 @@ class ChatModel:
                 "duration": "0 minutes"
             }
         
-        user_messages = sum(1 for msg in self.conversation_history if msg["role"] == "user")
-        assistant_messages = sum(1 for msg in self.conversation_history if msg["role"] == "assistant")
+        user_messages = sum(1 for msg in self.conversation_history if msg.role == "user")
+        assistant_messages = sum(1 for msg in self.conversation_history if msg.role == "assistant")
         
         # Calculate duration
         if len(self.conversation_history) >= 2:
-            start_time = datetime.fromisoformat(self.conversation_history[0]["timestamp"])
-            end_time = datetime.fromisoformat(self.conversation_history[-1]["timestamp"])
-            duration = end_time - start_time
-            duration_str = f"{duration.seconds // 60} minutes"
+            duration = self.conversation_history[-1].timestamp - self.conversation_history[0].timestamp
+            duration_str = f"{int(duration) // 60} minutes"
         else:
             duration_str = "0 minutes"
         
@@ -136,37 +195,73 @@ class ChatModel:
     
     def clear_history(self):
         """Clear conversation history"""
-        self.conversation_history = []
+        with self.session_lock:
+            self.conversation_history.clear()
+            self.context.clear()
+            self.archive = []
+            self.index.clear()
+            self._index_complete = True
+            if self.store is not None:
+                # Sequence numbers keep growing; compaction deletes the cleared messages
+                self.store.clear_session(self.session_id)
         logger.info("Conversation history cleared")
     
-    def export_conversation(self, format: str = "json") -> str:
+    def iter_messages(self, archive: bool = False) -> Iterator[ChatMessage]:
         """
-        Export conversation history
+        Iterate over the conversation, oldest first
         
         Args:
-            format: Export format ('json' or 'txt')
+            archive: Every message of the conversation instead of the history window
             
         Returns:
-            Exported conversation as string
+            Iterator over the messages (stored messages are paged in lazily)
+        """
+        if not archive:
+            # Snapshot the window: exports are consumed lazily while new messages arrive
+            with self.session_lock:
+                return iter(self.conversation_history.to_list())
+        if self.store is not None:
+            return (message for _, message in self.store.iter_messages(self.session_id))
+        return iter(self.archive)
+    
+    def iter_export(self, format: str = "json", archive: bool = False) -> Iterator[str]:
         """
-        if format == "json":
-            return json.dumps(self.conversation_history, indent=2)
+        Export conversation history as a stream of text chunks
         
-        elif format == "txt":
-            export_text = "AI Chat Conversation\n"
-            export_text += "=" * 30 + "\n\n"
+        Args:
+            format: Export format ('json', 'jsonl' or 'txt')
+            archive: Export every message of the conversation, not just the history window
             
-            for message in self.conversation_history:
-                role = "User" if message["role"] == "user" else "Assistant"
-                timestamp = message["timestamp"]
-                content = message["content"]
-                
-                export_text += f"[{timestamp}] {role}:\n{content}\n\n"
+        Returns:
+            Iterator over chunks whose concatenation is the export
+        """
+        return iter_export(self.iter_messages(archive), format)
+    
+    def export_to(self, fp: IO[str], format: str = "json", archive: bool = False) -> int:
+        """
+        Write the conversation export to a file-like object message by message
+        
+        Args:
+            fp: Text destination (file, HTTP response body, ...)
+            format: Export format ('json', 'jsonl' or 'txt')
+            archive: Export every message of the conversation, not just the history window
             
-            return export_text
+        Returns:
+            Number of characters written
+        """
+        return write_export(self.iter_export(format, archive), fp)
+    
+    def export_conversation(self, format: str = "json") -> str:
+        """
+        Export conversation history
         
-        else:
-            raise ValueError(f"Unsupported export format: {format}")
+        Args:
+            format: Export format ('json', 'jsonl' or 'txt')
+            
+        Returns:
+            Exported conversation as string
+        """
+        return "".join(self.iter_export(format))
     
     def get_sample_questions(self, category: str = None) -> List[str]:
         """
@@ -184,7 +279,7 @@ class ChatModel:
         
         return SAMPLE_QUESTIONS
     
-    def get_recent_messages(self, count: int = 5) -> List[Dict[str, Any]]:
+    def get_recent_messages(self, count: int = 5) -> List[ChatMessage]:
         """
         Get recent messages from conversation history
         
@@ -192,25 +287,32 @@ class ChatModel:
             count: Number of recent messages to return
             
         Returns:
-            List of recent messages
+            List of the recent messages, oldest first
         """
-        return self.conversation_history[-count:] if self.conversation_history else []
+        with self.session_lock:
+            return self.conversation_history.recent(count).to_list()
     
-    def search_messages(self, query: str) -> List[Dict[str, Any]]:
+    def search_messages(self, query: str, limit: Optional[int] = None) -> List[ChatMessage]:
         """
-        Search messages in conversation history
+        Search messages in the conversation archive
+        
+        Every word of the query must appear in a message, either as a word
+        or as part of one (case-insensitive).
         
         Args:
             query: Search query
+            limit: Maximum number of results
             
         Returns:
-            List of matching messages
+            List of matching messages, best match first
         """
-        query_lower = query.lower()
-        matching_messages = []
-        
-        for message in self.conversation_history:
-            if query_lower in message["content"].lower():
-                matching_messages.append(message)
-        
-        return matching_messages 
\ No newline at end of file
+        with self.session_lock:
+            if not self._index_complete:
+                for seq, message in self.store.iter_messages(self.session_id):
+                    self.index.add(seq, message.content)
+                self._index_complete = True
+            
+            message_ids = self.index.search(query, limit)
+            if self.store is None:
+                return [self.archive[message_id] for message_id in message_ids]
+        return self.store.get_messages(self.session_id, message_ids)
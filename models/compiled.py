@@ -0,0 +1,279 @@
+"""
+TorchScript decoder engine for CPU inference
+
+The decoder is traced once into a static graph that takes the prompt ids,
+positions, attention mask and a flat list of cached keys/values, and is
+saved under PATHS["models_dir"]. Later processes load the graph (plus the
+small config and tokenizer) instead of building the model with
+``from_pretrained``, and every decode step skips the Python-level module
+dispatch of the eager model.
+"""
+
+import hashlib
+import os
+from collections import namedtuple
+from typing import List, Optional, Tuple
+import torch
+import transformers
+import logging
+from config.settings import PATHS
+from models.generation import LegacyCache, from_legacy_cache, model_forward, to_legacy_cache
+
+logger = logging.getLogger(__name__)
+
+# Dtype keys the traced graph supports (bfloat16 relies on autocast, which tracing bakes in)
+TORCHSCRIPT_DTYPES = {"float32", "int8"}
+
+DecoderOutput = namedtuple("DecoderOutput", ["logits", "past_key_values"])
+
+
+class _DecoderGraph(torch.nn.Module):
+    """
+    Traceable view of a causal LM with tensor-only inputs and outputs
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: torch.Tensor, position_ids: torch.Tensor,
+                attention_mask: torch.Tensor, *past_flat: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+        past = tuple((past_flat[i], past_flat[i + 1]) for i in range(0, len(past_flat), 2))
+        outputs = self.model(
+            input_ids=input_ids,
+            past_key_values=from_legacy_cache(self.model, past),
+            position_ids=position_ids,
+            attention_mask=attention_mask,
+            use_cache=True,
+        )
+        present = to_legacy_cache(outputs.past_key_values)
+        return (outputs.logits,) + tuple(tensor for layer in present for tensor in layer)
+
+
+class TracedDecoder:
+    """
+    Traced decoder graph with the call interface of a Hugging Face causal LM
+
+    Exposes ``config``, ``dtype`` and ``device`` and accepts the keyword
+    arguments ``model_forward`` passes, so the generation code treats it like
+    the eager model.
+    """
+
+    # Caches are passed to the graph as legacy tuples
+    _supports_cache_class = False
+
+    def __init__(self, graph: torch.jit.ScriptModule, config, device: str = "cpu"):
+        """
+        Args:
+            graph: Traced ``_DecoderGraph``
+            config: Config of the traced model
+            device: Device the graph runs on
+        """
+        self.graph = graph
+        self.config = config
+        self.device = torch.device(device)
+        self.dtype = torch.float32
+
+    def _empty_past(self, batch_size: int) -> LegacyCache:
+        """Zero-length cache for a prefill without cached positions"""
+        heads = self.config.num_attention_heads
+        shape = (batch_size, heads, 0, self.config.hidden_size // heads)
+        empty = torch.zeros(shape, dtype=self.dtype, device=self.device)
+        return tuple((empty, empty) for _ in range(self.config.num_hidden_layers))
+
+    def __call__(self, input_ids: torch.Tensor, past_key_values: Optional[LegacyCache] = None,
+                 position_ids: Optional[torch.Tensor] = None,
+                 attention_mask: Optional[torch.Tensor] = None, **kwargs) -> DecoderOutput:
+        batch_size, length = input_ids.shape
+        past = past_key_values or self._empty_past(batch_size)
+        past_length = past[0][0].shape[-2]
+        if position_ids is None:
+            position_ids = torch.arange(
+                past_length, past_length + length, device=input_ids.device
+            ).unsqueeze(0).expand(batch_size, -1)
+        if attention_mask is None:
+            attention_mask = torch.ones(
+                (batch_size, past_length + length), dtype=torch.long, device=input_ids.device
+            )
+
+        outputs = self.graph(input_ids, position_ids, attention_mask,
+                             *(tensor for layer in past for tensor in layer))
+        present = tuple((outputs[i], outputs[i + 1]) for i in range(1, len(outputs), 2))
+        return DecoderOutput(outputs[0], present)
+
+    def parameters(self):
+        """Parameters held by the graph"""
+        return self.graph.parameters()
+
+    def eval(self) -> "TracedDecoder":
+        """Traced graphs are always in inference mode"""
+        return self
+
+
+# Checkpoint files whose changes invalidate a traced graph
+_CHECKPOINT_SUFFIXES = (".safetensors", ".bin", ".pt", ".pth", "config.json")
+
+
+def _checkpoint_fingerprint(model_name: str) -> str:
+    """
+    Short fingerprint of the checkpoint a model name points to
+
+    Local checkpoint directories are fingerprinted by the size and mtime of
+    their weight and config files, so re-training in place gets a new graph.
+    Hub models use the commit of the cached snapshot when there is one.
+    """
+    digest = hashlib.sha1()
+    if os.path.isdir(model_name):
+        for root, _, files in sorted(os.walk(model_name)):
+            for file in sorted(files):
+                if file.endswith(_CHECKPOINT_SUFFIXES):
+                    stat = os.stat(os.path.join(root, file))
+                    digest.update(f"{os.path.relpath(os.path.join(root, file), model_name)}:"
+                                  f"{stat.st_size}:{stat.st_mtime_ns};".encode())
+        return digest.hexdigest()[:12]
+    try:
+        from huggingface_hub import try_to_load_from_cache
+        config_path = try_to_load_from_cache(model_name, "config.json")
+    except Exception:
+        config_path = None
+    if not isinstance(config_path, str):
+        return ""
+    # .../snapshots/<commit>/config.json
+    digest.update(os.path.basename(os.path.dirname(config_path)).encode())
+    return digest.hexdigest()[:12]
+
+
+def artifact_path(model_name: str, dtype: str) -> str:
+    """Location of the traced graph for a model checkpoint, dtype and library versions"""
+    name = model_name.strip("/").replace("/", "--")
+    fingerprint = _checkpoint_fingerprint(model_name)
+    versions = f"torch{torch.__version__}-transformers{transformers.__version__}"
+    parts = [name, dtype, fingerprint, versions] if fingerprint else [name, dtype, versions]
+    return os.path.join(PATHS["models_dir"], "compiled", "-".join(parts) + ".pt")
+
+
+def _failure_marker(path: str) -> str:
+    """Marker recording that a model cannot be traced (keyed like its artifact)"""
+    return f"{path}.failed"
+
+
+def _mark_untraceable(path: str, reason: str):
+    """Remember a tracing failure so later cold starts skip the attempt"""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(_failure_marker(path), "w", encoding="utf-8") as f:
+            f.write(reason)
+    except OSError as e:
+        logger.warning(f"Could not record tracing failure: {e}")
+
+
+def load_traced_decoder(model_name: str, dtype: str, config) -> Optional[TracedDecoder]:
+    """
+    Load a previously exported decoder graph
+
+    Args:
+        model_name: Name of the pre-trained model
+        dtype: Dtype key the graph was exported with
+        config: Config of the model
+
+    Returns:
+        The decoder, or None when no usable artifact exists
+    """
+    path = artifact_path(model_name, dtype)
+    if not os.path.exists(path):
+        return None
+    try:
+        graph = torch.jit.load(path, map_location="cpu")
+    except Exception as e:
+        logger.warning(f"Could not load traced decoder {path}: {e}")
+        return None
+    logger.info(f"Loaded traced decoder from {path}")
+    return TracedDecoder(graph, config)
+
+
+def _example_inputs(config, batch_size: int, length: int, past_length: int,
+                    padding: int = 0) -> Tuple[torch.Tensor, LegacyCache, torch.Tensor, torch.Tensor]:
+    """Random ids, cache, positions and a left-padded mask for tracing and validation"""
+    heads = config.num_attention_heads
+    shape = (batch_size, heads, past_length, config.hidden_size // heads)
+    past = tuple((torch.randn(shape), torch.randn(shape)) for _ in range(config.num_hidden_layers))
+    input_ids = torch.randint(0, config.vocab_size, (batch_size, length))
+    attention_mask = torch.ones((batch_size, past_length + length), dtype=torch.long)
+    attention_mask[0, :padding] = 0
+    position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, past_length:]
+    return input_ids, past, position_ids, attention_mask
+
+
+def _outputs_match(model, decoder: TracedDecoder, cases: List[tuple]) -> bool:
+    """Compare the traced decoder with the eager model on several input shapes"""
+    for input_ids, past, position_ids, attention_mask in cases:
+        expected, expected_past = model_forward(model, input_ids, past, position_ids, attention_mask, last_only=False)
+        actual, actual_past = model_forward(decoder, input_ids, past, position_ids, attention_mask, last_only=False)
+        if not torch.allclose(expected, actual, atol=1e-3, rtol=1e-3):
+            return False
+        if any(not torch.allclose(e, a, atol=1e-3, rtol=1e-3)
+               for e_layer, a_layer in zip(expected_past, actual_past)
+               for e, a in zip(e_layer, a_layer)):
+            return False
+    return True
+
+
+def export_traced_decoder(model, model_name: str, dtype: str) -> Optional[TracedDecoder]:
+    """
+    Trace a loaded model, validate the graph and save it for later processes
+
+    The graph is traced with a left-padded batch and a non-empty cache, then
+    checked against the eager model on other batch sizes, lengths, cache
+    lengths and masks. Any mismatch (e.g. an architecture whose forward pass
+    branches on tensor values) leaves the caller on the eager model, and a
+    marker next to the artifact path stops later processes from tracing the
+    same checkpoint again.
+
+    Args:
+        model: Loaded eager model on CPU (in eval mode)
+        model_name: Name of the pre-trained model
+        dtype: Dtype key of the loaded weights
+
+    Returns:
+        The traced decoder, or None when tracing or validation failed
+    """
+    config = model.config
+    path = artifact_path(model_name, dtype)
+    if os.path.exists(_failure_marker(path)):
+        logger.info(f"{model_name} is known not to trace; using eager")
+        return None
+    try:
+        with torch.no_grad():
+            input_ids, past, position_ids, attention_mask = _example_inputs(config, 2, 3, 2, padding=1)
+            graph = torch.jit.trace(
+                _DecoderGraph(model).eval(),
+                (input_ids, position_ids, attention_mask, *(t for layer in past for t in layer)),
+                check_trace=False,
+                strict=False,
+            )
+            decoder = TracedDecoder(graph, config)
+
+            cases = [
+                _example_inputs(config, 1, 7, 0),           # Prefill
+                _example_inputs(config, 1, 1, 9),           # Single decode step
+                _example_inputs(config, 3, 1, 6, padding=4),  # Padded batch step
+                _example_inputs(config, 1, 5, 4),           # Speculative verification
+            ]
+            if not _outputs_match(model, decoder, cases):
+                logger.warning(f"Traced decoder for {model_name} does not match the eager model; using eager")
+                _mark_untraceable(path, "traced outputs do not match the eager model")
+                return None
+    except Exception as e:
+        logger.warning(f"Could not trace decoder for {model_name}: {e}")
+        _mark_untraceable(path, f"tracing failed: {e}")
+        return None
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.jit.save(graph, tmp_path)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved traced decoder to {path}")
+    except Exception as e:
+        logger.warning(f"Could not save traced decoder: {e}")
+    return decoder
@@ -0,0 +1,406 @@
+"""
+Continuous batching engine for the shared model
+
+Instead of running fixed batches to completion, the engine steps every active
+sequence by one token at a time, retires sequences as soon as they finish and
+admits waiting requests into the freed slots. Short replies therefore return
+without waiting for long ones that happen to run alongside them.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import torch
+import logging
+from config.settings import BATCHING_CONFIG
+from models.generation import LegacyCache, PrefixState, context_window, model_forward, sample_next_token, sampling_params
+
+logger = logging.getLogger(__name__)
+
+_END_OF_STREAM = None
+
+
+class StreamingRequest:
+    """
+    A prompt submitted to the engine, consumable as a token stream or a future
+    """
+
+    def __init__(self, input_ids: List[int], max_new_tokens: int, params: Dict[str, Any],
+                 should_stop: Optional[Callable[[List[int]], bool]] = None,
+                 prefix: Optional[PrefixState] = None):
+        """
+        Args:
+            input_ids: Token ids of the full prompt
+            max_new_tokens: Maximum number of tokens to generate
+            params: Sampling parameters
+            should_stop: Optional callback deciding from the generated ids whether to stop
+            prefix: Precomputed state of a shared prompt prefix to start from
+        """
+        self.input_ids = input_ids
+        self.max_new_tokens = max_new_tokens
+        self.params = params
+        self.should_stop = should_stop
+        self.prefix = prefix
+        self.generated: List[int] = []
+        self.future: Future = Future()
+        self.cancelled = False
+        self.enqueued_at = time.perf_counter()
+        self._tokens: "queue.Queue[Optional[int]]" = queue.Queue()
+
+    def emit(self, token_id: int):
+        """Record a generated token"""
+        self.generated.append(token_id)
+        self._tokens.put(token_id)
+
+    def finish(self, error: Optional[Exception] = None):
+        """Mark the request as done"""
+        if self.future.done():
+            return
+        self._tokens.put(_END_OF_STREAM)
+        if error is not None:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(self.generated)
+
+    def cancel(self):
+        """Ask the engine to stop generating for this request"""
+        self.cancelled = True
+
+    def iter_tokens(self, timeout: Optional[float] = None) -> Iterator[int]:
+        """
+        Yield generated token ids as the engine produces them
+
+        Args:
+            timeout: Seconds to wait for each token (None waits forever)
+
+        Raises:
+            TimeoutError: If no token arrives within the timeout
+        """
+        while True:
+            try:
+                token_id = self._tokens.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"No token generated within {timeout}s") from None
+            if token_id is _END_OF_STREAM:
+                break
+            yield token_id
+        # Surface engine errors to stream consumers as well
+        self.future.result()
+
+    def is_done(self) -> bool:
+        """Whether the request has used up its budget or hit a stop condition"""
+        if self.cancelled or len(self.generated) >= self.max_new_tokens:
+            return True
+        return self.should_stop is not None and self.should_stop(self.generated)
+
+
+class ContinuousBatchingEngine:
+    """
+    Token-level scheduler that keeps a running batch of sequences on the shared model
+    """
+
+    def __init__(self, shared_model, max_batch_size: int = None):
+        """
+        Args:
+            shared_model: Shared model to generate with
+            max_batch_size: Maximum number of sequences decoded together
+        """
+        self.shared_model = shared_model
+        self.max_batch_size = max_batch_size or BATCHING_CONFIG["max_batch_size"]
+        self.context_window = context_window(shared_model.model)
+
+        self._waiting: "queue.Queue[StreamingRequest]" = queue.Queue()
+        self._running = True
+
+        # Running batch: one row per active sequence
+        self._active: List[StreamingRequest] = []
+        self._past: Optional[LegacyCache] = None
+        self._attention_mask: Optional[torch.Tensor] = None
+        self._lengths: Optional[torch.Tensor] = None
+        self._pending: Optional[torch.Tensor] = None
+        self._seen: Optional[torch.Tensor] = None
+
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "requests": 0,
+            "completed": 0,
+            "steps": 0,
+            "active_row_steps": 0,
+            "tokens_generated": 0,
+            "max_queue_depth": 0,
+            "queue_wait_seconds": 0.0,
+            "generation_seconds": 0.0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name="voxen-continuous-batching", daemon=True)
+        self._thread.start()
+        logger.info(f"ContinuousBatchingEngine started (max_batch_size={self.max_batch_size})")
+
+    def submit(self, input_ids: List[int], max_new_tokens: int,
+               params: Optional[Dict[str, Any]] = None,
+               should_stop: Optional[Callable[[List[int]], bool]] = None,
+               prefix: Optional[PrefixState] = None) -> StreamingRequest:
+        """
+        Queue a prompt for generation
+
+        Args:
+            input_ids: Token ids of the full prompt
+            max_new_tokens: Maximum number of tokens to generate
+            params: Sampling parameters (defaults to MODEL_CONFIG)
+            should_stop: Optional callback deciding from the generated ids whether to stop
+            prefix: Precomputed state of a shared prompt prefix to start from
+
+        Returns:
+            The request; iterate ``iter_tokens()`` or wait on ``future``
+        """
+        if not self._running:
+            raise RuntimeError("ContinuousBatchingEngine has been stopped")
+
+        request = StreamingRequest(input_ids, max_new_tokens, params or sampling_params(), should_stop, prefix)
+        self._waiting.put(request)
+        with self._metrics_lock:
+            self._metrics["requests"] += 1
+            self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], self._waiting.qsize())
+        return request
+
+    def _run(self):
+        """Engine loop: admit, step, retire"""
+        while self._running:
+            try:
+                self._admit()
+                if not self._active:
+                    continue
+                started = time.perf_counter()
+                self._step()
+                with self._metrics_lock:
+                    self._metrics["generation_seconds"] += time.perf_counter() - started
+            except Exception as e:
+                logger.error(f"Error in continuous batching step: {e}")
+                for request in self._active:
+                    request.finish(e)
+                self._reset_batch()
+
+    def _reset_batch(self):
+        """Drop the running batch"""
+        self._active = []
+        self._past = self._attention_mask = self._lengths = self._pending = self._seen = None
+
+    def _admit(self):
+        """Move waiting requests into free slots of the running batch"""
+        while len(self._active) < self.max_batch_size:
+            try:
+                # Block briefly only when there is nothing to decode
+                request = self._waiting.get(timeout=0.5) if not self._active else self._waiting.get_nowait()
+            except queue.Empty:
+                return
+            if request.cancelled:
+                request.finish()
+                continue
+            with self._metrics_lock:
+                self._metrics["queue_wait_seconds"] += time.perf_counter() - request.enqueued_at
+            try:
+                self._prefill(request)
+            except Exception as e:
+                logger.error(f"Error prefilling request: {e}")
+                request.finish(e)
+
+    def _prefill(self, request: StreamingRequest):
+        """Run a new request's prompt and merge it into the running batch"""
+        shared = self.shared_model
+        device = shared.device
+        input_ids = request.input_ids[-(self.context_window - 1):]
+
+        # Start from the shared prefix state when the prompt begins with it
+        prefix = request.prefix
+        if prefix is not None and prefix.matches(input_ids):
+            past, new_ids = prefix.past, input_ids[len(prefix):]
+        else:
+            past, new_ids = None, input_ids
+
+        with torch.no_grad():
+            logits, past = model_forward(shared.model, torch.tensor([new_ids], device=device), past_key_values=past)
+
+        seen = torch.zeros((1, shared.model.config.vocab_size), dtype=torch.bool, device=device)
+        seen[0, torch.tensor(input_ids, device=device)] = True
+        token = sample_next_token(logits, seen, **request.params)
+        if self._accept(request, int(token[0]), len(input_ids)):
+            return
+
+        seen[0, token] = True
+        attention_mask = torch.ones((1, len(input_ids)), dtype=torch.long, device=device)
+        lengths = torch.tensor([len(input_ids)], device=device)
+        self._merge(request, past, attention_mask, lengths, token, seen)
+
+    def _accept(self, request: StreamingRequest, token_id: int, length: int) -> bool:
+        """
+        Hand a sampled token to its request
+
+        Returns:
+            True when the request is finished
+        """
+        eos_token_id = self.shared_model.tokenizer.eos_token_id
+        if token_id == eos_token_id:
+            self._complete(request)
+            return True
+
+        request.emit(token_id)
+        if request.is_done() or length + 1 >= self.context_window:
+            self._complete(request)
+            return True
+        return False
+
+    def _complete(self, request: StreamingRequest):
+        """Finish a request and update metrics"""
+        request.finish()
+        with self._metrics_lock:
+            self._metrics["completed"] += 1
+            self._metrics["tokens_generated"] += len(request.generated)
+
+    def _merge(self, request: StreamingRequest, past: LegacyCache, attention_mask: torch.Tensor,
+               lengths: torch.Tensor, pending: torch.Tensor, seen: torch.Tensor):
+        """Append a prefilled sequence to the running batch, left-padding to a common length"""
+        if not self._active:
+            self._active = [request]
+            self._past, self._attention_mask = past, attention_mask
+            self._lengths, self._pending, self._seen = lengths, pending, seen
+            return
+
+        batch_len = self._attention_mask.shape[-1]
+        new_len = attention_mask.shape[-1]
+        target = max(batch_len, new_len)
+
+        self._past = tuple(
+            (torch.cat([_pad_left(bk, target), _pad_left(nk, target)], dim=0),
+             torch.cat([_pad_left(bv, target), _pad_left(nv, target)], dim=0))
+            for (bk, bv), (nk, nv) in zip(self._past, past)
+        )
+        self._attention_mask = torch.cat(
+            [_pad_left(self._attention_mask, target, dim=-1), _pad_left(attention_mask, target, dim=-1)], dim=0
+        )
+        self._lengths = torch.cat([self._lengths, lengths])
+        self._pending = torch.cat([self._pending, pending])
+        self._seen = torch.cat([self._seen, seen])
+        self._active.append(request)
+
+    def _step(self):
+        """Decode one token for every active sequence and retire finished ones"""
+        shared = self.shared_model
+        device = shared.device
+        batch_size = len(self._active)
+
+        attention_mask = torch.cat(
+            [self._attention_mask, self._attention_mask.new_ones((batch_size, 1))], dim=-1
+        )
+        with torch.no_grad():
+            logits, past = model_forward(
+                shared.model,
+                self._pending.unsqueeze(-1),
+                past_key_values=self._past,
+                position_ids=self._lengths.unsqueeze(-1),
+                attention_mask=attention_mask,
+            )
+        self._past, self._attention_mask = past, attention_mask
+        self._lengths = self._lengths + 1
+
+        # Rows may use different sampling parameters; sample each group separately
+        tokens = torch.empty(batch_size, dtype=torch.long, device=device)
+        groups: Dict[tuple, List[int]] = {}
+        for row, request in enumerate(self._active):
+            groups.setdefault(tuple(sorted(request.params.items())), []).append(row)
+        for rows in groups.values():
+            index = torch.tensor(rows, device=device)
+            params = self._active[rows[0]].params
+            tokens[index] = sample_next_token(logits[index], self._seen[index], **params)
+
+        keep = []
+        for row, (request, token_id) in enumerate(zip(self._active, tokens.tolist())):
+            if not self._accept(request, token_id, int(self._lengths[row])):
+                keep.append(row)
+
+        self._seen[torch.arange(batch_size, device=device), tokens] = True
+        self._pending = tokens
+
+        with self._metrics_lock:
+            self._metrics["steps"] += 1
+            self._metrics["active_row_steps"] += batch_size
+
+        if len(keep) < batch_size:
+            self._retire(keep)
+
+    def _retire(self, keep: List[int]):
+        """Drop finished rows from the running batch"""
+        if not keep:
+            self._reset_batch()
+            return
+
+        index = torch.tensor(keep, device=self.shared_model.device)
+        self._active = [self._active[row] for row in keep]
+        attention_mask = self._attention_mask.index_select(0, index)
+
+        # Trim leading columns that are padding for every remaining row
+        offset = int((attention_mask.sum(dim=0) > 0).nonzero()[0])
+        self._attention_mask = attention_mask[:, offset:]
+        self._past = tuple(
+            (key.index_select(0, index)[:, :, offset:], value.index_select(0, index)[:, :, offset:])
+            for key, value in self._past
+        )
+        self._lengths = self._lengths.index_select(0, index)
+        self._pending = self._pending.index_select(0, index)
+        self._seen = self._seen.index_select(0, index)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get queue depth, slot occupancy and throughput metrics"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+
+        steps = metrics["steps"]
+        completed = metrics["completed"]
+        metrics.update({
+            "mode": "continuous",
+            "queue_depth": self._waiting.qsize(),
+            "active_sequences": len(self._active),
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_size": metrics["active_row_steps"] / steps if steps else 0.0,
+            "avg_batch_fill": metrics["active_row_steps"] / (steps * self.max_batch_size) if steps else 0.0,
+            "avg_queue_wait_ms": metrics["queue_wait_seconds"] * 1000 / completed if completed else 0.0,
+            "tokens_per_second": (
+                metrics["tokens_generated"] / metrics["generation_seconds"]
+                if metrics["generation_seconds"] else 0.0
+            ),
+        })
+        return metrics
+
+    def stop(self):
+        """Stop the engine; active and waiting requests are failed"""
+        self._running = False
+        self._thread.join(timeout=5)
+        error = RuntimeError("ContinuousBatchingEngine has been stopped")
+        for request in self._active:
+            request.finish(error)
+        while not self._waiting.empty():
+            self._waiting.get_nowait().finish(error)
+        self._reset_batch()
+        logger.info("ContinuousBatchingEngine stopped")
+
+
+def _pad_left(tensor: torch.Tensor, length: int, dim: int = -2) -> torch.Tensor:
+    """Zero-pad ``tensor`` on the left of ``dim`` up to ``length``"""
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=dim)
+
+
+_engine_lock = threading.Lock()
+
+
+def get_generation_engine(shared_model) -> ContinuousBatchingEngine:
+    """Get the continuous batching engine of a shared model, starting it on first use"""
+    with _engine_lock:
+        if shared_model.generation_engine is None:
+            shared_model.generation_engine = ContinuousBatchingEngine(shared_model)
+        return shared_model.generation_engine
@@ -0,0 +1,156 @@
+"""
+Streaming conversation export
+
+Exports are produced message by message as text chunks, so a conversation
+of any length (including one paged in from the conversation store) can be
+written to a file or an HTTP response with flat memory. The "json" format
+matches ``json.dumps(messages, indent=2)`` byte for byte; "jsonl" writes
+one message per line and "txt" is the readable transcript.
+"""
+
+import json
+from itertools import groupby
+from typing import IO, Iterable, Iterator, Tuple
+import logging
+from models.conversation_store import get_conversation_store
+from models.message_store import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("json", "jsonl", "txt")
+
+TXT_HEADER = "AI Chat Conversation\n" + "=" * 30 + "\n\n"
+
+
+def _check_format(format: str):
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {format}")
+
+
+def _indented_json(value, level: int) -> str:
+    """``value`` as it appears nested ``level`` deep in ``json.dumps(..., indent=2)``"""
+    indent = "  " * level
+    return indent + json.dumps(value, indent=2).replace("\n", "\n" + indent)
+
+
+def _txt_entry(message: ChatMessage) -> str:
+    role = "User" if message.role == "user" else "Assistant"
+    return f"[{message.iso_timestamp}] {role}:\n{message.content}\n\n"
+
+
+def iter_export(messages: Iterable[ChatMessage], format: str = "json") -> Iterator[str]:
+    """
+    Export messages as a stream of text chunks
+
+    Args:
+        messages: Messages, oldest first (consumed lazily)
+        format: 'json', 'jsonl' or 'txt'
+
+    Yields:
+        Chunks whose concatenation is the export
+    """
+    _check_format(format)
+    if format == "txt":
+        yield TXT_HEADER
+        for message in messages:
+            yield _txt_entry(message)
+    elif format == "jsonl":
+        for message in messages:
+            yield json.dumps(message.to_dict()) + "\n"
+    else:
+        separator = "[\n"
+        for message in messages:
+            yield separator + _indented_json(message.to_dict(), 1)
+            separator = ",\n"
+        yield "[]" if separator == "[\n" else "\n]"
+
+
+def iter_bulk_export(sessions: Iterable[Tuple[str, Iterable[ChatMessage]]],
+                     format: str = "jsonl") -> Iterator[str]:
+    """
+    Export many conversations as one stream
+
+    "json" produces an object mapping session ids to message lists, "jsonl"
+    one line per message with its ``session_id``, and "txt" one transcript
+    section per conversation.
+
+    Args:
+        sessions: (session id, messages) pairs, each consumed lazily
+        format: 'json', 'jsonl' or 'txt'
+
+    Yields:
+        Chunks whose concatenation is the export
+    """
+    _check_format(format)
+    if format == "txt":
+        yield TXT_HEADER
+        for session_id, messages in sessions:
+            yield f"Session {session_id}\n" + "-" * 30 + "\n\n"
+            for message in messages:
+                yield _txt_entry(message)
+    elif format == "jsonl":
+        for session_id, messages in sessions:
+            for message in messages:
+                yield json.dumps({"session_id": session_id, **message.to_dict()}) + "\n"
+    else:
+        session_separator = "{\n"
+        for session_id, messages in sessions:
+            yield f"{session_separator}  {json.dumps(session_id)}: "
+            session_separator = ",\n"
+            separator = "[\n"
+            for message in messages:
+                yield separator + _indented_json(message.to_dict(), 2)
+                separator = ",\n"
+            yield "[]" if separator == "[\n" else "\n  ]"
+        yield "{}" if session_separator == "{\n" else "\n}"
+
+
+def write_export(chunks: Iterable[str], fp: IO[str]) -> int:
+    """
+    Write an export stream to a text file-like object
+
+    Args:
+        chunks: Output of ``iter_export`` or ``iter_bulk_export``
+        fp: Destination (file, socket writer, response body, ...)
+
+    Returns:
+        Number of characters written
+    """
+    written = 0
+    for chunk in chunks:
+        fp.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def iter_store_sessions(store, page_size: int = None) -> Iterator[Tuple[str, Iterator[ChatMessage]]]:
+    """
+    Every stored conversation in one pass over the conversation store
+
+    Args:
+        store: ``ConversationStore`` to read
+        page_size: Messages read per query
+
+    Yields:
+        (session id, messages) pairs for ``iter_bulk_export``
+    """
+    rows = store.iter_all(page_size)
+    for session_id, group in groupby(rows, key=lambda row: row[0]):
+        yield session_id, (message for _, _, message in group)
+
+
+def export_store(fp: IO[str], format: str = "jsonl", store=None) -> int:
+    """
+    Bulk-export every stored conversation to a text file-like object
+
+    Args:
+        fp: Text destination
+        format: 'json', 'jsonl' or 'txt'
+        store: ``ConversationStore`` to read (the shared one when None)
+
+    Returns:
+        Number of characters written
+    """
+    if store is None:
+        store = get_conversation_store()
+    return write_export(iter_bulk_export(iter_store_sessions(store), format), fp)
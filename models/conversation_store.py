@@ -0,0 +1,424 @@
+"""
+Persistent conversation storage
+
+Messages are appended to a SQLite database in WAL mode under
+PATHS["data_dir"]. Appends are buffered and written in batches, one
+transaction (and so one group of fsyncs) per batch, either when the batch is
+full or after a short interval. Conversations are read back in pages keyed by
+message sequence number, so reopening a long conversation only loads what
+is asked for.
+
+The log is append-only: clearing a conversation records the sequence
+number below which its messages are hidden, and a periodic compaction job
+deletes hidden and expired messages and truncates the WAL.
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import logging
+from config.settings import PATHS, STORAGE_CONFIG
+from models.message_store import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    metadata TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    cleared_seq INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+"""
+
+# SQLite limits the number of bound parameters per statement
+MAX_QUERY_PARAMS = 500
+
+StoredMessage = Tuple[int, ChatMessage]
+
+
+class ConversationStore:
+    """
+    Append-only message log with batched writes and paged reads
+    """
+
+    def __init__(self, path: Optional[str] = None, batch_size: int = None,
+                 flush_interval_ms: float = None, synchronous: str = None,
+                 compaction_interval_seconds: float = None, retention_days: float = None):
+        """
+        Args:
+            path: Database file (defaults to STORAGE_CONFIG["filename"] under PATHS["data_dir"])
+            batch_size: Buffered messages that trigger an immediate write
+            flush_interval_ms: Longest time a message stays buffered
+            synchronous: SQLite synchronous mode ("FULL" syncs every batch, "NORMAL" only at checkpoints)
+            compaction_interval_seconds: Time between background compactions (0 disables them)
+            retention_days: Conversations idle this long are deleted on compaction (0 keeps them)
+        """
+        self.path = path or os.path.join(PATHS["data_dir"], STORAGE_CONFIG["filename"])
+        self.batch_size = batch_size or STORAGE_CONFIG["batch_size"]
+        self.flush_interval = (flush_interval_ms if flush_interval_ms is not None
+                               else STORAGE_CONFIG["flush_interval_ms"]) / 1000
+        self.compaction_interval = (compaction_interval_seconds if compaction_interval_seconds is not None
+                                    else STORAGE_CONFIG["compaction_interval_seconds"])
+        self.retention_days = retention_days if retention_days is not None else STORAGE_CONFIG["retention_days"]
+        synchronous = (synchronous or STORAGE_CONFIG["synchronous"]).upper()
+        if synchronous not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"Unsupported synchronous mode: {synchronous}")
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Transactions are managed explicitly; one connection is shared under the lock
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={synchronous}")
+        self._conn.executescript(SCHEMA)
+
+        self._lock = threading.RLock()
+        self._pending: List[tuple] = []
+        # Next sequence number of each conversation written through this store
+        self._next_seqs: Dict[str, int] = {}
+        self._stats = {"appended": 0, "flushes": 0, "compactions": 0, "write_errors": 0,
+                       "seq_conflicts": 0}
+        self._last_compaction = time.monotonic()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="conversation-store", daemon=True)
+        self._flusher.start()
+        logger.info(f"Conversation store opened at {self.path}")
+
+    def _flush_loop(self):
+        """Write buffered messages periodically and run compaction when due"""
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+                if self.compaction_interval and time.monotonic() - self._last_compaction >= self.compaction_interval:
+                    self.compact()
+            except Exception as e:
+                logger.error(f"Conversation store background job failed: {e}")
+
+    def append(self, session_id: str, message: ChatMessage) -> int:
+        """
+        Buffer a message for writing
+
+        The store assigns sequence numbers, so every writer of a conversation
+        in this process gets distinct ones.
+
+        Args:
+            session_id: Conversation the message belongs to
+            message: The message
+
+        Returns:
+            Sequence number of the message within the conversation
+        """
+        metadata = json.dumps(message.metadata, default=str)
+        with self._lock:
+            seq = self.next_seq(session_id)
+            self._next_seqs[session_id] = seq + 1
+            self._pending.append((session_id, seq, message.role, message.content, message.timestamp, metadata))
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+        return seq
+
+    def flush(self):
+        """Write every buffered message in one transaction"""
+        with self._lock:
+            if not self._pending:
+                return
+            rows, self._pending = self._pending, []
+            sessions: Dict[str, float] = {}
+            for row in rows:
+                sessions[row[0]] = max(sessions.get(row[0], 0.0), row[4])
+            try:
+                self._conn.execute("BEGIN")
+                for row in rows:
+                    self._insert_message(row)
+                self._conn.executemany(
+                    "INSERT INTO sessions (session_id, updated_at) VALUES (?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET updated_at = excluded.updated_at",
+                    sessions.items())
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                # BEGIN itself can fail (e.g. "database is locked"), leaving nothing to roll back
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                # Keep the batch for the next attempt
+                self._pending = rows + self._pending
+                self._stats["write_errors"] += 1
+                logger.error(f"Could not write {len(rows)} messages: {e}")
+                return
+            self._stats["appended"] += len(rows)
+            self._stats["flushes"] += 1
+
+    def _insert_message(self, row: tuple):
+        """
+        Append one message row inside the current transaction
+
+        Sequence numbers are unique within this process, but another process
+        writing the same conversation may already have used one; the message
+        is then appended after the conversation's last one instead of
+        overwriting it, and later appends continue from there.
+        """
+        try:
+            self._conn.execute(
+                "INSERT INTO messages (session_id, seq, role, content, timestamp, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?)", row)
+        except sqlite3.IntegrityError:
+            session_id, seq = row[0], row[1]
+            last = self._conn.execute(
+                "SELECT MAX(seq) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+            logger.warning(f"Sequence {seq} of conversation {session_id} is already taken; "
+                           f"storing the message as {last + 1}")
+            self._conn.execute(
+                "INSERT INTO messages (session_id, seq, role, content, timestamp, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (session_id, last + 1, *row[2:]))
+            self._next_seqs[session_id] = max(self._next_seqs.get(session_id, 0), last + 2)
+            self._stats["seq_conflicts"] += 1
+
+    def _cleared_seq(self, session_id: str) -> int:
+        """Sequence number below which a conversation's messages are hidden"""
+        row = self._conn.execute(
+            "SELECT cleared_seq FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _message(row: tuple) -> StoredMessage:
+        seq, role, content, timestamp, metadata = row
+        return seq, ChatMessage(role, content, timestamp, json.loads(metadata))
+
+    def next_seq(self, session_id: str) -> int:
+        """Sequence number the next message of a conversation will get"""
+        with self._lock:
+            if session_id not in self._next_seqs:
+                self.flush()
+                row = self._conn.execute(
+                    "SELECT MAX(seq) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+                last = row[0] if row[0] is not None else -1
+                self._next_seqs[session_id] = max(last + 1, self._cleared_seq(session_id))
+            return self._next_seqs[session_id]
+
+    def count(self, session_id: str) -> int:
+        """Number of visible messages in a conversation"""
+        with self._lock:
+            self.flush()
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ? AND seq >= ?",
+                (session_id, self._cleared_seq(session_id))).fetchone()
+            return row[0]
+
+    def recent(self, session_id: str, limit: int) -> List[StoredMessage]:
+        """
+        Last messages of a conversation
+
+        Args:
+            session_id: Conversation to read
+            limit: Maximum number of messages
+
+        Returns:
+            (seq, message) pairs, oldest first
+        """
+        with self._lock:
+            self.flush()
+            rows = self._conn.execute(
+                "SELECT seq, role, content, timestamp, metadata FROM messages "
+                "WHERE session_id = ? AND seq >= ? ORDER BY seq DESC LIMIT ?",
+                (session_id, self._cleared_seq(session_id), limit)).fetchall()
+        return [self._message(row) for row in reversed(rows)]
+
+    def page(self, session_id: str, after_seq: int = -1, limit: int = None) -> List[StoredMessage]:
+        """
+        One page of a conversation in sequence order
+
+        Args:
+            session_id: Conversation to read
+            after_seq: Only messages after this sequence number
+            limit: Page size (defaults to STORAGE_CONFIG["page_size"])
+
+        Returns:
+            (seq, message) pairs, oldest first
+        """
+        with self._lock:
+            self.flush()
+            start = max(after_seq + 1, self._cleared_seq(session_id))
+            rows = self._conn.execute(
+                "SELECT seq, role, content, timestamp, metadata FROM messages "
+                "WHERE session_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (session_id, start, limit or STORAGE_CONFIG["page_size"])).fetchall()
+        return [self._message(row) for row in rows]
+
+    def iter_messages(self, session_id: str, page_size: int = None) -> Iterator[StoredMessage]:
+        """
+        Every visible message of a conversation, read one page at a time
+
+        Yields:
+            (seq, message) pairs, oldest first
+        """
+        after_seq = -1
+        while True:
+            page = self.page(session_id, after_seq, page_size)
+            yield from page
+            if len(page) < (page_size or STORAGE_CONFIG["page_size"]):
+                return
+            after_seq = page[-1][0]
+
+    def iter_all(self, page_size: int = None) -> Iterator[Tuple[str, int, ChatMessage]]:
+        """
+        Every visible message of every conversation in one ordered scan
+
+        Yields:
+            (session id, seq, message) tuples ordered by session id, then seq
+        """
+        page_size = page_size or STORAGE_CONFIG["page_size"]
+        after = ("", -1)
+        while True:
+            with self._lock:
+                self.flush()
+                rows = self._conn.execute(
+                    "SELECT m.session_id, m.seq, m.role, m.content, m.timestamp, m.metadata "
+                    "FROM messages m LEFT JOIN sessions s ON s.session_id = m.session_id "
+                    "WHERE (m.session_id, m.seq) > (?, ?) AND m.seq >= COALESCE(s.cleared_seq, 0) "
+                    "ORDER BY m.session_id, m.seq LIMIT ?", (*after, page_size)).fetchall()
+            for row in rows:
+                yield (row[0], *self._message(row[1:]))
+            if len(rows) < page_size:
+                return
+            after = (rows[-1][0], rows[-1][1])
+
+    def get_messages(self, session_id: str, seqs: List[int]) -> List[ChatMessage]:
+        """
+        Messages of a conversation by sequence number
+
+        Args:
+            session_id: Conversation to read
+            seqs: Sequence numbers to fetch
+
+        Returns:
+            The messages in the order of ``seqs`` (missing ones are skipped)
+        """
+        found: Dict[int, ChatMessage] = {}
+        with self._lock:
+            self.flush()
+            for start in range(0, len(seqs), MAX_QUERY_PARAMS):
+                chunk = seqs[start:start + MAX_QUERY_PARAMS]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    "SELECT seq, role, content, timestamp, metadata FROM messages "
+                    f"WHERE session_id = ? AND seq IN ({placeholders})", (session_id, *chunk)).fetchall()
+                found.update(self._message(row) for row in rows)
+        return [found[seq] for seq in seqs if seq in found]
+
+    def list_sessions(self) -> List[str]:
+        """Ids of the stored conversations, most recently updated first"""
+        with self._lock:
+            self.flush()
+            rows = self._conn.execute("SELECT session_id FROM sessions ORDER BY updated_at DESC").fetchall()
+        return [row[0] for row in rows]
+
+    def clear_session(self, session_id: str):
+        """
+        Hide every message of a conversation written so far
+
+        The messages are deleted by the next compaction.
+
+        Args:
+            session_id: Conversation to clear
+        """
+        with self._lock:
+            next_seq = self.next_seq(session_id)
+            self.flush()
+            # Also hide what other processes have written to the conversation
+            last = self._conn.execute(
+                "SELECT MAX(seq) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+            if last is not None:
+                next_seq = max(next_seq, last + 1)
+            self._next_seqs[session_id] = next_seq
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, cleared_seq, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET cleared_seq = excluded.cleared_seq, "
+                "updated_at = excluded.updated_at",
+                (session_id, next_seq, time.time()))
+
+    def compact(self, vacuum: bool = False) -> Dict[str, int]:
+        """
+        Delete cleared and expired messages and truncate the WAL
+
+        Args:
+            vacuum: Also rebuild the database file to return freed pages to the OS
+
+        Returns:
+            Numbers of deleted messages and sessions
+        """
+        with self._lock:
+            self.flush()
+            self._conn.execute("BEGIN")
+            try:
+                deleted = self._conn.execute(
+                    "DELETE FROM messages WHERE seq < COALESCE("
+                    "(SELECT cleared_seq FROM sessions WHERE sessions.session_id = messages.session_id), 0)"
+                ).rowcount
+                expired_sessions = 0
+                if self.retention_days:
+                    cutoff = time.time() - self.retention_days * 86400
+                    deleted += self._conn.execute(
+                        "DELETE FROM messages WHERE session_id IN "
+                        "(SELECT session_id FROM sessions WHERE updated_at < ?)", (cutoff,)).rowcount
+                    expired_sessions = self._conn.execute(
+                        "DELETE FROM sessions WHERE updated_at < ?", (cutoff,)).rowcount
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+            if expired_sessions:
+                # Expired conversations start again from 0; the rest reload on next use
+                self._next_seqs.clear()
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if vacuum:
+                self._conn.execute("VACUUM")
+            self._stats["compactions"] += 1
+            self._last_compaction = time.monotonic()
+
+        if deleted or expired_sessions:
+            logger.info(f"Compacted conversation store: {deleted} messages, {expired_sessions} sessions deleted")
+        return {"deleted_messages": deleted, "deleted_sessions": expired_sessions}
+
+    def close(self):
+        """Write buffered messages and close the database"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._flusher.join()
+        with self._lock:
+            self.flush()
+            self._conn.close()
+        logger.info("Conversation store closed")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get write counters and buffer size"""
+        with self._lock:
+            return {"path": self.path, "pending": len(self._pending), **self._stats}
+
+
+_conversation_store: Optional[ConversationStore] = None
+_conversation_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Get the process-wide conversation store configured by STORAGE_CONFIG"""
+    global _conversation_store
+    with _conversation_store_lock:
+        if _conversation_store is None:
+            _conversation_store = ConversationStore()
+            atexit.register(_conversation_store.close)
+        return _conversation_store
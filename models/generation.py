@@ -0,0 +1,536 @@
+"""
+Token-level generation primitives shared by the Voxen models
+
+The decode loop is written against the plain model forward pass (instead of
+``model.generate``) so that key/value caches can be kept between calls.
+"""
+
+import contextlib
+import torch
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import logging
+from config.settings import MODEL_CONFIG
+
+try:
+    from transformers import DynamicCache
+except ImportError:  # Older transformers only understand tuple caches
+    DynamicCache = None
+
+logger = logging.getLogger(__name__)
+
+# Legacy cache layout: one (key, value) pair per layer, each shaped
+# [batch, heads, sequence, head_dim]
+LegacyCache = Tuple[Tuple[torch.Tensor, torch.Tensor], ...]
+
+
+def to_legacy_cache(past: Any) -> Optional[LegacyCache]:
+    """Convert whatever cache a model returned into the legacy tuple layout"""
+    if past is None or isinstance(past, tuple):
+        return past
+    if hasattr(past, "to_legacy_cache"):
+        return past.to_legacy_cache()
+    return tuple((layer.keys, layer.values) for layer in past.layers)
+
+
+def from_legacy_cache(model, past: Optional[LegacyCache]) -> Any:
+    """Convert a legacy tuple cache into the format the model expects"""
+    if past is None or DynamicCache is None:
+        return past
+    if not getattr(model, "_supports_cache_class", True):
+        return past
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(past)
+    cache = DynamicCache()
+    for layer_idx, (key, value) in enumerate(past):
+        cache.update(key, value, layer_idx)
+    return cache
+
+
+def cache_length(past: Optional[LegacyCache]) -> int:
+    """Number of positions held in a legacy cache"""
+    if not past:
+        return 0
+    return past[0][0].shape[-2]
+
+
+def crop_cache(past: Optional[LegacyCache], length: int) -> Optional[LegacyCache]:
+    """Keep only the first ``length`` positions of a legacy cache"""
+    if past is None or length <= 0:
+        return None
+    return tuple((key[:, :, :length], value[:, :, :length]) for key, value in past)
+
+
+def context_window(model) -> int:
+    """Maximum number of positions a model can attend to"""
+    config = model.config
+    return getattr(config, "n_positions", None) or config.max_position_embeddings
+
+
+def common_prefix_length(a: List[int], b: List[int]) -> int:
+    """Length of the shared prefix of two token id lists"""
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+def autocast_for(model, device_type: str):
+    """Autocast context for models loaded in reduced precision"""
+    if getattr(model, "dtype", None) == torch.bfloat16:
+        return torch.autocast(device_type=device_type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def model_forward(model, input_ids: torch.Tensor,
+                  past_key_values: Optional[LegacyCache] = None,
+                  position_ids: Optional[torch.Tensor] = None,
+                  attention_mask: Optional[torch.Tensor] = None,
+                  last_only: bool = True) -> Tuple[torch.Tensor, LegacyCache]:
+    """
+    Run one forward pass and return last-position logits and the updated cache
+
+    Args:
+        model: Causal language model
+        input_ids: Token ids shaped [batch, new_tokens]
+        past_key_values: Legacy cache for the positions before ``input_ids``
+        position_ids: Explicit positions for ``input_ids`` (defaults to continuing the cache)
+        attention_mask: Mask over cached plus new positions
+        last_only: Return only the last position's logits
+
+    Returns:
+        Tuple of (logits for the last position [batch, vocab], or for every new
+        position [batch, new_tokens, vocab] when ``last_only`` is False, legacy cache)
+    """
+    if position_ids is None:
+        start = cache_length(past_key_values)
+        position_ids = torch.arange(
+            start, start + input_ids.shape[-1], device=input_ids.device
+        ).unsqueeze(0).expand(input_ids.shape[0], -1)
+
+    with autocast_for(model, input_ids.device.type):
+        outputs = model(
+            input_ids=input_ids,
+            past_key_values=from_legacy_cache(model, past_key_values),
+            position_ids=position_ids,
+            attention_mask=attention_mask,
+            use_cache=True,
+        )
+    logits = outputs.logits[:, -1, :] if last_only else outputs.logits
+    return logits, to_legacy_cache(outputs.past_key_values)
+
+
+def sample_next_token(logits: torch.Tensor, seen: torch.Tensor, temperature: float = 1.0,
+                      top_p: float = 1.0, do_sample: bool = True,
+                      repetition_penalty: float = 1.0) -> torch.Tensor:
+    """
+    Pick the next token for every row of a batch
+
+    Args:
+        logits: Next-token logits shaped [batch, vocab]
+        seen: Boolean mask [batch, vocab] of tokens already in each sequence
+        temperature: Sampling temperature
+        top_p: Nucleus sampling threshold
+        do_sample: Sample when True, otherwise pick greedily
+        repetition_penalty: Penalty applied to logits of seen tokens
+
+    Returns:
+        Token ids shaped [batch]
+    """
+    logits = logits.float()
+
+    if repetition_penalty != 1.0:
+        penalized = torch.where(logits < 0, logits * repetition_penalty, logits / repetition_penalty)
+        logits = torch.where(seen, penalized, logits)
+
+    if not do_sample:
+        return logits.argmax(dim=-1)
+
+    logits = logits / max(temperature, 1e-5)
+
+    if top_p < 1.0:
+        sorted_logits, sorted_indices = torch.sort(logits, descending=True, dim=-1)
+        sorted_probs = torch.softmax(sorted_logits, dim=-1)
+        # Drop tokens once the probability mass before them exceeds top_p
+        remove = (sorted_probs.cumsum(dim=-1) - sorted_probs) > top_p
+        sorted_logits = sorted_logits.masked_fill(remove, float("-inf"))
+        logits = torch.full_like(logits, float("-inf")).scatter(-1, sorted_indices, sorted_logits)
+
+    probs = torch.softmax(logits, dim=-1)
+    return torch.multinomial(probs, num_samples=1).squeeze(-1)
+
+
+def sampling_params(overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Sampling parameters from MODEL_CONFIG with optional overrides"""
+    params = {
+        "temperature": MODEL_CONFIG["temperature"],
+        "do_sample": MODEL_CONFIG["do_sample"],
+        "top_p": MODEL_CONFIG["top_p"],
+        "repetition_penalty": MODEL_CONFIG["repetition_penalty"],
+    }
+    params.update(overrides or {})
+    return params
+
+
+class PrefixState:
+    """
+    Token ids and key/value cache of a fixed prompt prefix
+
+    The cache tensors are shared read-only between sessions; extending a
+    cache always builds new tensors, so the prefix itself is never modified.
+    """
+
+    def __init__(self, text: str, token_ids: List[int], past: LegacyCache):
+        """
+        Args:
+            text: Prefix text
+            token_ids: Token ids of the prefix
+            past: Legacy cache covering ``token_ids``
+        """
+        self.text = text
+        self.token_ids = token_ids
+        self.past = past
+
+    def __len__(self) -> int:
+        return len(self.token_ids)
+
+    def matches(self, input_ids: List[int]) -> bool:
+        """Whether ``input_ids`` start with this prefix"""
+        return len(input_ids) > len(self.token_ids) and input_ids[:len(self.token_ids)] == self.token_ids
+
+
+def compute_prefix_state(model, tokenizer, text: str, device: str = "cpu") -> PrefixState:
+    """
+    Run a prompt prefix through the model once and keep its cache
+
+    Args:
+        model: Causal language model
+        tokenizer: Matching tokenizer
+        text: Prefix text
+        device: Device the model lives on
+
+    Returns:
+        The prefix state
+    """
+    token_ids = tokenizer.encode(text)
+    with torch.no_grad():
+        _, past = model_forward(model, torch.tensor([token_ids], device=device))
+    return PrefixState(text, token_ids, past)
+
+
+class SessionCache:
+    """
+    Key/value cache for one conversation
+
+    Holds the token ids that have been run through the model and their cached
+    keys/values, so the next turn only has to prefill the tokens that changed.
+    """
+
+    def __init__(self, max_tokens: int):
+        """
+        Initialize an empty cache
+
+        Args:
+            max_tokens: Cache size above which the cache is invalidated
+        """
+        self.max_tokens = max_tokens
+        self.token_ids: List[int] = []
+        self.past: Optional[LegacyCache] = None
+        self.reused_tokens = 0
+
+    def reset(self):
+        """Invalidate the cache"""
+        self.token_ids = []
+        self.past = None
+
+    def __len__(self) -> int:
+        return len(self.token_ids)
+
+    def prepare(self, input_ids: List[int], prefix: Optional[PrefixState] = None) -> List[int]:
+        """
+        Align the cache with a new prompt
+
+        Crops the cache to the prefix it shares with ``input_ids`` (for example
+        when older history was trimmed) and returns the tokens still to prefill.
+        When less than the shared ``prefix`` can be reused, the cache is seeded
+        from the prefix state instead. At least one token is always left so the
+        model produces fresh logits.
+
+        Args:
+            input_ids: Token ids of the full new prompt
+            prefix: Precomputed state of a shared prompt prefix
+
+        Returns:
+            The suffix of ``input_ids`` that is not covered by the cache
+        """
+        if len(self.token_ids) > self.max_tokens:
+            logger.debug("KV cache exceeded its size limit; invalidating")
+            self.reset()
+
+        reuse = min(common_prefix_length(self.token_ids, input_ids), len(input_ids) - 1)
+        if prefix is not None and reuse < len(prefix) and prefix.matches(input_ids):
+            self.token_ids = list(prefix.token_ids)
+            self.past = prefix.past
+            reuse = len(prefix)
+        elif reuse < len(self.token_ids):
+            self.past = crop_cache(self.past, reuse)
+            self.token_ids = self.token_ids[:reuse]
+
+        self.reused_tokens = reuse
+        return input_ids[reuse:]
+
+    def extend(self, token_ids: List[int], past: LegacyCache):
+        """Record that ``token_ids`` were fed to the model, producing ``past``"""
+        self.token_ids.extend(token_ids)
+        self.past = past
+
+    def truncate(self, length: int):
+        """Keep only the first ``length`` cached tokens"""
+        if length < len(self.token_ids):
+            self.past = crop_cache(self.past, length)
+            self.token_ids = self.token_ids[:length]
+
+
+def decode(model, input_ids: List[int], cache: SessionCache, max_new_tokens: int,
+           eos_token_id: Optional[int], device: str = "cpu",
+           params: Optional[Dict[str, Any]] = None,
+           prefix: Optional[PrefixState] = None) -> Iterator[int]:
+    """
+    Generate tokens one at a time, reusing and extending a session cache
+
+    The cache is kept consistent after every step, so callers may stop
+    consuming the generator at any point.
+
+    Args:
+        model: Causal language model
+        input_ids: Token ids of the full prompt
+        cache: Session cache to reuse and extend
+        max_new_tokens: Maximum number of tokens to generate
+        eos_token_id: Token id that ends generation
+        device: Device the model lives on
+        params: Sampling parameters (see ``sampling_params``)
+        prefix: Precomputed state of a shared prompt prefix to start from
+
+    Yields:
+        Generated token ids
+    """
+    params = params or sampling_params()
+    seen = torch.zeros((1, model.config.vocab_size), dtype=torch.bool, device=device)
+    seen[0, torch.tensor(input_ids, device=device)] = True
+
+    pending = cache.prepare(input_ids, prefix)
+
+    with torch.no_grad():
+        for _ in range(max_new_tokens):
+            logits, past = model_forward(
+                model,
+                torch.tensor([pending], device=device),
+                past_key_values=cache.past,
+            )
+            cache.extend(pending, past)
+
+            token = sample_next_token(logits, seen, **params)
+            token_id = int(token[0])
+            if eos_token_id is not None and token_id == eos_token_id:
+                return
+
+            yield token_id
+            seen[0, token_id] = True
+            pending = [token_id]
+
+
+def speculative_decode(model, draft_model, input_ids: List[int], cache: SessionCache,
+                       draft_cache: SessionCache, max_new_tokens: int,
+                       eos_token_id: Optional[int], device: str = "cpu",
+                       params: Optional[Dict[str, Any]] = None,
+                       prefix: Optional[PrefixState] = None,
+                       num_draft_tokens: int = 4,
+                       stats: Optional[Dict[str, int]] = None) -> Iterator[int]:
+    """
+    Greedy generation in which a small draft model proposes tokens ahead
+
+    The draft model guesses ``num_draft_tokens`` tokens one at a time; the main
+    model then scores all of them in a single forward pass and keeps the
+    longest prefix that matches its own greedy choice, plus its own token at
+    the first mismatch. Every emitted token is the main model's greedy choice,
+    so the output is the same as ``decode`` with ``do_sample`` off.
+
+    Args:
+        model: Causal language model
+        draft_model: Smaller model sharing the main model's tokenizer
+        input_ids: Token ids of the full prompt
+        cache: Session cache of the main model
+        draft_cache: Session cache of the draft model
+        max_new_tokens: Maximum number of tokens to generate
+        eos_token_id: Token id that ends generation
+        device: Device both models live on
+        params: Sampling parameters (``do_sample`` is ignored; decoding is greedy)
+        prefix: Precomputed state of a shared prompt prefix for the main model
+        num_draft_tokens: Tokens proposed by the draft model per verification step
+        stats: Counters updated in place: "steps", "proposed" and "accepted"
+
+    Yields:
+        Generated token ids
+    """
+    params = dict(params or sampling_params(), do_sample=False)
+    stats = stats if stats is not None else {}
+    for key in ("steps", "proposed", "accepted"):
+        stats.setdefault(key, 0)
+
+    seen = torch.zeros((1, model.config.vocab_size), dtype=torch.bool, device=device)
+    seen[0, torch.tensor(input_ids, device=device)] = True
+
+    pending = cache.prepare(input_ids, prefix)
+    draft_pending = draft_cache.prepare(input_ids)
+    generated = 0
+
+    with torch.no_grad():
+        while generated < max_new_tokens:
+            # Draft: propose tokens one at a time with the small model
+            draft_start = len(draft_cache)
+            draft_seen = seen.clone()
+            proposals: List[int] = []
+            feed = draft_pending
+            for _ in range(min(num_draft_tokens, max_new_tokens - generated - 1)):
+                logits, past = model_forward(
+                    draft_model, torch.tensor([feed], device=device), past_key_values=draft_cache.past
+                )
+                draft_cache.extend(feed, past)
+                token_id = int(sample_next_token(logits, draft_seen, **params)[0])
+                proposals.append(token_id)
+                draft_seen[0, token_id] = True
+                feed = [token_id]
+                if token_id == eos_token_id:
+                    break
+
+            # Verify: score the pending tokens and every proposal in one pass
+            verify_start = len(cache)
+            logits, past = model_forward(
+                model,
+                torch.tensor([pending + proposals], device=device),
+                past_key_values=cache.past,
+                last_only=False,
+            )
+            cache.extend(pending + proposals, past)
+            logits = logits[0, len(pending) - 1:]
+
+            accepted: List[int] = []
+            for position in range(len(proposals) + 1):
+                token_id = int(sample_next_token(logits[position:position + 1], seen, **params)[0])
+                accepted.append(token_id)
+                seen[0, token_id] = True
+                if position == len(proposals) or token_id != proposals[position]:
+                    break
+
+            matched = len(accepted) - 1
+            stats["steps"] += 1
+            stats["proposed"] += len(proposals)
+            stats["accepted"] += matched
+
+            # Drop cached positions of rejected proposals; the main model's own
+            # last token has not been fed to either model yet
+            cache.truncate(verify_start + len(pending) + matched)
+            draft_cache.truncate(draft_start + len(draft_pending) + matched)
+            draft_pending = (draft_pending + accepted)[len(draft_cache) - draft_start:]
+            pending = [accepted[-1]]
+
+            for token_id in accepted:
+                if eos_token_id is not None and token_id == eos_token_id:
+                    return
+                yield token_id
+                generated += 1
+
+
+def left_pad(batch_input_ids: List[List[int]], pad_token_id: int,
+             device: str = "cpu") -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Left-pad prompts of different lengths into one batch
+
+    Args:
+        batch_input_ids: Token ids of each prompt
+        pad_token_id: Token id used for padding
+        device: Device to create the tensors on
+
+    Returns:
+        Tuple of (input_ids, attention_mask, position_ids), each [batch, longest]
+    """
+    longest = max(len(ids) for ids in batch_input_ids)
+    input_ids = torch.full((len(batch_input_ids), longest), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(batch_input_ids), longest), dtype=torch.long)
+    for row, ids in enumerate(batch_input_ids):
+        input_ids[row, longest - len(ids):] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, longest - len(ids):] = 1
+
+    # Positions count real tokens only, so padding does not shift them
+    position_ids = (attention_mask.cumsum(dim=-1) - 1).clamp(min=0)
+    return input_ids.to(device), attention_mask.to(device), position_ids.to(device)
+
+
+def decode_batch(model, batch_input_ids: List[List[int]], max_new_tokens: List[int],
+                 eos_token_id: Optional[int], pad_token_id: int, device: str = "cpu",
+                 params: Optional[Dict[str, Any]] = None,
+                 should_stop: Optional[Callable[[int, List[int]], bool]] = None) -> List[List[int]]:
+    """
+    Generate for several prompts at once in a single padded batch
+
+    Args:
+        model: Causal language model
+        batch_input_ids: Token ids of each prompt
+        max_new_tokens: Token budget of each prompt
+        eos_token_id: Token id that ends a sequence
+        pad_token_id: Token id used for padding
+        device: Device the model lives on
+        params: Sampling parameters shared by the batch (see ``sampling_params``)
+        should_stop: Optional callback (row, generated ids) deciding whether a row is done
+
+    Returns:
+        Generated token ids of each prompt (without the EOS token)
+    """
+    params = params or sampling_params()
+    batch_size = len(batch_input_ids)
+    input_ids, attention_mask, position_ids = left_pad(batch_input_ids, pad_token_id, device)
+
+    seen = torch.zeros((batch_size, model.config.vocab_size), dtype=torch.bool, device=device)
+    for row, ids in enumerate(batch_input_ids):
+        seen[row, torch.tensor(ids, device=device)] = True
+
+    generated: List[List[int]] = [[] for _ in range(batch_size)]
+    finished = [budget <= 0 for budget in max_new_tokens]
+    lengths = attention_mask.sum(dim=-1)
+    past = None
+
+    with torch.no_grad():
+        while not all(finished):
+            logits, past = model_forward(
+                model,
+                input_ids,
+                past_key_values=past,
+                position_ids=position_ids,
+                attention_mask=attention_mask,
+            )
+            tokens = sample_next_token(logits, seen, **params)
+
+            for row, token in enumerate(tokens.tolist()):
+                if finished[row]:
+                    continue
+                if eos_token_id is not None and token == eos_token_id:
+                    finished[row] = True
+                    continue
+                generated[row].append(token)
+                if len(generated[row]) >= max_new_tokens[row] or (
+                        should_stop is not None and should_stop(row, generated[row])):
+                    finished[row] = True
+
+            # Finished rows keep stepping with padding until the batch is done
+            tokens = tokens.masked_fill(
+                torch.tensor(finished, device=device), pad_token_id
+            )
+            seen[torch.arange(batch_size, device=device), tokens] = True
+            input_ids = tokens.unsqueeze(-1)
+            position_ids = lengths.unsqueeze(-1)
+            lengths = lengths + 1
+            attention_mask = torch.cat(
+                [attention_mask, attention_mask.new_ones((batch_size, 1))], dim=-1
+            )
+
+    return generated
@@ -0,0 +1,167 @@
+"""
+Token-budgeted conversation history for prompt assembly
+
+Every message is tokenized once and its ids are cached, so building the next
+prompt only encodes the newest user turn. When the conversation outgrows the
+model's context window the oldest turns are dropped first.
+"""
+
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+ASSISTANT_MARKER = "Assistant:"
+
+
+class HistoryMessage:
+    """
+    One conversation message and its cached prompt token ids
+    """
+
+    __slots__ = ("role", "text", "token_ids")
+
+    def __init__(self, role: str, text: str, token_ids: Optional[List[int]] = None):
+        """
+        Args:
+            role: 'user' or 'assistant'
+            text: Message text
+            token_ids: Token ids of the message as it appears in the prompt
+        """
+        self.role = role
+        self.text = text
+        self.token_ids = token_ids
+
+    def render(self) -> str:
+        """Message as it appears in the prompt"""
+        speaker = "User" if self.role == "user" else "Assistant"
+        return f"{speaker}: {self.text}\n"
+
+
+class TokenBudgetHistory:
+    """
+    Conversation history that assembles prompts from cached token ids
+    """
+
+    def __init__(self):
+        """Initialize an empty history"""
+        self.messages: List[HistoryMessage] = []
+        self._marker_ids: Optional[List[int]] = None
+        self.dropped_messages = 0
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def texts(self) -> List[str]:
+        """Message texts, oldest first"""
+        return [message.text for message in self.messages]
+
+    def clear(self):
+        """Remove every message"""
+        self.messages = []
+
+    def render(self) -> str:
+        """History as prompt text"""
+        return "".join(message.render() for message in self.messages)
+
+    def marker_ids(self, tokenizer) -> List[int]:
+        """Token ids of the marker that opens an assistant reply"""
+        if self._marker_ids is None:
+            self._marker_ids = tokenizer.encode(ASSISTANT_MARKER)
+        return self._marker_ids
+
+    def user_segment(self, tokenizer, text: str) -> List[int]:
+        """Token ids of a user message as it appears in the prompt"""
+        return tokenizer.encode(HistoryMessage("user", text).render())
+
+    def add_user(self, text: str, token_ids: Optional[List[int]] = None):
+        """
+        Append a user message
+
+        Args:
+            text: Message text
+            token_ids: Ids from ``user_segment`` when already computed
+        """
+        self.messages.append(HistoryMessage("user", text, token_ids))
+
+    def add_assistant(self, text: str, generated_ids: Optional[List[int]] = None, tokenizer=None):
+        """
+        Append an assistant reply
+
+        When the generated ids decode to exactly the reply followed by a line
+        break, they are kept as-is so the prompt matches what the model already
+        has in its KV cache; otherwise the reply is re-encoded when needed.
+
+        Args:
+            text: Reply text
+            generated_ids: Token ids the model generated for the reply
+            tokenizer: Tokenizer of the model (required with ``generated_ids``)
+        """
+        if generated_ids and tokenizer is not None:
+            decoded = tokenizer.decode(generated_ids)
+            if decoded.endswith("\n") and decoded.strip() == text:
+                token_ids = self.marker_ids(tokenizer) + list(generated_ids)
+                self.messages.append(HistoryMessage("assistant", text, token_ids))
+                return
+        self.messages.append(HistoryMessage("assistant", text))
+
+    def _message_ids(self, tokenizer, message: HistoryMessage) -> List[int]:
+        """Cached prompt token ids of a message"""
+        if message.token_ids is None:
+            if message.role == "user":
+                message.token_ids = self.user_segment(tokenizer, message.text)
+            else:
+                message.token_ids = self.marker_ids(tokenizer) + tokenizer.encode(f" {message.text}\n")
+        return message.token_ids
+
+    def build_prompt_ids(self, tokenizer, prefix_ids: List[int], user_ids: List[int],
+                         budget: int) -> List[int]:
+        """
+        Assemble prompt token ids for a new user turn within a token budget
+
+        Oldest turns are dropped from the history until the prefix, the
+        remaining history, the new user turn and the reply marker fit into
+        ``budget``. A new turn that is too long on its own keeps its end.
+        The dropped messages are removed from the history for good.
+
+        Args:
+            tokenizer: Tokenizer of the model
+            prefix_ids: Token ids of the system prompt prefix
+            user_ids: Token ids of the new user turn (from ``user_segment``)
+            budget: Maximum number of prompt tokens
+
+        Returns:
+            Prompt token ids ending with the assistant reply marker
+        """
+        marker = self.marker_ids(tokenizer)
+        available = budget - len(prefix_ids) - len(marker)
+        if len(user_ids) > available:
+            logger.warning("User message exceeds the context window; keeping its end")
+            user_ids = user_ids[-max(available, 1):]
+        available -= len(user_ids)
+
+        history_ids = [self._message_ids(tokenizer, message) for message in self.messages]
+        total = sum(len(ids) for ids in history_ids)
+
+        # Once over budget, drop down to three quarters of the room so the
+        # next few turns keep a stable prefix (and KV cache) instead of
+        # shifting the window on every turn
+        target = available if total <= available else int(available * 0.75)
+        drop = 0
+        while drop < len(self.messages) and (
+                total > target or self.messages[drop].role != "user"):
+            total -= len(history_ids[drop])
+            drop += 1
+
+        if drop:
+            self.messages = self.messages[drop:]
+            history_ids = history_ids[drop:]
+            self.dropped_messages += drop
+            logger.debug(f"Dropped {drop} oldest messages to fit the context window")
+
+        prompt_ids = list(prefix_ids)
+        for ids in history_ids:
+            prompt_ids.extend(ids)
+        prompt_ids.extend(user_ids)
+        prompt_ids.extend(marker)
+        return prompt_ids
@@ -0,0 +1,148 @@
+"""
+Inverted index for searching conversation archives
+
+Message content is split into lowercase word tokens and every token maps to
+the ids of the messages containing it (with term counts). Substring queries
+go through a second, much smaller index from character n-grams to the
+distinct tokens containing them, so a query never scans the archive itself.
+Both indexes are updated as messages are added.
+"""
+
+import heapq
+import math
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens of a text"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class MessageIndex:
+    """
+    Incrementally updated inverted index over message ids
+
+    Whitespace-separated query terms are combined with AND; each term
+    matches every indexed token that contains it. Results are ranked by
+    TF-IDF, newest first on ties.
+    """
+
+    def __init__(self, ngram_size: int = 3):
+        """
+        Args:
+            ngram_size: Longest character n-gram indexed for substring queries
+        """
+        self.ngram_size = ngram_size
+        # token -> {message id: occurrences}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        # character n-gram -> tokens containing it
+        self.ngrams: Dict[str, Set[str]] = defaultdict(set)
+        self.message_count = 0
+
+    def __len__(self) -> int:
+        return self.message_count
+
+    def add(self, message_id: int, text: str):
+        """
+        Index a message
+
+        Args:
+            message_id: Id of the message (unique within the index)
+            text: Message content
+        """
+        counts: Dict[str, int] = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+
+        for token, count in counts.items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = {}
+                self._add_ngrams(token)
+            postings[message_id] = count
+        self.message_count += 1
+
+    def _add_ngrams(self, token: str):
+        """Register a new token under each of its character n-grams"""
+        for size in range(1, min(self.ngram_size, len(token)) + 1):
+            for start in range(len(token) - size + 1):
+                self.ngrams[token[start:start + size]].add(token)
+
+    def clear(self):
+        """Remove every message from the index"""
+        self.postings.clear()
+        self.ngrams.clear()
+        self.message_count = 0
+
+    def matching_tokens(self, term: str) -> Set[str]:
+        """
+        Indexed tokens that contain a query term
+
+        Args:
+            term: Lowercase query term
+
+        Returns:
+            Tokens whose postings the term matches
+        """
+        size = min(self.ngram_size, len(term))
+        grams = {term[start:start + size] for start in range(len(term) - size + 1)}
+        # Start from the rarest n-gram and narrow down
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(self.ngrams.get(g, ()))):
+            tokens = self.ngrams.get(gram)
+            if not tokens:
+                return set()
+            candidates = set(tokens) if candidates is None else candidates & tokens
+            if not candidates:
+                return set()
+        if len(term) <= self.ngram_size:
+            return candidates
+        return {token for token in candidates if term in token}
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[int]:
+        """
+        Find messages that match every term of a query
+
+        Args:
+            query: Search query
+            limit: Maximum number of results (all matches when None)
+
+        Returns:
+            Matching message ids, best match first
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        # Per term: message id -> TF-IDF weight, summed over matching tokens
+        term_scores: List[Dict[int, float]] = []
+        for term in terms:
+            scores: Dict[int, float] = {}
+            for token in self.matching_tokens(term):
+                postings = self.postings[token]
+                idf = math.log(1 + self.message_count / len(postings))
+                for message_id, count in postings.items():
+                    scores[message_id] = scores.get(message_id, 0.0) + (1 + math.log(count)) * idf
+            if not scores:
+                return []
+            term_scores.append(scores)
+
+        # AND: intersect starting from the most selective term
+        term_scores.sort(key=len)
+        matches = set(term_scores[0])
+        for scores in term_scores[1:]:
+            matches.intersection_update(scores)
+            if not matches:
+                return []
+
+        ranked = ((sum(scores[message_id] for scores in term_scores), message_id) for message_id in matches)
+        if limit is not None:
+            return [message_id for _, message_id in heapq.nlargest(limit, ranked)]
+        return [message_id for _, message_id in sorted(ranked, reverse=True)]
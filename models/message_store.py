@@ -0,0 +1,239 @@
+"""
+Compact in-memory message store for chat conversations
+
+Messages are ``__slots__`` records with numeric timestamps kept in a
+fixed-capacity ring buffer: appending past capacity overwrites the oldest
+slot instead of rebuilding a list, and readers get views over the ring
+rather than copies. A view refuses to read once the ring has overwritten or
+cleared its messages.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ChatMessage:
+    """
+    One chat message
+
+    Supports read-only dict-style access (``message["content"]``) for code
+    written against the former dict messages; ``message["timestamp"]`` is the
+    ISO string.
+    """
+
+    __slots__ = ("role", "content", "timestamp", "metadata")
+
+    _KEYS = ("role", "content", "timestamp", "metadata")
+
+    def __init__(self, role: str, content: str, timestamp: float,
+                 metadata: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            role: 'user' or 'assistant'
+            content: Message content
+            timestamp: Creation time in seconds since the epoch
+            metadata: Additional metadata about the message
+        """
+        self.role = role
+        self.content = content
+        self.timestamp = timestamp
+        self.metadata = metadata if metadata is not None else {}
+
+    @property
+    def iso_timestamp(self) -> str:
+        """Creation time as an ISO 8601 string in local time"""
+        return datetime.fromtimestamp(self.timestamp).isoformat()
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "timestamp":
+            return self.iso_timestamp
+        if key in self._KEYS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Dict-style lookup with a default"""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self._KEYS
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._KEYS
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Message as a plain dict with an ISO timestamp (the export format)"""
+        return {
+            "role": self.role,
+            "content": self.content,
+            "timestamp": self.iso_timestamp,
+            "metadata": self.metadata,
+        }
+
+    def __repr__(self) -> str:
+        return f"ChatMessage(role={self.role!r}, content={self.content[:30]!r}, timestamp={self.timestamp})"
+
+
+class RingView:
+    """
+    Read-only window over consecutive messages of a ring, oldest first
+
+    The view does not copy the messages. It stays valid while the ring keeps
+    them: once later appends overwrite any of its messages, or the ring is
+    cleared, reading from the view raises ``RuntimeError`` instead of
+    returning other messages. Take ``to_list()`` to keep the messages.
+    """
+
+    __slots__ = ("_ring", "_generation", "_first", "_size")
+
+    def __init__(self, ring: "MessageRing", first: int, size: int):
+        """
+        Args:
+            ring: Ring the view reads from
+            first: Position of the first message among every message appended since the last clear
+            size: Number of messages in the view
+        """
+        self._ring = ring
+        self._generation = ring._generation
+        self._first = first
+        self._size = size
+
+    def _check(self):
+        """Raise if the ring no longer holds the messages of this view"""
+        ring = self._ring
+        if ring._generation != self._generation or self._first < ring._appended - ring._size:
+            raise RuntimeError("Messages of this view have been overwritten or cleared")
+
+    def _at(self, index: int) -> ChatMessage:
+        self._check()
+        slots = self._ring._slots
+        return slots[(self._first + index) % len(slots)]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def __iter__(self) -> Iterator[ChatMessage]:
+        for i in range(self._size):
+            yield self._at(i)
+
+    def __reversed__(self) -> Iterator[ChatMessage]:
+        for i in range(self._size - 1, -1, -1):
+            yield self._at(i)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[ChatMessage, "RingView", List[ChatMessage]]:
+        """A message by index; a contiguous slice is a view, a stepped slice a list"""
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._size)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            view = RingView(self._ring, self._first + start, max(0, stop - start))
+            view._generation = self._generation
+            return view
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("message index out of range")
+        return self._at(index)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (RingView, MessageRing, list)):
+            return len(self) == len(other) and all(a is b or a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def to_list(self) -> List[ChatMessage]:
+        """Copy the window into a list"""
+        return list(self)
+
+
+class MessageRing:
+    """
+    Fixed-capacity ring buffer of chat messages
+
+    Appending is O(1); once full, each append overwrites the oldest message.
+    """
+
+    __slots__ = ("_slots", "_size", "_appended", "_generation", "evicted")
+
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity: Maximum number of messages kept
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self._slots: List[Optional[ChatMessage]] = [None] * capacity
+        self._size = 0
+        # Messages appended since the last clear; message n lives in slot n % capacity
+        self._appended = 0
+        # Bumped by clear() so views taken before it are recognised as stale
+        self._generation = 0
+        self.evicted = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self._slots)
+
+    def append(self, message: ChatMessage) -> Optional[ChatMessage]:
+        """
+        Add a message, overwriting the oldest one when full
+
+        Returns:
+            The evicted message, if any
+        """
+        slot = self._appended % len(self._slots)
+        evicted = self._slots[slot] if self._size == len(self._slots) else None
+        self._slots[slot] = message
+        self._appended += 1
+        if evicted is None:
+            self._size += 1
+        else:
+            self.evicted += 1
+        return evicted
+
+    def recent(self, count: int) -> RingView:
+        """View of the last ``count`` messages"""
+        count = max(0, min(count, self._size))
+        return RingView(self, self._appended - count, count)
+
+    def view(self) -> RingView:
+        """View of every message currently held"""
+        return RingView(self, self._appended - self._size, self._size)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def __iter__(self) -> Iterator[ChatMessage]:
+        return iter(self.view())
+
+    def __reversed__(self) -> Iterator[ChatMessage]:
+        return reversed(self.view())
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[ChatMessage, RingView, List[ChatMessage]]:
+        return self.view()[index]
+
+    def __eq__(self, other) -> bool:
+        return self.view() == other
+
+    def to_list(self) -> List[ChatMessage]:
+        """Copy the messages into a list"""
+        return list(self)
+
+    def clear(self):
+        """Remove every message"""
+        for i in range(len(self._slots)):
+            self._slots[i] = None
+        self._size = 0
+        self._appended = 0
+        self._generation += 1
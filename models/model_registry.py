@@ -0,0 +1,308 @@
+"""
+Process-wide registry of loaded language models
+
+Weights are loaded once per (model name, dtype) and shared read-only by every
+session in the process. Per-session conversation state lives on the
+VoxenModel handles, never on the shared model.
+"""
+
+from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+import torch
+import threading
+from typing import Dict, Any, Optional, Tuple
+import logging
+from config.settings import MODEL_CONFIG
+from models.quantization import quantize_dynamic_int8
+from models.precision import resolve_dtype
+from models.generation import PrefixState, compute_prefix_state
+from models.compiled import TORCHSCRIPT_DTYPES, export_traced_decoder, load_traced_decoder
+from models.weights import load_mapped_model
+
+logger = logging.getLogger(__name__)
+
+TORCH_DTYPES = {
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+}
+
+# Dtype keys produced by post-load quantization of float32 weights
+QUANTIZED_DTYPES = {"int8"}
+
+
+def system_prompt_prefix() -> str:
+    """Text every prompt starts with: the system prompt and a blank line"""
+    return f"{MODEL_CONFIG['system_prompt']}\n\n"
+
+
+class SharedModel:
+    """
+    Read-only model weights and tokenizer shared across sessions
+    """
+
+    def __init__(self, model_name: str, dtype: str, model, tokenizer, device: str):
+        """
+        Wrap a loaded model
+
+        Args:
+            model_name: Name of the pre-trained model
+            dtype: Dtype key the weights were loaded with
+            model: Loaded causal language model (in eval mode)
+            tokenizer: Matching tokenizer
+            device: Device the model lives on
+        """
+        self.model_name = model_name
+        self.dtype = dtype
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.batch_scheduler = None
+        self.generation_engine = None
+        self.token_latency = None
+        self.latency_samples = 0
+        self._latency_lock = threading.Lock()
+        self._prefix_state: Optional[PrefixState] = None
+        self._prefix_lock = threading.Lock()
+
+    def get_prefix_state(self, text: Optional[str] = None) -> PrefixState:
+        """
+        Get the shared key/value state of the system prompt prefix
+
+        Computed once and reused by every session; recomputed when the
+        configured system prompt changes.
+
+        Args:
+            text: Prefix text (defaults to the configured system prompt prefix)
+
+        Returns:
+            The prefix state
+        """
+        text = text if text is not None else system_prompt_prefix()
+        prefix = self._prefix_state
+        if prefix is not None and prefix.text == text:
+            return prefix
+
+        with self._prefix_lock:
+            prefix = self._prefix_state
+            if prefix is None or prefix.text != text:
+                if prefix is not None:
+                    logger.info("System prompt changed; recomputing the shared prefix cache")
+                prefix = compute_prefix_state(self.model, self.tokenizer, text, self.device)
+                self._prefix_state = prefix
+            return prefix
+
+    def record_token_latency(self, seconds: float):
+        """
+        Record the time taken to decode one token
+
+        Keeps an exponential moving average so operators can see the
+        per-token latency of the precision path this process runs.
+        """
+        with self._latency_lock:
+            if self.token_latency is None:
+                self.token_latency = seconds
+            else:
+                self.token_latency = 0.9 * self.token_latency + 0.1 * seconds
+            self.latency_samples += 1
+
+    def get_info(self) -> Dict[str, Any]:
+        """Get information about the shared model"""
+        info = {
+            "model_name": self.model_name,
+            "dtype": self.dtype,
+            "device": self.device,
+            "parameters": sum(p.numel() for p in self.model.parameters()),
+            "per_token_latency_ms": self.token_latency * 1000 if self.token_latency is not None else None,
+            "prefix_cache_tokens": len(self._prefix_state) if self._prefix_state is not None else 0,
+        }
+        if self.batch_scheduler is not None:
+            info["batching"] = self.batch_scheduler.get_metrics()
+        if self.generation_engine is not None:
+            info["continuous_batching"] = self.generation_engine.get_metrics()
+        return info
+
+
+class ModelRegistry:
+    """
+    Loads each model at most once per process and hands out shared instances
+    """
+
+    def __init__(self):
+        """Initialize an empty registry"""
+        self._models: Dict[Tuple[str, str], SharedModel] = {}
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, model_name: str, dtype: Optional[str]) -> Tuple[str, str]:
+        """Registry key for a model name and configured dtype"""
+        return (model_name, resolve_dtype(dtype or MODEL_CONFIG["dtype"]))
+
+    def _key_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        """Get the lock guarding loads of a single registry key"""
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def get(self, model_name: str, dtype: Optional[str] = None) -> SharedModel:
+        """
+        Get a shared model, loading it on first use
+
+        Concurrent callers asking for the same key wait for a single load.
+
+        Args:
+            model_name: Name of the pre-trained model
+            dtype: Dtype key (defaults to MODEL_CONFIG["dtype"]); "auto" picks
+                bfloat16 when the host runs it efficiently
+
+        Returns:
+            The shared model
+        """
+        key = self._key(model_name, dtype)
+        shared = self._models.get(key)
+        if shared is not None:
+            return shared
+
+        with self._key_lock(key):
+            shared = self._models.get(key)
+            if shared is None:
+                shared = self._load(*key)
+                with self._lock:
+                    self._models[key] = shared
+            return shared
+
+    def _load(self, model_name: str, dtype: str) -> SharedModel:
+        """Load a model and tokenizer from Hugging Face"""
+        if dtype not in TORCH_DTYPES and dtype not in QUANTIZED_DTYPES:
+            raise ValueError(f"Unsupported model dtype: {dtype}")
+
+        try:
+            logger.info(f"Loading model: {model_name} ({dtype})")
+
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            # Set pad token if not present
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+
+            use_torchscript = self._use_torchscript(dtype)
+            model = None
+            if use_torchscript:
+                # A previously exported graph replaces from_pretrained entirely
+                model = load_traced_decoder(model_name, dtype, AutoConfig.from_pretrained(model_name))
+
+            if model is not None:
+                device = "cpu"
+            else:
+                model = self._load_weights(model_name, TORCH_DTYPES.get(dtype, torch.float32))
+
+                if dtype == "int8":
+                    # Dynamic quantization runs on CPU kernels only
+                    model = quantize_dynamic_int8(model)
+                    device = "cpu"
+                    logger.info("Using CPU for quantized model inference")
+                # Move model to GPU if available (optional for small model)
+                elif torch.cuda.is_available():
+                    model = model.to('cuda')
+                    device = "cuda"
+                    logger.info("Model moved to GPU")
+                else:
+                    device = "cpu"
+                    logger.info("Using CPU for model inference")
+
+                model.eval()
+                if use_torchscript:
+                    # First load: trace the graph and cache it for later processes
+                    model = export_traced_decoder(model, model_name, dtype) or model
+
+            # Shared weights are never trained or modified
+            for param in model.parameters():
+                param.requires_grad_(False)
+
+            shared = SharedModel(model_name, dtype, model, tokenizer, device)
+            # Precompute the system prompt state every session starts from
+            shared.get_prefix_state()
+
+            logger.info(f"Model {model_name} ({dtype}) loaded successfully")
+            return shared
+
+        except Exception as e:
+            logger.error(f"Error loading model {model_name}: {e}")
+            raise
+
+    @staticmethod
+    def _load_weights(model_name: str, torch_dtype: torch.dtype):
+        """Load model weights in the configured format"""
+        if MODEL_CONFIG["weights_format"] == "mmap":
+            try:
+                return load_mapped_model(model_name, torch_dtype)
+            except Exception as e:
+                logger.warning(f"Could not map weights of {model_name}; loading normally: {e}")
+        return AutoModelForCausalLM.from_pretrained(
+            model_name,
+            torch_dtype=torch_dtype,
+            low_cpu_mem_usage=True
+        )
+
+    @staticmethod
+    def _use_torchscript(dtype: str) -> bool:
+        """Whether to run this dtype on the traced TorchScript engine"""
+        if MODEL_CONFIG["engine"] != "torchscript":
+            return False
+        if dtype not in TORCHSCRIPT_DTYPES or torch.cuda.is_available():
+            logger.info(f"TorchScript engine is CPU-only for {sorted(TORCHSCRIPT_DTYPES)}; using eager")
+            return False
+        return True
+
+    def register(self, model_name: str, dtype: Optional[str], model, tokenizer,
+                 device: str = "cpu") -> SharedModel:
+        """
+        Add an already loaded model, e.g. one built in memory for benchmarks
+
+        Args:
+            model_name: Name to register the model under
+            dtype: Dtype key the weights are in
+            model: Causal language model on ``device``
+            tokenizer: Matching tokenizer
+            device: Device the model lives on
+
+        Returns:
+            The shared model, as later returned by ``get``
+        """
+        key = self._key(model_name, dtype)
+        model.eval()
+        for param in model.parameters():
+            param.requires_grad_(False)
+        shared = SharedModel(key[0], key[1], model, tokenizer, device)
+        shared.get_prefix_state()
+        with self._lock:
+            self._models[key] = shared
+        logger.info(f"Registered model {model_name} ({key[1]})")
+        return shared
+
+    def is_loaded(self, model_name: str, dtype: Optional[str] = None) -> bool:
+        """Check whether a model is already loaded"""
+        return self._key(model_name, dtype) in self._models
+
+    def unload(self, model_name: str, dtype: Optional[str] = None):
+        """
+        Drop a model from the registry
+
+        Sessions still holding the shared model keep it alive until released.
+        """
+        with self._lock:
+            self._models.pop(self._key(model_name, dtype), None)
+        logger.info(f"Model {model_name} unloaded from registry")
+
+    def get_info(self) -> Dict[str, Any]:
+        """Get information about every loaded model"""
+        return {
+            "loaded_models": [shared.get_info() for shared in list(self._models.values())]
+        }
+
+
+_registry = ModelRegistry()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Get the process-wide model registry"""
+    return _registry
@@ -0,0 +1,90 @@
+"""
+Reduced-precision capability detection for CPU inference
+"""
+
+import functools
+import time
+import torch
+import logging
+
+logger = logging.getLogger(__name__)
+
+# CPU flags that indicate native bfloat16 matmul support
+BF16_CPU_FLAGS = ("avx512_bf16", "amx_bf16")
+
+
+def _cpu_flags() -> set:
+    """CPU feature flags reported by the kernel (empty when unavailable)"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+def _time_matmul(dtype: torch.dtype, size: int = 512, repeats: int = 5) -> float:
+    """Best-of-N time of a square matmul in the given dtype"""
+    a = torch.randn(size, size).to(dtype)
+    b = torch.randn(size, size).to(dtype)
+    torch.matmul(a, b)  # Warm up
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        torch.matmul(a, b)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+@functools.lru_cache(maxsize=None)
+def cpu_supports_bf16() -> bool:
+    """
+    Check whether this CPU runs bfloat16 matmuls efficiently
+
+    Requires a native bf16 CPU feature and a quick matmul benchmark in which
+    bfloat16 is at least as fast as float32. The result is cached per process.
+    """
+    flags = _cpu_flags()
+    if not any(flag in flags for flag in BF16_CPU_FLAGS):
+        logger.info("CPU has no native bfloat16 support")
+        return False
+
+    try:
+        fp32 = _time_matmul(torch.float32)
+        bf16 = _time_matmul(torch.bfloat16)
+    except Exception as e:
+        logger.warning(f"bfloat16 capability check failed: {e}")
+        return False
+
+    logger.info(f"Matmul timing: float32 {fp32 * 1000:.2f} ms, bfloat16 {bf16 * 1000:.2f} ms")
+    return bf16 <= fp32
+
+
+def resolve_dtype(dtype: str) -> str:
+    """
+    Resolve a configured dtype key to the one actually used on this host
+
+    "auto" picks bfloat16 when the hardware handles it efficiently and float32
+    otherwise. An explicit "bfloat16" on a CPU without efficient support falls
+    back to float32.
+
+    Args:
+        dtype: Configured dtype key
+
+    Returns:
+        Dtype key to load the model with
+    """
+    if dtype not in ("auto", "bfloat16"):
+        return dtype
+
+    if torch.cuda.is_available():
+        if torch.cuda.is_bf16_supported():
+            return "bfloat16"
+    elif cpu_supports_bf16():
+        return "bfloat16"
+
+    if dtype == "bfloat16":
+        logger.warning("bfloat16 is not efficient on this host; falling back to float32")
+    return "float32"
@@ -0,0 +1,59 @@
+"""
+Dynamic int8 quantization for CPU inference
+"""
+
+import torch
+import logging
+
+try:
+    from transformers.pytorch_utils import Conv1D
+except ImportError:  # Older transformers keep Conv1D in modeling_utils
+    from transformers.modeling_utils import Conv1D
+
+logger = logging.getLogger(__name__)
+
+
+def conv1d_to_linear(module: torch.nn.Module) -> torch.nn.Module:
+    """
+    Replace GPT-2 style Conv1D layers with equivalent nn.Linear layers
+
+    Conv1D stores its weight transposed ([in, out]) and is skipped by dynamic
+    quantization, which only targets nn.Linear. Converting first lets the
+    attention and MLP projections be quantized too.
+
+    Args:
+        module: Model (or submodule) to convert in place
+
+    Returns:
+        The converted module
+    """
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = torch.nn.Linear(in_features, out_features, bias=child.bias is not None)
+            linear.weight.data = child.weight.data.t().contiguous()
+            if child.bias is not None:
+                linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            conv1d_to_linear(child)
+    return module
+
+
+def quantize_dynamic_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Quantize a float32 model's Linear layers to int8 with dynamic activation scaling
+
+    Args:
+        model: Float32 model on CPU
+
+    Returns:
+        The quantized model (weights int8, activations quantized per batch)
+    """
+    if "fbgemm" in torch.backends.quantized.supported_engines:
+        torch.backends.quantized.engine = "fbgemm"
+
+    conv1d_to_linear(model)
+    quantized = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    logger.info("Applied dynamic int8 quantization to Linear layers")
+    return quantized
@@ -0,0 +1,230 @@
+"""
+Response cache for repeated prompts
+
+An in-memory LRU/TTL cache with an optional on-disk tier that survives
+restarts. Keys combine the normalized prompt, a hash of the conversation
+context, the model and the generation parameters.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+from config.settings import CACHE_CONFIG, PATHS
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case-fold and collapse whitespace so trivially different prompts share an entry"""
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of generated responses with expiry and a disk tier
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None,
+                 disk_dir: Optional[str] = None, disk_max_entries: int = None):
+        """
+        Args:
+            max_entries: Maximum number of responses kept in memory
+            ttl_seconds: Lifetime of an entry (0 disables expiry)
+            disk_dir: Directory of the on-disk tier (None keeps the cache in memory only)
+            disk_max_entries: Maximum number of responses kept on disk
+        """
+        self.max_entries = max_entries or CACHE_CONFIG["max_entries"]
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else CACHE_CONFIG["ttl_seconds"]
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries or CACHE_CONFIG["disk_max_entries"]
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "expirations": 0}
+        self._disk_writes = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(prompt: str, context: List[str], model_name: str, params: Dict[str, Any]) -> str:
+        """
+        Build a cache key
+
+        Args:
+            prompt: User prompt
+            context: Conversation history preceding the prompt
+            model_name: Model (and dtype) identifier
+            params: Generation parameters
+
+        Returns:
+            Hex digest identifying the request
+        """
+        context_hash = hashlib.sha256("\x1e".join(context).encode("utf-8")).hexdigest()
+        payload = json.dumps(
+            [normalize_prompt(prompt), context_hash, model_name, params],
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float) -> bool:
+        return bool(self.ttl_seconds) and time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a response
+
+        Args:
+            key: Key from ``make_key``
+
+        Returns:
+            The cached response, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, created_at = entry
+                if not self._expired(created_at):
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return response
+                del self._entries[key]
+                self._stats["expirations"] += 1
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._stats["disk_hits"] += 1
+            self._store(key, *entry)
+        return entry[0]
+
+    def contains(self, key: str) -> bool:
+        """Whether an unexpired response is in memory (does not count as a lookup)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._expired(entry[1])
+
+    def put(self, key: str, response: str):
+        """
+        Store a response
+
+        Args:
+            key: Key from ``make_key``
+            response: Generated response
+        """
+        created_at = time.time()
+        with self._lock:
+            self._store(key, response, created_at)
+        self._write_disk(key, response, created_at)
+
+    def _store(self, key: str, response: str, created_at: float):
+        """Insert into the memory tier, evicting least recently used entries"""
+        self._entries[key] = (response, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Tuple[str, float]]:
+        """Read an unexpired entry from the disk tier"""
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            response, created_at = data["response"], float(data["created_at"])
+            expired = self._expired(created_at)
+        except (KeyError, TypeError, ValueError):
+            # Valid JSON but not a cache entry; drop it like an expired one
+            logger.warning(f"Removing malformed response cache entry {path}")
+            expired = True
+        if expired:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return response, created_at
+
+    def _write_disk(self, key: str, response: str, created_at: float):
+        """Write an entry to the disk tier atomically and keep the tier bounded"""
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"response": response, "created_at": created_at}, f)
+            os.replace(tmp_path, path)
+            # Scanning the directory is linear, so only prune periodically;
+            # count under the lock so exactly one writer of every 64 prunes
+            with self._lock:
+                self._disk_writes += 1
+                prune = self._disk_writes % 64 == 1
+            if prune:
+                self._prune_disk()
+        except OSError as e:
+            logger.warning(f"Could not write response cache entry: {e}")
+
+    def _prune_disk(self):
+        """Remove the oldest disk entries beyond disk_max_entries"""
+        entries = [entry for entry in os.scandir(self.disk_dir) if entry.name.endswith(".json")]
+        if len(entries) <= self.disk_max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.disk_max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def clear(self):
+        """Remove every cached response from memory and disk"""
+        with self._lock:
+            self._entries.clear()
+        if self.disk_dir:
+            for entry in os.scandir(self.disk_dir):
+                if entry.name.endswith(".json"):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        # Already evicted by another process
+                        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and cache size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Get the process-wide response cache configured by CACHE_CONFIG"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            disk_dir = os.path.join(PATHS["cache_dir"], "responses") if CACHE_CONFIG["disk"] else None
+            _response_cache = ResponseCache(disk_dir=disk_dir)
+        return _response_cache
@@ -0,0 +1,114 @@
+"""
+Stopping criteria for streamed generation
+
+Criteria look at the decoded response text as it grows and decide when
+generation should end and how much of the text is safe to show the user.
+"""
+
+import threading
+from typing import List, Optional
+from config.settings import MODEL_CONFIG
+
+
+class StopCondition:
+    """
+    Base class for conditions that end generation early
+    """
+
+    def check(self, text: str, token_ids: List[int]) -> Optional[int]:
+        """
+        Check whether generation should stop
+
+        Args:
+            text: Response text decoded so far
+            token_ids: Response token ids generated so far
+
+        Returns:
+            Number of characters of ``text`` to keep if generation should stop, otherwise None
+        """
+        return None
+
+    def holdback(self, text: str) -> int:
+        """Number of trailing characters that are not yet safe to emit"""
+        return 0
+
+
+class StopSequences(StopCondition):
+    """
+    Stops when any of a set of strings appears in the response
+
+    Text that could be the beginning of a stop sequence is held back until it
+    is clear whether the sequence completes.
+    """
+
+    def __init__(self, sequences: List[str]):
+        """
+        Args:
+            sequences: Strings that end the response (they are not included in it)
+        """
+        self.sequences = [seq for seq in sequences if seq]
+
+    def check(self, text: str, token_ids: List[int]) -> Optional[int]:
+        positions = [text.find(seq) for seq in self.sequences]
+        positions = [pos for pos in positions if pos >= 0]
+        return min(positions) if positions else None
+
+    def holdback(self, text: str) -> int:
+        longest = 0
+        for seq in self.sequences:
+            for size in range(min(len(seq) - 1, len(text)), longest, -1):
+                if text.endswith(seq[:size]):
+                    longest = size
+                    break
+        return longest
+
+
+class CancelEvent(StopCondition):
+    """
+    Stops as soon as an event is set, e.g. when the client has gone away
+
+    The text generated so far is kept.
+    """
+
+    def __init__(self, event: threading.Event):
+        """
+        Args:
+            event: Event that requests cancellation
+        """
+        self.event = event
+
+    def check(self, text: str, token_ids: List[int]) -> Optional[int]:
+        return len(text) if self.event.is_set() else None
+
+
+class StoppingCriteria:
+    """
+    Combines several stop conditions
+    """
+
+    def __init__(self, conditions: List[StopCondition] = None):
+        """
+        Args:
+            conditions: Stop conditions to combine
+        """
+        self.conditions = list(conditions or [])
+
+    def add(self, condition: StopCondition):
+        """Add a stop condition"""
+        self.conditions.append(condition)
+
+    def check(self, text: str, token_ids: List[int]) -> Optional[int]:
+        """Earliest cut point requested by any condition, or None to continue"""
+        cuts = [condition.check(text, token_ids) for condition in self.conditions]
+        cuts = [cut for cut in cuts if cut is not None]
+        return min(cuts) if cuts else None
+
+    def safe_length(self, text: str) -> int:
+        """Length of the prefix of ``text`` that can be emitted now"""
+        holdback = max((condition.holdback(text) for condition in self.conditions), default=0)
+        return len(text) - holdback
+
+
+def default_stopping_criteria() -> StoppingCriteria:
+    """Stop at the end of the first line or when the model starts a new user turn"""
+    return StoppingCriteria([StopSequences(MODEL_CONFIG["stop_sequences"])])
@@ -2,151 +2,457 @@
 AI Model wrapper using Hugging Face Transformers with modern language models
 """
 
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import asyncio
+import contextlib
+import threading
+import time
+import uuid
 import torch
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, ContextManager, Iterator, Optional, List
 import logging
-from config.settings import MODEL_CONFIG
+from config.settings import (
+    MODEL_CONFIG, ADMISSION_CONFIG, API_CONFIG, BATCHING_CONFIG, CACHE_CONFIG, WORKER_POOL_CONFIG
+)
+from models.model_registry import ModelRegistry, get_model_registry, system_prompt_prefix
+from models.generation import (
+    PrefixState, SessionCache, context_window, decode, sampling_params, speculative_decode
+)
+from models.history import ASSISTANT_MARKER, TokenBudgetHistory
+from models.stopping import CancelEvent, StoppingCriteria, default_stopping_criteria
+from models.batching import get_batch_scheduler
+from models.continuous_batching import get_generation_engine
+from models.response_cache import ResponseCache, get_response_cache
+from models.worker_pool import InferenceWorkerPool, get_worker_pool
+from models.async_inference import run_inference
+from models.admission import (
+    PRIORITY_NORMAL, PRIORITY_SHORT, AdmissionController, AdmissionError, RateLimitExceeded,
+    get_admission_controller,
+)
 
 logger = logging.getLogger(__name__)
 
 class VoxenModel:
     """
     AI model wrapper using Hugging Face Transformers with modern language models
+    
+    Each instance is a lightweight per-session handle: it owns the conversation
+    state, while the weights come from the process-wide model registry. In
+    client mode the weights live in a pool of worker processes instead and
+    this process only tokenizes prompts and decodes replies.
     """
     
-    def __init__(self, model_name: str = "gpt2"):
+    def __init__(self, model_name: str = "gpt2", dtype: str = None,
+                 registry: Optional[ModelRegistry] = None,
+                 response_cache: Optional[ResponseCache] = None,
+                 use_worker_pool: Optional[bool] = None,
+                 admission: Optional[AdmissionController] = None,
+                 session_id: Optional[str] = None):
         """
         Initialize the model with Transformers
         
         Args:
             model_name: Name of the pre-trained model to use
+            dtype: Weight dtype key (defaults to MODEL_CONFIG["dtype"])
+            registry: Model registry to share weights through (defaults to the process-wide one)
+            response_cache: Cache for repeated prompts (defaults to the process-wide one
+                when CACHE_CONFIG["enabled"] is set)
+            use_worker_pool: Generate in worker processes (defaults to WORKER_POOL_CONFIG["enabled"])
+            admission: Rate limiter and admission queue for queries (defaults to the
+                process-wide one when ADMISSION_CONFIG["enabled"] is set)
+            session_id: Rate-limiting key of this session (defaults to a random id)
         """
         self.model_name = model_name
+        self.dtype = dtype or MODEL_CONFIG["dtype"]
+        self.registry = registry or get_model_registry()
+        self.use_worker_pool = WORKER_POOL_CONFIG["enabled"] if use_worker_pool is None else use_worker_pool
+        self.shared_model = None
+        self.worker_pool: Optional[InferenceWorkerPool] = None
         self.model = None
         self.tokenizer = None
         self.is_loaded = False
-        self.conversation_history = []
+        self.history = TokenBudgetHistory()
+        self.kv_cache = SessionCache(MODEL_CONFIG["kv_cache_max_tokens"])
+        self.draft_model = None
+        self.draft_kv_cache = SessionCache(MODEL_CONFIG["kv_cache_max_tokens"])
+        self.speculative_stats = {"steps": 0, "proposed": 0, "accepted": 0}
+        self.response_cache = response_cache or (get_response_cache() if CACHE_CONFIG["enabled"] else None)
+        # One generation at a time per conversation; async callers queue here
+        self.session_lock = threading.Lock()
+        self.admission = admission or (get_admission_controller() if ADMISSION_CONFIG["enabled"] else None)
+        self.session_id = session_id or uuid.uuid4().hex
         
         logger.info(f"Initializing VoxenModel with {model_name}")
     
     def load_model(self):
-        """Load the pre-trained model using Transformers"""
+        """Attach this session to the shared model, loading weights on first use"""
         try:
-            logger.info(f"Loading model: {self.model_name}")
-            
-            # Load tokenizer and model
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_name, 
-                torch_dtype=torch.float32,  # Use float32 for better compatibility
-                low_cpu_mem_usage=True
-            )
-            
-            # Set pad token if not present
-            if self.tokenizer.pad_token is None:
-                self.tokenizer.pad_token = self.tokenizer.eos_token
-            
-            # Move model to GPU if available (optional for small model)
-            if torch.cuda.is_available():
-                self.model = self.model.to('cuda')
-                logger.info("Model moved to GPU")
-            else:
-                logger.info("Using CPU for model inference")
+            if self.use_worker_pool:
+                # Client mode: the workers hold the weights
+                self.worker_pool = get_worker_pool(self.model_name, self.dtype)
+                # Raises if a worker failed to load or died during start-up
+                self.worker_pool.wait_ready()
+                self.tokenizer = self.worker_pool.tokenizer
+                self.is_loaded = True
+                return
             
+            shared = self.registry.get(self.model_name, self.dtype)
+            self.shared_model = shared
+            self.model = shared.model
+            self.tokenizer = shared.tokenizer
+            if MODEL_CONFIG["speculative_decoding"]:
+                self._load_draft_model()
             self.is_loaded = True
-            logger.info("Model loaded successfully")
             
         except Exception as e:
             logger.error(f"Error loading model: {e}")
             raise
     
+    def _load_draft_model(self):
+        """Attach the shared draft model used for speculative decoding"""
+        draft = self.registry.get(MODEL_CONFIG["draft_model"], self.dtype)
+        if draft.model.config.vocab_size != self.model.config.vocab_size:
+            logger.warning(
+                f"Draft model {MODEL_CONFIG['draft_model']} does not share the vocabulary "
+                f"of {self.model_name}; speculative decoding disabled"
+            )
+            return
+        self.draft_model = draft.model
+    
+    @property
+    def conversation_history(self) -> List[str]:
+        """Texts of the conversation so far, oldest first"""
+        return self.history.texts()
+    
     def create_prompt(self, user_input: str) -> str:
         """Create a well-formatted prompt for the model"""
         # Add system message for better responses
-        system_prompt = "You are Voxen2.0, a helpful and intelligent AI assistant. Provide clear, informative, and helpful responses."
-        
-        # Format conversation history
-        if self.conversation_history:
-            conversation_text = "\n".join([
-                f"User: {msg}" if i % 2 == 0 else f"Assistant: {msg}"
-                for i, msg in enumerate(self.conversation_history)
-            ])
-            full_prompt = f"{system_prompt}\n\n{conversation_text}\nUser: {user_input}\nAssistant:"
-        else:
-            full_prompt = f"{system_prompt}\n\nUser: {user_input}\nAssistant:"
-        
-        return full_prompt
+        return f"{system_prompt_prefix()}{self.history.render()}User: {user_input}\n{ASSISTANT_MARKER}"
+    
+    def _context_window(self) -> int:
+        """Maximum number of positions the model can attend to"""
+        if self.worker_pool is not None:
+            return self.worker_pool.context_window
+        return context_window(self.model)
     
-    def generate_response(self, prompt: str, max_length: int = None) -> str:
+    def stream_response(self, prompt: str, max_new_tokens: int = None,
+                        stopping: Optional[StoppingCriteria] = None,
+                        cancel: Optional[threading.Event] = None) -> Iterator[str]:
         """
-        Generate AI response using the language model
+        Generate AI response, yielding text pieces as tokens are produced
+        
+        Generation ends as soon as a stopping criterion is met (by default the
+        end of the first line or the start of a new "User:" turn).
         
         Args:
             prompt: User's question
-            max_length: Maximum length of response
+            max_new_tokens: Maximum number of tokens to generate
+            stopping: Stopping criteria (defaults to default_stopping_criteria())
+            cancel: Event that ends generation early, keeping the text so far
             
-        Returns:
-            Generated response
+        Yields:
+            Pieces of the response text
         """
+        max_new_tokens = max_new_tokens or MODEL_CONFIG["max_new_tokens"]
+        
+        # Serve repeated prompts from the response cache without touching the model
+        cache_key = self._response_cache_key(prompt, max_new_tokens) if stopping is None else None
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                self.history.add_user(prompt)
+                self.history.add_assistant(cached)
+                yield cached
+                return
+        
         if not self.is_loaded:
             self.load_model()
         
+        stopping = stopping or default_stopping_criteria()
+        if cancel is not None:
+            stopping = StoppingCriteria(stopping.conditions + [CancelEvent(cancel)])
+        response_text = ""
+        response_ids = []
+        user_ids = None
+        failed = False
         try:
-            # Add user input to conversation history
-            self.conversation_history.append(prompt)
-            
-            # Create formatted prompt
-            formatted_prompt = self.create_prompt(prompt)
-            
-            # Encode the prompt
-            input_ids = self.tokenizer.encode(
-                formatted_prompt, 
-                return_tensors='pt',
-                truncation=True,
-                max_length=2048  # Limit input length
+            # Assemble the prompt from cached token ids: the shared system
+            # prompt prefix (its KV state is precomputed once per process),
+            # the history and the new user turn. Oldest turns are dropped to
+            # leave room for the reply inside the context window; only the
+            # new user turn is tokenized here.
+            if self.worker_pool is not None:
+                if self.worker_pool.failed:
+                    # Pick up the replacement once the failed pool has been restarted
+                    self.worker_pool = get_worker_pool(self.model_name, self.dtype)
+                prefix = None
+                prefix_text, prefix_ids = self.worker_pool.current_prefix()
+            else:
+                prefix = self.shared_model.get_prefix_state()
+                prefix_ids = prefix.token_ids
+            user_ids = self.history.user_segment(self.tokenizer, prompt)
+            input_ids = self.history.build_prompt_ids(
+                self.tokenizer,
+                prefix_ids,
+                user_ids,
+                budget=self._context_window() - max_new_tokens,
             )
             
-            # Move to GPU if available
-            if torch.cuda.is_available():
-                input_ids = input_ids.to('cuda')
-            
-            # Generate response
-            with torch.no_grad():
-                output = self.model.generate(
+            if self.worker_pool is not None:
+                # Workers are stateless between requests and start from
+                # their own copy of the system prompt prefix state
+                token_source = self._generate_in_pool(input_ids, max_new_tokens, prefix_text)
+            elif BATCHING_CONFIG["enabled"]:
+                # Batched requests share the model with other sessions and
+                # are prefilled from scratch, without the session KV cache
+                token_source = self._generate_batched(input_ids, max_new_tokens, stopping, prefix)
+            elif self.draft_model is not None and not sampling_params()["do_sample"]:
+                # Greedy replies: the draft model proposes tokens that the
+                # main model verifies several at a time
+                token_source = speculative_decode(
+                    self.model,
+                    self.draft_model,
+                    input_ids,
+                    self.kv_cache,
+                    self.draft_kv_cache,
+                    max_new_tokens=max_new_tokens,
+                    eos_token_id=self.tokenizer.eos_token_id,
+                    device=self.shared_model.device,
+                    prefix=prefix,
+                    num_draft_tokens=MODEL_CONFIG["num_draft_tokens"],
+                    stats=self.speculative_stats,
+                )
+            else:
+                # Prefill only the tokens not already in this conversation's KV cache
+                token_source = decode(
+                    self.model,
                     input_ids,
-                    max_length=max_length or MODEL_CONFIG["max_length"],
-                    temperature=MODEL_CONFIG["temperature"],
-                    do_sample=MODEL_CONFIG["do_sample"],
-                    pad_token_id=self.tokenizer.eos_token_id,
+                    self.kv_cache,
+                    max_new_tokens=max_new_tokens,
                     eos_token_id=self.tokenizer.eos_token_id,
-                    num_return_sequences=1,
-                    repetition_penalty=1.1,
-                    top_p=0.9
+                    device=self.shared_model.device,
+                    prefix=prefix,
                 )
             
-            # Decode the response
-            response_ids = output[0][input_ids.shape[-1]:]
-            response_text = self.tokenizer.decode(
-                response_ids, 
-                skip_special_tokens=True
-            ).strip()
+            tokens = iter(token_source)
+            while True:
+                requested_at = time.perf_counter()
+                token_id = next(tokens, None)
+                if token_id is None:
+                    break
+                # Per-token decode latency; the first token also pays for prefill
+                if response_ids and self.shared_model is not None:
+                    self.shared_model.record_token_latency(time.perf_counter() - requested_at)
+                
+                response_ids.append(token_id)
+                text = self.tokenizer.decode(response_ids, skip_special_tokens=True).lstrip()
+                if text.endswith("\ufffd"):
+                    continue  # Wait for the rest of a multi-byte character
+                
+                cut = stopping.check(text, response_ids)
+                if cut is not None:
+                    text = text[:cut].rstrip()
+                else:
+                    # Hold back text that may turn out to be a stop sequence
+                    text = text[:stopping.safe_length(text)]
+                
+                if len(text) > len(response_text):
+                    yield text[len(response_text):]
+                    response_text = text
+                
+                if cut is not None:
+                    break
             
-            # Clean up response
-            response_text = response_text.split('\n')[0].strip()  # Take first line
+            if cancel is not None and cancel.is_set():
+                logger.debug("Generation cancelled")
+            elif not response_text.strip():
+                yield "I understand. Please continue."
+            elif cache_key is not None:
+                self.response_cache.put(cache_key, response_text.strip())
             
-            # Add response to conversation history
-            self.conversation_history.append(response_text)
+        except Exception as e:
+            failed = True
+            logger.error(f"Error generating response: {e}")
+            yield f"I apologize, but I encountered an error while processing your question. Please try rephrasing it."
+        
+        finally:
+            # Only a generated reply joins the history; failed and empty turns
+            # would leave a dangling "Assistant:" line in the next prompt
+            if not failed and response_text.strip():
+                self.history.add_user(prompt, user_ids)
+                self.history.add_assistant(response_text.strip(), response_ids, self.tokenizer)
+    
+    def _response_cache_key(self, prompt: str, max_new_tokens: int) -> Optional[str]:
+        """
+        Response cache key for a prompt, or None when the reply must not be cached
+        
+        Replies are only reused when generation is deterministic or when the
+        prompt opens a conversation.
+        """
+        if self.response_cache is None:
+            return None
+        params = sampling_params()
+        if params["do_sample"] and len(self.history):
+            return None
+        params.update({
+            "max_new_tokens": max_new_tokens,
+            "stop_sequences": MODEL_CONFIG["stop_sequences"],
+            "system_prompt": MODEL_CONFIG["system_prompt"],
+        })
+        return ResponseCache.make_key(
+            prompt, self.history.texts(), f"{self.model_name}:{self.dtype}", params
+        )
+    
+    def _generate_batched(self, input_ids: List[int], max_new_tokens: int,
+                          stopping: StoppingCriteria, prefix: PrefixState) -> Iterator[int]:
+        """Generate through the shared model's batching engine"""
+        def should_stop(token_ids: List[int]) -> bool:
+            text = self.tokenizer.decode(token_ids, skip_special_tokens=True).lstrip()
+            return stopping.check(text, token_ids) is not None
+        
+        if BATCHING_CONFIG["mode"] == "static":
+            scheduler = get_batch_scheduler(self.shared_model)
+            yield from scheduler.submit(input_ids, max_new_tokens, should_stop=should_stop).result()
+            return
+        
+        request = get_generation_engine(self.shared_model).submit(
+            input_ids, max_new_tokens, should_stop=should_stop, prefix=prefix
+        )
+        try:
+            yield from request.iter_tokens()
+        finally:
+            # Free the slot if the caller stops reading early
+            request.cancel()
+    
+    def _generate_in_pool(self, input_ids: List[int], max_new_tokens: int,
+                          prefix_text: str) -> Iterator[int]:
+        """Generate in the worker pool, streaming tokens back over the result queue"""
+        request = self.worker_pool.submit(input_ids, max_new_tokens, prefix_text=prefix_text)
+        try:
+            yield from request.iter_tokens(timeout=WORKER_POOL_CONFIG["token_timeout_seconds"] or None)
+        finally:
+            # Stop the worker once the caller stops reading
+            request.cancel()
+    
+    def generate_response(self, prompt: str, max_new_tokens: int = None) -> str:
+        """
+        Generate AI response using the language model
+        
+        Args:
+            prompt: User's question
+            max_new_tokens: Maximum number of tokens to generate
             
-            # Limit conversation history to prevent memory issues
-            if len(self.conversation_history) > 6:  # Keep 3 exchanges
-                self.conversation_history = self.conversation_history[-6:]
+        Returns:
+            Generated response
+        """
+        return "".join(self.stream_response(prompt, max_new_tokens)).strip()
+    
+    def admit(self, prompt: str, max_new_tokens: int = None) -> ContextManager[None]:
+        """
+        Pass a prompt through rate limiting and admission control
+        
+        Replies that will come from the response cache skip the queue for
+        inference slots, and short prompts are served ahead of long ones.
+        
+        Args:
+            prompt: User's question
+            max_new_tokens: Maximum number of tokens to generate
+            
+        Returns:
+            Context manager holding an inference slot while generating
+            
+        Raises:
+            AdmissionError: If the request is rate limited or the server is busy
+        """
+        if self.admission is None:
+            return contextlib.nullcontext()
+        
+        cache_key = self._response_cache_key(prompt, max_new_tokens or MODEL_CONFIG["max_new_tokens"])
+        cached = cache_key is not None and self.response_cache.contains(cache_key)
+        short = len(prompt) <= ADMISSION_CONFIG["short_prompt_chars"]
+        return self.admission.admit(
+            self.session_id,
+            priority=PRIORITY_SHORT if short else PRIORITY_NORMAL,
+            needs_slot=not cached,
+        )
+    
+    @staticmethod
+    def admission_error_response(error: AdmissionError) -> Dict[str, Any]:
+        """Query result for a request that was not admitted"""
+        return {
+            "error": str(error),
+            "type": "rate_limited" if isinstance(error, RateLimitExceeded) else "busy",
+            "retry_after": error.retry_after,
+        }
+    
+    def _generate_exclusive(self, prompt: str, max_new_tokens: Optional[int],
+                            cancel: threading.Event) -> str:
+        """Generate a response while holding this session's lock and an admission slot"""
+        with self.session_lock, self.admit(prompt, max_new_tokens):
+            if cancel.is_set():
+                return ""
+            return "".join(self.stream_response(prompt, max_new_tokens, cancel=cancel)).strip()
+    
+    async def agenerate_response(self, prompt: str, max_new_tokens: int = None,
+                                 timeout: Optional[float] = None) -> str:
+        """
+        Generate AI response without blocking the event loop
+        
+        Inference runs on the shared bounded executor. If the awaiting task is
+        cancelled (e.g. the client disconnected) or the timeout expires,
+        generation stops at the next token.
+        
+        Args:
+            prompt: User's question
+            max_new_tokens: Maximum number of tokens to generate
+            timeout: Seconds to wait (defaults to API_CONFIG["timeout"])
             
-            return response_text if response_text else "I understand. Please continue."
+        Returns:
+            Generated response
             
+        Raises:
+            asyncio.TimeoutError: If generation does not finish in time
+            AdmissionError: If the request is rate limited or the server is busy
+        """
+        cancel = threading.Event()
+        return await run_inference(
+            self._generate_exclusive, prompt, max_new_tokens, cancel,
+            timeout=timeout, cancel=cancel,
+        )
+    
+    async def aprocess_query(self, query: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Process a query using the AI model without blocking the event loop
+        
+        Args:
+            query: User's question
+            timeout: Seconds to wait (defaults to API_CONFIG["timeout"])
+            
+        Returns:
+            Dictionary containing the response
+        """
+        try:
+            response = await self.agenerate_response(query, timeout=timeout)
+            return {
+                "query": query,
+                "response": response,
+                "type": "ai_response"
+            }
+        except asyncio.TimeoutError:
+            logger.warning(f"Query timed out after {timeout or API_CONFIG['timeout']}s")
+            return {
+                "error": "The model took too long to respond. Please try again.",
+                "type": "error"
+            }
+        except asyncio.CancelledError:
+            raise
+        except AdmissionError as e:
+            return self.admission_error_response(e)
         except Exception as e:
-            logger.error(f"Error generating response: {e}")
-            return f"I apologize, but I encountered an error while processing your question. Please try rephrasing it."
+            logger.error(f"Error processing query: {e}")
+            return {
+                "error": f"Could not process query: {str(e)}",
+                "type": "error"
+            }
     
     def process_query(self, query: str) -> Dict[str, Any]:
         """
@@ -156,15 +462,19 @@ class VoxenModel:
             query: User's question
             
         Returns:
-            Dictionary containing the response
+            Dictionary containing the response ("type" is "rate_limited" or
+            "busy" with a "retry_after" hint when the request was not admitted)
         """
         try:
-            response = self.generate_response(query)
+            with self.admit(query):
+                response = self.generate_response(query)
             return {
                 "query": query,
                 "response": response,
                 "type": "ai_response"
             }
+        except AdmissionError as e:
+            return self.admission_error_response(e)
         except Exception as e:
             logger.error(f"Error processing query: {e}")
             return {
@@ -174,15 +484,44 @@ class VoxenModel:
     
     def clear_conversation(self):
         """Clear conversation history"""
-        self.conversation_history = []
+        self.history.clear()
+        self.kv_cache.reset()
+        self.draft_kv_cache.reset()
         logger.info("Conversation history cleared")
     
     def get_model_info(self) -> Dict[str, Any]:
         """Get information about the loaded model"""
-        return {
+        info = {
             "model_name": self.model_name,
             "is_loaded": self.is_loaded,
             "model_type": "Language Model",
-            "conversation_length": len(self.conversation_history),
-            "device": "cuda" if torch.cuda.is_available() else "cpu"
-        } 
\ No newline at end of file
+            "dtype": self.shared_model.dtype if self.shared_model else self.dtype,
+            "per_token_latency_ms": (
+                self.shared_model.token_latency * 1000
+                if self.shared_model and self.shared_model.token_latency is not None else None
+            ),
+            "conversation_length": len(self.history),
+            "kv_cache_tokens": len(self.kv_cache),
+            "response_cache": self.response_cache.get_stats() if self.response_cache else None,
+            "admission": self.admission.get_stats() if self.admission else None,
+            "device": self.shared_model.device if self.shared_model else ("cuda" if torch.cuda.is_available() else "cpu")
+        }
+        
+        if self.draft_model is not None:
+            proposed = self.speculative_stats["proposed"]
+            info["speculative_decoding"] = {
+                "draft_model": MODEL_CONFIG["draft_model"],
+                **self.speculative_stats,
+                "acceptance_rate": self.speculative_stats["accepted"] / proposed if proposed else None,
+            }
+        
+        # Shared batching metrics, when this session generates through them
+        if self.worker_pool is not None:
+            info["worker_pool"] = self.worker_pool.get_info()
+        elif self.shared_model and BATCHING_CONFIG["enabled"]:
+            shared_info = self.shared_model.get_info()
+            info["batching"] = shared_info.get(
+                "continuous_batching" if BATCHING_CONFIG["mode"] == "continuous" else "batching"
+            )
+        
+        return info 
\ No newline at end of file
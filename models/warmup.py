@@ -0,0 +1,155 @@
+"""
+Background model warm-up with readiness tracking
+
+Loads the shared model on a background thread at process start and runs a
+few dummy generations so allocator pools and kernel caches are populated
+before the first real request arrives.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+import logging
+from config.settings import MODEL_CONFIG, WARMUP_CONFIG, WORKER_POOL_CONFIG
+from models.model_registry import ModelRegistry, get_model_registry
+from models.generation import SessionCache, decode
+from models.worker_pool import get_worker_pool
+
+logger = logging.getLogger(__name__)
+
+IDLE = "idle"
+WARMING_UP = "warming_up"
+READY = "ready"
+FAILED = "failed"
+
+
+class ModelWarmup:
+    """
+    Warms up one shared model on a background thread
+    """
+
+    def __init__(self, model_name: str, dtype: Optional[str] = None,
+                 registry: Optional[ModelRegistry] = None):
+        """
+        Args:
+            model_name: Name of the pre-trained model
+            dtype: Weight dtype key (defaults to MODEL_CONFIG["dtype"])
+            registry: Model registry to load through (defaults to the process-wide one)
+        """
+        self.model_name = model_name
+        self.dtype = dtype or MODEL_CONFIG["dtype"]
+        self.registry = registry or get_model_registry()
+        self.state = IDLE
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ModelWarmup":
+        """Start warming up in the background (no-op if already started)"""
+        with self._lock:
+            if self._thread is None:
+                self.state = WARMING_UP
+                self._thread = threading.Thread(target=self._run, name="voxen-warmup", daemon=True)
+                self._thread.start()
+        return self
+
+    def retry(self) -> "ModelWarmup":
+        """Start over after a failed warm-up (no-op otherwise)"""
+        with self._lock:
+            if self.state == FAILED:
+                self.error = None
+                self._ready.clear()
+                self._thread = None
+        return self.start()
+
+    def _run(self):
+        """Load the model and run dummy generations"""
+        try:
+            started = time.perf_counter()
+            if WORKER_POOL_CONFIG["enabled"]:
+                # The weights live in the workers; wait until they have all loaded
+                get_worker_pool(self.model_name, self.dtype).wait_ready()
+                self.timings["load_seconds"] = time.perf_counter() - started
+                self.state = READY
+                logger.info(f"Worker pool for {self.model_name} ready in {self.timings['load_seconds']:.1f}s")
+                return
+
+            shared = self.registry.get(self.model_name, self.dtype)
+            self.timings["load_seconds"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            tokenizer = shared.tokenizer
+            for i in range(WARMUP_CONFIG["generations"]):
+                # Vary the prompt length so kernels for several shapes get exercised
+                prompt = "User: " + "Hello there. " * (1 + 4 * i) + "\nAssistant:"
+                input_ids = tokenizer.encode(prompt)
+                cache = SessionCache(max_tokens=len(input_ids) + WARMUP_CONFIG["max_new_tokens"])
+                for _ in decode(shared.model, input_ids, cache, WARMUP_CONFIG["max_new_tokens"],
+                                eos_token_id=tokenizer.eos_token_id, device=shared.device):
+                    pass
+            self.timings["warmup_seconds"] = time.perf_counter() - started
+
+            self.state = READY
+            logger.info(
+                f"Model {self.model_name} warmed up (load {self.timings['load_seconds']:.1f}s, "
+                f"warm-up {self.timings['warmup_seconds']:.1f}s)"
+            )
+        except Exception as e:
+            self.state = FAILED
+            self.error = str(e)
+            logger.error(f"Model warm-up failed: {e}")
+        finally:
+            self._ready.set()
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether the model is loaded and warmed up"""
+        return self.state == READY
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until warm-up finishes
+
+        Args:
+            timeout: Maximum number of seconds to wait
+
+        Returns:
+            True when the model is ready
+        """
+        self._ready.wait(timeout)
+        return self.is_ready
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get the readiness state of the model"""
+        return {
+            "model_name": self.model_name,
+            "dtype": self.dtype,
+            "state": self.state,
+            "error": self.error,
+            **self.timings,
+        }
+
+
+_warmups: Dict[Tuple[str, str], ModelWarmup] = {}
+_warmups_lock = threading.Lock()
+
+
+def start_warmup(model_name: Optional[str] = None, dtype: Optional[str] = None) -> ModelWarmup:
+    """
+    Start (or get the already running) process-wide warm-up for a model
+
+    Args:
+        model_name: Name of the pre-trained model (defaults to MODEL_CONFIG["voxen_model"])
+        dtype: Weight dtype key (defaults to MODEL_CONFIG["dtype"])
+
+    Returns:
+        The model's warm-up tracker
+    """
+    key = (model_name or MODEL_CONFIG["voxen_model"], dtype or MODEL_CONFIG["dtype"])
+    with _warmups_lock:
+        if key not in _warmups:
+            _warmups[key] = ModelWarmup(*key)
+        warmup = _warmups[key]
+    return warmup.start()
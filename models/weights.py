@@ -0,0 +1,167 @@
+"""
+Memory-mapped model weights
+
+Weights are written once in the safetensors layout under PATHS["models_dir"]
+and later mapped read-only. Tensors point straight into the mapping, so every
+process on the host that loads the same file shares one physical copy of the
+weights through the page cache, and loading costs little more than building
+the (empty) module tree.
+"""
+
+import json
+import mmap
+import os
+import struct
+import warnings
+from typing import Dict
+import torch
+import logging
+from transformers import AutoConfig, AutoModelForCausalLM
+from config.settings import PATHS
+
+logger = logging.getLogger(__name__)
+
+SAFETENSORS_DTYPES = {
+    torch.float32: "F32",
+    torch.float16: "F16",
+    torch.bfloat16: "BF16",
+    torch.int64: "I64",
+    torch.bool: "BOOL",
+    torch.uint8: "U8",
+}
+TORCH_FROM_SAFETENSORS = {name: dtype for dtype, name in SAFETENSORS_DTYPES.items()}
+
+# Mappings stay open for the lifetime of the process; tensors point into them
+_mappings: Dict[str, mmap.mmap] = {}
+
+
+def weights_path(model_name: str, dtype: torch.dtype) -> str:
+    """Location of the memory-mappable weights of a model in a dtype"""
+    name = model_name.replace("/", "--")
+    return os.path.join(PATHS["models_dir"], "weights", f"{name}-{SAFETENSORS_DTYPES[dtype]}.safetensors")
+
+
+def _module_tensors(model) -> Dict[str, torch.Tensor]:
+    """Every parameter and buffer (tied parameters once), including non-persistent buffers"""
+    tensors = {name: param.detach() for name, param in model.named_parameters()}
+    tensors.update({name: buffer for name, buffer in model.named_buffers()})
+    return tensors
+
+
+def save_weights(model, path: str):
+    """
+    Write a model's tensors in the safetensors layout
+
+    Args:
+        model: Loaded model
+        path: Destination file
+    """
+    # Widest dtypes first keeps every tensor aligned to its element size
+    tensors = dict(sorted(_module_tensors(model).items(), key=lambda item: -item[1].element_size()))
+    header, offset = {}, 0
+    for name, tensor in tensors.items():
+        size = tensor.numel() * tensor.element_size()
+        header[name] = {
+            "dtype": SAFETENSORS_DTYPES[tensor.dtype],
+            "shape": list(tensor.shape),
+            "data_offsets": [offset, offset + size],
+        }
+        offset += size
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    # Pad the header so the data section starts 8-byte aligned
+    header_bytes += b" " * (-(8 + len(header_bytes)) % 8)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for tensor in tensors.values():
+            f.write(tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy().tobytes())
+    os.replace(tmp_path, path)
+    logger.info(f"Saved memory-mappable weights to {path}")
+
+
+def map_weights(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Map a safetensors file read-only
+
+    Args:
+        path: Weights file
+
+    Returns:
+        Tensors by name, backed by the shared read-only mapping
+    """
+    mapping = _mappings.get(path)
+    if mapping is None:
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _mappings[path] = mapping
+
+    (header_size,) = struct.unpack("<Q", mapping[:8])
+    header = json.loads(mapping[8:8 + header_size])
+    data_start = 8 + header_size
+
+    tensors = {}
+    with warnings.catch_warnings():
+        # The mapping is read-only on purpose; inference never writes weights
+        warnings.filterwarnings("ignore", message="The given buffer is not writable")
+        for name, info in header.items():
+            if name == "__metadata__":
+                continue
+            dtype = TORCH_FROM_SAFETENSORS[info["dtype"]]
+            start, end = info["data_offsets"]
+            count = (end - start) // torch.empty((), dtype=dtype).element_size()
+            if count == 0:
+                tensors[name] = torch.empty(info["shape"], dtype=dtype)
+                continue
+            tensor = torch.frombuffer(mapping, dtype=dtype, count=count, offset=data_start + start)
+            tensors[name] = tensor.view(info["shape"])
+    return tensors
+
+
+def _assign(model, name: str, tensor: torch.Tensor):
+    """Point a parameter or buffer of ``model`` at ``tensor`` without copying"""
+    module_path, _, leaf = name.rpartition(".")
+    module = model.get_submodule(module_path) if module_path else model
+    if leaf in module._parameters:
+        module._parameters[leaf] = torch.nn.Parameter(tensor, requires_grad=False)
+    else:
+        module._buffers[leaf] = tensor
+
+
+def load_mapped_model(model_name: str, dtype: torch.dtype):
+    """
+    Load a causal LM whose weights are memory-mapped from PATHS["models_dir"]
+
+    The first call for a model and dtype converts the Hugging Face checkpoint
+    into the mappable file; every later call (in any process) maps it.
+
+    Args:
+        model_name: Name of the pre-trained model
+        dtype: Weight dtype
+
+    Returns:
+        Model in eval mode with read-only, shared weights
+    """
+    path = weights_path(model_name, dtype)
+    if not os.path.exists(path):
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=dtype, low_cpu_mem_usage=True)
+        save_weights(model, path)
+        del model
+
+    config = AutoConfig.from_pretrained(model_name)
+    # Build the module tree without allocating (or initializing) any weights
+    with torch.device("meta"):
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=dtype)
+
+    for name, tensor in map_weights(path).items():
+        _assign(model, name, tensor)
+    model.tie_weights()
+
+    missing = [name for name, tensor in _module_tensors(model).items() if tensor.is_meta]
+    if missing:
+        raise RuntimeError(f"Weights file {path} is missing tensors: {missing[:5]}")
+
+    logger.info(f"Mapped weights of {model_name} from {path}")
+    return model.eval()
@@ -0,0 +1,395 @@
+"""
+Multi-process inference worker pool
+
+Heavy generation runs in separate worker processes, each holding its own copy
+of the model and a fixed number of torch threads, so a slow generation never
+stalls the UI process. Clients submit tokenized prompts through a local
+multiprocessing queue and receive generated tokens as they are produced.
+"""
+
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+from config.settings import MODEL_CONFIG, WORKER_POOL_CONFIG
+from models.continuous_batching import StreamingRequest
+
+logger = logging.getLogger(__name__)
+
+# Messages sent from workers to the client: (kind, worker_id or request_id, payload)
+READY = "ready"
+LOAD_FAILED = "load_failed"
+STARTED = "started"
+TOKEN = "token"
+DONE = "done"
+ERROR = "error"
+
+# How often the dispatcher checks that every worker process is still alive
+_LIVENESS_POLL_SECONDS = 1.0
+
+
+def _drain_cancelled(control: "multiprocessing.Queue") -> List[int]:
+    """Take every request id the client has asked this worker to cancel"""
+    cancelled = []
+    while True:
+        try:
+            cancelled.append(control.get_nowait())
+        except queue.Empty:
+            return cancelled
+
+
+def _worker_main(worker_id: int, model_name: str, dtype: str, num_threads: int,
+                 requests: "multiprocessing.Queue", results: "multiprocessing.Queue",
+                 control: "multiprocessing.Queue"):
+    """Entry point of a worker process: load the model, then serve requests until told to stop"""
+    import torch
+    from models.generation import SessionCache, decode
+    from models.model_registry import get_model_registry
+    from models.stopping import StopSequences, StoppingCriteria
+
+    # One fixed thread budget per worker keeps the pool from oversubscribing cores
+    torch.set_num_threads(num_threads)
+
+    try:
+        shared = get_model_registry().get(model_name, dtype)
+        # The configured prefix; requests name the one the client built their prompt with
+        shared.get_prefix_state()
+    except Exception as e:
+        results.put((LOAD_FAILED, worker_id, f"Worker {worker_id} failed to load model: {e}"))
+        return
+    results.put((READY, worker_id, os.getpid()))
+
+    tokenizer = shared.tokenizer
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+
+        request_id, input_ids, max_new_tokens, params, stop_sequences, prefix_text = message
+        # Cancels are only sent after STARTED, so anything queued now is for an earlier request
+        _drain_cancelled(control)
+        results.put((STARTED, request_id, worker_id))
+        stopping = StoppingCriteria([StopSequences(stop_sequences)])
+        generated: List[int] = []
+        try:
+            # Cached on the shared model; recomputed only when the client's system prompt changes
+            prefix = shared.get_prefix_state(prefix_text)
+            cache = SessionCache(max_tokens=len(input_ids) + max_new_tokens)
+            for token_id in decode(shared.model, input_ids, cache, max_new_tokens,
+                                   eos_token_id=tokenizer.eos_token_id, device=shared.device,
+                                   params=params, prefix=prefix):
+                generated.append(token_id)
+                results.put((TOKEN, request_id, token_id))
+                if request_id in _drain_cancelled(control):
+                    break
+                text = tokenizer.decode(generated, skip_special_tokens=True).lstrip()
+                if stopping.check(text, generated) is not None:
+                    break
+            results.put((DONE, request_id, None))
+        except Exception as e:
+            results.put((ERROR, request_id, str(e)))
+
+
+class PooledRequest(StreamingRequest):
+    """
+    A request served by a worker process; cancelling it stops the worker's generation
+    """
+
+    def __init__(self, pool: "InferenceWorkerPool", request_id: int, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.request_id = request_id
+        self.worker_id: Optional[int] = None
+        self._pool = pool
+
+    def cancel(self):
+        """Stop buffering tokens and tell the worker serving the request to stop"""
+        super().cancel()
+        self._pool._cancel(self)
+
+
+class InferenceWorkerPool:
+    """
+    Pool of inference worker processes fed through a local queue
+    """
+
+    def __init__(self, model_name: str, dtype: Optional[str] = None,
+                 num_workers: int = None, threads_per_worker: int = None):
+        """
+        Args:
+            model_name: Name of the pre-trained model
+            dtype: Weight dtype key (defaults to MODEL_CONFIG["dtype"])
+            num_workers: Number of worker processes (0 or None uses every core)
+            threads_per_worker: torch.set_num_threads value inside each worker
+        """
+        from transformers import AutoConfig, AutoTokenizer
+        from models.model_registry import system_prompt_prefix
+
+        self.model_name = model_name
+        self.dtype = dtype or MODEL_CONFIG["dtype"]
+        self.threads_per_worker = threads_per_worker or WORKER_POOL_CONFIG["threads_per_worker"]
+        self.num_workers = (
+            num_workers or WORKER_POOL_CONFIG["num_workers"]
+            or max(1, (os.cpu_count() or 1) // self.threads_per_worker)
+        )
+
+        # The client only needs the tokenizer and config, never the weights
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        config = AutoConfig.from_pretrained(model_name)
+        self.context_window = getattr(config, "n_positions", None) or config.max_position_embeddings
+        self.prefix_text = system_prompt_prefix()
+        self.prefix_ids = self.tokenizer.encode(self.prefix_text)
+        self._prefix_lock = threading.Lock()
+
+        context = multiprocessing.get_context(WORKER_POOL_CONFIG["start_method"])
+        self._requests = context.Queue()
+        self._results = context.Queue()
+        self._controls = [context.Queue() for _ in range(self.num_workers)]
+        self._pending: Dict[int, PooledRequest] = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._ready_workers = 0
+        self._ready = threading.Event()
+        self._failed: Optional[str] = None
+        self._failed_at = 0.0
+        self._closing = False
+        self._stats = {"submitted": 0, "completed": 0, "errors": 0}
+
+        self._processes = [
+            context.Process(
+                target=_worker_main,
+                args=(i, model_name, self.dtype, self.threads_per_worker,
+                      self._requests, self._results, self._controls[i]),
+                name=f"voxen-worker-{i}",
+                daemon=True,
+            )
+            for i in range(self.num_workers)
+        ]
+        for process in self._processes:
+            process.start()
+
+        self._dispatcher = threading.Thread(target=self._dispatch, name="voxen-pool-dispatcher", daemon=True)
+        self._dispatcher.start()
+        logger.info(
+            f"Started {self.num_workers} inference workers for {model_name} "
+            f"({self.threads_per_worker} threads each)"
+        )
+
+    def _dispatch(self):
+        """Route worker messages to the requests waiting for them"""
+        last_check = time.monotonic()
+        while True:
+            try:
+                message = self._results.get(timeout=_LIVENESS_POLL_SECONDS)
+            except queue.Empty:
+                message = ()
+            # Check even under steady traffic, where the queue is never empty
+            if time.monotonic() - last_check >= _LIVENESS_POLL_SECONDS:
+                self._check_workers()
+                last_check = time.monotonic()
+            if message == ():
+                continue
+            if message is None:
+                break
+            kind, key, payload = message
+
+            if kind == READY:
+                self._ready_workers += 1
+                if self._ready_workers == self.num_workers:
+                    self._ready.set()
+                continue
+            if kind == LOAD_FAILED:
+                self._fail(payload)
+                continue
+
+            with self._pending_lock:
+                request = self._pending.get(key)
+                if kind in (DONE, ERROR) and request is not None:
+                    del self._pending[key]
+            if request is None:
+                continue
+
+            if kind == STARTED:
+                request.worker_id = payload
+                if request.cancelled:
+                    # Cancelled while still queued; stop the worker as soon as it begins
+                    self._cancel(request)
+            elif kind == TOKEN:
+                if not request.cancelled:
+                    request.emit(payload)
+            elif kind == DONE:
+                request.finish()
+                with self._pending_lock:
+                    self._stats["completed"] += 1
+            else:
+                request.finish(RuntimeError(payload))
+                with self._pending_lock:
+                    self._stats["errors"] += 1
+
+    def _check_workers(self):
+        """Fail the pool if a worker process has exited on its own"""
+        if self._closing or self._failed:
+            return
+        for process in self._processes:
+            if not process.is_alive():
+                self._fail(f"Worker {process.name} exited unexpectedly (exit code {process.exitcode})")
+                return
+
+    def _fail(self, reason: str):
+        """Mark the pool as failed and fail every request waiting on it"""
+        logger.error(reason)
+        with self._pending_lock:
+            if self._failed is None:
+                self._failed = reason
+                self._failed_at = time.monotonic()
+            pending, self._pending = list(self._pending.values()), {}
+            self._stats["errors"] += len(pending)
+        self._ready.set()
+        for request in pending:
+            request.finish(RuntimeError(self._failed))
+
+    def _cancel(self, request: PooledRequest):
+        """Ask the worker serving a request to stop generating for it"""
+        if request.worker_id is not None and not request.future.done():
+            self._controls[request.worker_id].put(request.request_id)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until every worker has loaded the model
+
+        Returns:
+            True when the pool is ready to serve
+        """
+        self._ready.wait(timeout)
+        if self._failed:
+            raise RuntimeError(self._failed)
+        return self._ready_workers == self.num_workers
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether every worker has loaded the model"""
+        return self._ready_workers == self.num_workers
+
+    @property
+    def failed(self) -> Optional[str]:
+        """Why the pool stopped serving, or None while it is healthy"""
+        return self._failed
+
+    @property
+    def failed_for(self) -> float:
+        """Seconds since the pool failed (0 while it is healthy)"""
+        return time.monotonic() - self._failed_at if self._failed else 0.0
+
+    def current_prefix(self) -> Tuple[str, List[int]]:
+        """
+        Text and token ids of the system prompt prefix prompts start with
+
+        Re-tokenized when the configured system prompt changes; workers
+        receive the text with every request, so they follow the change too.
+        """
+        from models.model_registry import system_prompt_prefix
+
+        text = system_prompt_prefix()
+        with self._prefix_lock:
+            if text != self.prefix_text:
+                logger.info("System prompt changed; updating the worker pool prefix")
+                self.prefix_text, self.prefix_ids = text, self.tokenizer.encode(text)
+            return self.prefix_text, self.prefix_ids
+
+    def submit(self, input_ids: List[int], max_new_tokens: int,
+               params: Optional[Dict[str, Any]] = None,
+               stop_sequences: Optional[List[str]] = None,
+               prefix_text: Optional[str] = None) -> StreamingRequest:
+        """
+        Queue a tokenized prompt for the next free worker
+
+        Args:
+            input_ids: Token ids of the full prompt
+            max_new_tokens: Maximum number of tokens to generate
+            params: Sampling parameters (defaults to MODEL_CONFIG)
+            stop_sequences: Strings that end generation (defaults to MODEL_CONFIG)
+            prefix_text: System prompt prefix the prompt starts with (defaults to current_prefix())
+
+        Returns:
+            The request; iterate ``iter_tokens()`` or wait on ``future``
+
+        Raises:
+            RuntimeError: If a worker failed to load or has died
+        """
+        from models.generation import sampling_params
+
+        params = params or sampling_params()
+        request_id = next(self._ids)
+        request = PooledRequest(self, request_id, input_ids, max_new_tokens, params)
+        with self._pending_lock:
+            # Checked under the lock so a concurrent _fail() cannot miss this request
+            if self._failed:
+                raise RuntimeError(self._failed)
+            self._pending[request_id] = request
+            self._stats["submitted"] += 1
+        self._requests.put((
+            request_id, input_ids, max_new_tokens, params,
+            stop_sequences if stop_sequences is not None else MODEL_CONFIG["stop_sequences"],
+            prefix_text if prefix_text is not None else self.current_prefix()[0],
+        ))
+        return request
+
+    def get_info(self) -> Dict[str, Any]:
+        """Get worker and queue statistics"""
+        with self._pending_lock:
+            in_flight = len(self._pending)
+            stats = dict(self._stats)
+        return {
+            "model_name": self.model_name,
+            "dtype": self.dtype,
+            "num_workers": self.num_workers,
+            "threads_per_worker": self.threads_per_worker,
+            "ready_workers": self._ready_workers,
+            "alive_workers": sum(process.is_alive() for process in self._processes),
+            "failed": self._failed,
+            "in_flight": in_flight,
+            **stats,
+        }
+
+    def shutdown(self, timeout: float = 5.0):
+        """Stop every worker process"""
+        self._closing = True
+        for _ in self._processes:
+            self._requests.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._results.put(None)
+        with self._pending_lock:
+            pending, self._pending = list(self._pending.values()), {}
+        for request in pending:
+            request.finish(RuntimeError("Worker pool has been shut down"))
+        logger.info("Inference worker pool shut down")
+
+
+_pools: Dict[Tuple[str, str], InferenceWorkerPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_worker_pool(model_name: str, dtype: Optional[str] = None) -> InferenceWorkerPool:
+    """
+    Get the process-wide worker pool for a model, starting it on first use
+
+    A pool that has failed (a worker could not load the model or died) is
+    replaced by a fresh one once WORKER_POOL_CONFIG["restart_backoff_seconds"]
+    have passed; until then the failed pool is returned and rejects requests.
+    """
+    key = (model_name, dtype or MODEL_CONFIG["dtype"])
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is not None and pool.failed and pool.failed_for >= WORKER_POOL_CONFIG["restart_backoff_seconds"]:
+            logger.warning(f"Restarting failed worker pool for {model_name}: {pool.failed}")
+            pool.shutdown()
+            pool = None
+        if pool is None:
+            pool = _pools[key] = InferenceWorkerPool(*key)
+        return pool
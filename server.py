@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Voxen2.0 AI Assistant - Headless HTTP server
+
+Serves the assistant over JSON and server-sent events without Streamlit:
+
+    GET    /health              Readiness of the model (503 while warming up)
+    POST   /query               {"query": ...} -> one-off answer without history
+    POST   /chat                {"message": ..., "session_id": ..., "stream": false}
+    DELETE /chat/<session_id>   Forget a chat session
+
+Chat sessions keep their conversation (and KV cache) between requests, while
+the weights are shared by every session through the model registry. Requests
+pass through the model's rate limiting and admission control: they get a 429
+when over the rate limit and a 503 when the server is too busy to queue them.
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config.settings import MODEL_CONFIG, SERVER_CONFIG, WARMUP_CONFIG
+from models.admission import AdmissionError
+from models.voxen_model import VoxenModel
+from models.warmup import start_warmup
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """
+    Chat sessions by id, evicting idle and least recently used ones
+    """
+
+    def __init__(self, max_sessions: int, ttl_seconds: float):
+        """
+        Args:
+            max_sessions: Maximum number of sessions kept
+            ttl_seconds: Idle time after which a session is dropped
+        """
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, Tuple[VoxenModel, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: Optional[str]) -> Tuple[str, VoxenModel]:
+        """Get a session, creating it when the id is unknown or missing"""
+        now = time.monotonic()
+        with self._lock:
+            for stale_id in [sid for sid, (_, used) in self._sessions.items() if now - used > self.ttl_seconds]:
+                del self._sessions[stale_id]
+
+            if session_id in self._sessions:
+                model = self._sessions[session_id][0]
+            else:
+                session_id = session_id or uuid.uuid4().hex
+                model = VoxenModel(MODEL_CONFIG["voxen_model"])
+            self._sessions[session_id] = (model, now)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session_id, model
+
+    def delete(self, session_id: str) -> bool:
+        """Forget a session"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class VoxenRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler for the assistant API
+    """
+
+    server_version = "Voxen2.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args):
+        logger.info(f"{self.client_address[0]} - {format % args}")
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Optional[Dict[str, Any]]:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            self._send_json(400, {"error": "Request body must be a JSON object"})
+            return None
+        return payload
+
+    def _send_result(self, result: Dict[str, Any]):
+        """Send a process_query result with the matching status code"""
+        status = {"rate_limited": 429, "busy": 503, "error": 500}.get(result.get("type"), 200)
+        headers = {"Retry-After": str(int(result["retry_after"]) + 1)} if "retry_after" in result else None
+        self._send_json(status, result, headers=headers)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "Not found"})
+            return
+        warmup = self.server.warmup
+        status = warmup.get_status() if warmup else {"state": "ready"}
+        ready = warmup is None or warmup.is_ready
+        self._send_json(200 if ready else 503, {
+            "status": "ok" if ready else "unavailable",
+            "model": status,
+            "sessions": len(self.server.sessions),
+        })
+
+    def do_POST(self):
+        if self.path not in ("/query", "/chat"):
+            self._send_json(404, {"error": "Not found"})
+            return
+        payload = self._read_json()
+        if payload is None:
+            return
+
+        if self.path == "/query":
+            query = payload.get("query")
+            if not isinstance(query, str) or not query.strip():
+                self._send_json(400, {"error": "'query' must be a non-empty string"})
+                return
+            # One-off queries are rate limited per client address
+            model = VoxenModel(MODEL_CONFIG["voxen_model"], session_id=self.client_address[0])
+            self._send_result(model.process_query(query))
+            return
+
+        message = payload.get("message")
+        if not isinstance(message, str) or not message.strip():
+            self._send_json(400, {"error": "'message' must be a non-empty string"})
+            return
+        session_id, model = self.server.sessions.get(payload.get("session_id"))
+
+        if payload.get("stream"):
+            self._stream_chat(session_id, model, message)
+            return
+
+        with model.session_lock:
+            result = model.process_query(message)
+        result["session_id"] = session_id
+        self._send_result(result)
+
+    def _stream_chat(self, session_id: str, model: VoxenModel, message: str):
+        """Stream a chat reply as server-sent events"""
+        with model.session_lock, contextlib.ExitStack() as stack:
+            try:
+                stack.enter_context(model.admit(message))
+            except AdmissionError as e:
+                self._send_result(model.admission_error_response(e))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            cancel = threading.Event()
+            pieces = model.stream_response(message, cancel=cancel)
+            try:
+                self._send_event("session", {"session_id": session_id})
+                for piece in pieces:
+                    self._send_event("message", {"delta": piece})
+                self._send_event("done", {"session_id": session_id})
+            except (BrokenPipeError, ConnectionResetError):
+                # The client went away; stop generating at the next token
+                cancel.set()
+                logger.info(f"Client disconnected from session {session_id}")
+            finally:
+                pieces.close()
+
+    def _send_event(self, event: str, data: Dict[str, Any]):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def do_DELETE(self):
+        prefix = "/chat/"
+        if not self.path.startswith(prefix):
+            self._send_json(404, {"error": "Not found"})
+            return
+        if self.server.sessions.delete(self.path[len(prefix):]):
+            self._send_json(200, {"deleted": True})
+        else:
+            self._send_json(404, {"error": "Unknown session"})
+
+
+def create_server(host: str = None, port: int = None) -> ThreadingHTTPServer:
+    """
+    Create the HTTP server and start warming up the model
+
+    Args:
+        host: Interface to bind (defaults to SERVER_CONFIG["host"])
+        port: Port to bind (defaults to SERVER_CONFIG["port"])
+
+    Returns:
+        The server, ready for serve_forever()
+    """
+    server = ThreadingHTTPServer(
+        (host or SERVER_CONFIG["host"], port or SERVER_CONFIG["port"]), VoxenRequestHandler
+    )
+    server.daemon_threads = True
+    server.sessions = SessionStore(SERVER_CONFIG["max_sessions"], SERVER_CONFIG["session_ttl_seconds"])
+    server.warmup = start_warmup() if WARMUP_CONFIG["enabled"] else None
+    return server
+
+
+def main():
+    """Run the HTTP server"""
+    parser = argparse.ArgumentParser(description="Voxen2.0 headless HTTP server")
+    parser.add_argument("--host", default=SERVER_CONFIG["host"])
+    parser.add_argument("--port", type=int, default=SERVER_CONFIG["port"])
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port)
+    print(f"🌐 Serving Voxen2.0 API at http://{args.host}:{args.port}")
+    print("⏹️  Press Ctrl+C to stop the server")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped by user")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
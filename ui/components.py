@@ -6,6 +6,7 @@ import streamlit as st
 from typing import Dict, List, Any, Optional
 import logging
 from config.settings import VOXEN_CONFIG
+from models.warmup import FAILED
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +35,9 @@ class VoxenUI:
             # Model info
             st.subheader("🤖 Model Info")
             st.info("Using DialoGPT for AI responses")
+            warmup = st.session_state.get("warmup")
+            if warmup is not None and not warmup.is_ready:
+                st.caption(f"Model status: {warmup.state.replace('_', ' ')}")
             
             # Quick stats
             st.subheader("📈 Quick Stats")
@@ -68,35 +72,56 @@ class VoxenUI:
         if "messages" not in st.session_state:
             st.session_state.messages = []
         
+        # Report warm-up instead of blocking requests on model loading
+        warmup = st.session_state.get("warmup")
+        model_ready = warmup is None or warmup.is_ready
+        load_failed = warmup is not None and warmup.state == FAILED
+        if load_failed:
+            # Keep generation off until the model loads; every query would hit the broken load
+            st.error(f"Voxen2.0 failed to load: {warmup.error}")
+            if st.button("🔄 Retry loading", key="retry_warmup"):
+                warmup.retry()
+                st.rerun()
+        elif not model_ready:
+            st.info("⏳ Voxen2.0 is warming up. Replies will be available in a moment.")
+        
         # Display chat messages
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
         
         # Chat input
-        if prompt := st.chat_input("Ask me anything...", key="main_chat_input"):
+        if prompt := st.chat_input("Ask me anything...", key="main_chat_input", disabled=load_failed):
             # Add user message to chat history
             st.session_state.messages.append({"role": "user", "content": prompt})
             with st.chat_message("user"):
                 st.markdown(prompt)
             
-            # Generate AI response using the actual models
+            # Stream the AI response as it is generated
             with st.chat_message("assistant"):
-                with st.spinner("Voxen2.0 is thinking..."):
-                    try:
-                        # Use the Voxen model for responses
-                        if st.session_state.voxen_model:
-                            ai_response = st.session_state.voxen_model.generate_response(prompt)
-                        else:
-                            ai_response = "I apologize, but the AI model is not available at the moment."
-                        
-                        # Add AI response to chat history
-                        st.session_state.messages.append({"role": "assistant", "content": ai_response})
-                        
-                        # Display response
-                        st.markdown(ai_response)
-                        
-                    except Exception as e:
-                        error_msg = f"I apologize, but I encountered an error: {str(e)}"
-                        st.session_state.messages.append({"role": "assistant", "content": error_msg})
-                        st.error(error_msg) 
\ No newline at end of file
+                placeholder = st.empty()
+                placeholder.markdown("▌")
+                ai_response = ""
+                try:
+                    # Use the Voxen model for responses
+                    if not model_ready:
+                        ai_response = "I'm still warming up. Please send your message again in a moment."
+                    elif st.session_state.voxen_model:
+                        for piece in st.session_state.voxen_model.stream_response(prompt):
+                            ai_response += piece
+                            placeholder.markdown(ai_response + "▌")
+                    else:
+                        ai_response = "I apologize, but the AI model is not available at the moment."
+                    
+                    ai_response = ai_response.strip()
+                    
+                    # Add AI response to chat history
+                    st.session_state.messages.append({"role": "assistant", "content": ai_response})
+                    
+                    # Display response
+                    placeholder.markdown(ai_response)
+                    
+                except Exception as e:
+                    error_msg = f"I apologize, but I encountered an error: {str(e)}"
+                    st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                    placeholder.error(error_msg) 
\ No newline at end of file